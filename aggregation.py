@@ -0,0 +1,120 @@
+import numpy as np
+import pandas as pd
+
+# How every variable is reduced when the hourly data is aggregated to a coarser period
+AGG_SPEC = {
+    'PM2.5': 'mean',
+    'PM10': 'mean',
+    'SO2': 'mean',
+    'NO2': 'mean',
+    'CO': 'mean',
+    'O3': 'mean',
+    'TEMP': 'mean',
+    'PRES': 'mean',
+    'DEWP': 'mean',
+    'RAIN': 'sum',
+    'WSPM': 'mean',
+    'wd': 'mode',
+}
+
+
+def category_counts(codes, group_ids, n_groups, n_categories):
+    '''
+    A function to count the category codes of every group with one bincount over (group, category) pairs.
+
+    Args:
+        codes (np.ndarray): The category code of every row, -1 for missing values.
+        group_ids (np.ndarray): The group number of every row, from 0 to n_groups - 1.
+        n_groups (int): The number of groups.
+        n_categories (int): The number of categories.
+
+    Returns:
+        np.ndarray: The counts, one row per group and one column per category.
+    '''
+    valid = (codes >= 0) & (group_ids >= 0)
+    pairs = group_ids[valid].astype(np.int64) * n_categories + codes[valid]
+    counts = np.bincount(pairs, minlength=n_groups * n_categories)
+    return counts.reshape(n_groups, n_categories)
+
+
+def mode_of_counts(counts):
+    '''
+    A function to pick the most frequent category code from a table of counts.
+    Ties are broken by the lowest code (for the wind direction: the first sector clockwise from north).
+
+    Args:
+        counts (np.ndarray): The counts, one row per group and one column per category.
+
+    Returns:
+        np.ndarray: The mode code of every group, -1 when a group has no values.
+    '''
+    modes = counts.argmax(axis=1)
+    modes[counts.max(axis=1) == 0] = -1
+    return modes
+
+
+def mode_codes(codes, group_ids, n_groups, n_categories):
+    '''
+    A function to compute the most frequent category code of every group.
+
+    Args:
+        codes (np.ndarray): The category code of every row, -1 for missing values.
+        group_ids (np.ndarray): The group number of every row, from 0 to n_groups - 1.
+        n_groups (int): The number of groups.
+        n_categories (int): The number of categories.
+
+    Returns:
+        np.ndarray: The mode code of every group, -1 when a group has no values.
+    '''
+    return mode_of_counts(category_counts(codes, group_ids, n_groups, n_categories))
+
+
+def mode(values, group_ids, n_groups):
+    '''
+    A function to compute the mode of a variable for every group.
+
+    Args:
+        values (pd.Series): The values, categorical or not.
+        group_ids (np.ndarray): The group number of every row, from 0 to n_groups - 1.
+        n_groups (int): The number of groups.
+
+    Returns:
+        pd.Categorical: The mode of every group, missing when a group has no values.
+    '''
+    if not isinstance(values.dtype, pd.CategoricalDtype):
+        values = values.astype('category')
+    dtype = values.dtype
+    modes = mode_codes(values.cat.codes.to_numpy(), np.asarray(group_ids), n_groups, len(dtype.categories))
+    return pd.Categorical.from_codes(modes, dtype=dtype)
+
+
+def aggregate(data, keys, spec=AGG_SPEC):
+    '''
+    A function to aggregate the data by groups.
+    Builtin reductions ('mean', 'sum', ...) run through groupby.agg and 'mode' runs through
+    the vectorized mode, so no reduction falls back to a Python callable per group.
+
+    Args:
+        data (pd.DataFrame): The DataFrame.
+        keys (list): The group keys (column names or arrays), as accepted by groupby.
+        spec (dict): The reduction of every variable, like the argument of groupby.agg.
+
+    Returns:
+        pd.DataFrame: One row per group with the keys as columns.
+    '''
+    grouped = data.groupby(keys, observed=True)
+    builtin = {variable: func for variable, func in spec.items() if func != 'mode'}
+    if builtin:
+        result = grouped.agg(builtin)
+    else:
+        result = pd.DataFrame(index=grouped.size().index)
+
+    modes = [variable for variable, func in spec.items() if func == 'mode']
+    if modes:
+        group_ids = grouped.ngroup().to_numpy()
+        for variable in modes:
+            result[variable] = mode(data[variable], group_ids, len(result))
+
+    result = result[list(spec)]
+    result.reset_index(inplace=True)
+    return result
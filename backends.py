@@ -0,0 +1,331 @@
+'''
+Query backends of the partial aggregates.
+
+Every backend computes the same mergeable partial aggregates as rollups.partials from
+an Arrow table of hourly rows (the store segments or a converted DataFrame), so the rest
+of the pipeline (rollup_partials, finalize_levels, impute_from_stats) is shared:
+
+    ========  ============================================================
+    backend   engine
+    ========  ============================================================
+    pandas    rollups.partials, single-threaded groupby
+    arrow     pyarrow Table.group_by, multi-threaded
+    duckdb    SQL GROUP BY on the Arrow table, multi-threaded (optional)
+    ========  ============================================================
+
+The key 'date' groups by the day of the date_h column. Category histograms of the 'mode'
+variables are computed as sums of one indicator per category in the same pass.
+
+Usage:
+    backend = get_backend('arrow')
+    levels = rollup_levels(backend, store_table(meta))
+
+The store is built with a backend with python store.py build --backend arrow, see
+frame_imputation_stats and frame_daily_partials.
+'''
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from aggregation import AGG_SPEC
+from cache import read_table
+from imputation import imputation_stats as pandas_imputation_stats
+from rollups import (daily_partials, finalize_levels, first_hydrological_year, partial_columns, partials,
+                     rollup_partials, LEVEL_KEYS)
+from schema import HOURLY_INDEX
+
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+
+
+def arrow_table(data):
+    ''' The Arrow table of hourly data in the compact schema, with the hourly datetime as a date_h column. '''
+    return pa.Table.from_pandas(data, preserve_index=True)
+
+
+def store_table(meta, store_dir=None):
+    '''
+    A function to read the hourly segments of the store as one Arrow table without converting them to pandas.
+
+    Args:
+        meta (dict): The metadata of the store.
+        store_dir (str): The directory of the store, None for store.STORE_DIR.
+
+    Returns:
+        pa.Table: The hourly rows of every segment.
+    '''
+    if store_dir is None:
+        from store import STORE_DIR
+        store_dir = STORE_DIR
+    segments = [read_table(f'hourly{i}', meta['source_key'], store_dir) for i in range(meta['segments'])]
+    return pa.concat_tables(segments).unify_dictionaries()
+
+
+def _codes(column):
+    ''' The dictionary indices of a dictionary column, and its dictionary. '''
+    column = column.unify_dictionaries() if hasattr(column, 'unify_dictionaries') else column
+    chunks = column.chunks
+    dictionary = chunks[0].dictionary if chunks else pa.array([], pa.string())
+    return pa.chunked_array([chunk.indices for chunk in chunks], type=column.type.index_type), dictionary
+
+
+def _prepare(table, keys, spec):
+    '''
+    A function to build the table scanned by the Arrow and DuckDB backends.
+    Dictionary keys are replaced by their indices, 'date' is the day of date_h, the
+    'mean' and 'sum' variables are cast to float64 and every category of a 'mode'
+    variable gets an int32 indicator column named like its partial column.
+
+    Returns:
+        tuple: The prepared table and the dictionary of every dictionary key.
+    '''
+    table = table.unify_dictionaries()
+    columns = {}
+    dictionaries = {}
+    for key in keys:
+        if key == 'date':
+            columns['date'] = pc.floor_temporal(table[HOURLY_INDEX], unit='day')
+        elif pa.types.is_dictionary(table.schema.field(key).type):
+            columns[key], dictionaries[key] = _codes(table[key])
+        else:
+            columns[key] = table[key]
+    for variable, func in spec.items():
+        if func == 'mode':
+            codes, dictionary = _codes(table[variable])
+            for code, category in enumerate(dictionary.to_pylist()):
+                columns[f'{variable}_{category}'] = pc.cast(pc.fill_null(pc.equal(codes, code), False), pa.int32())
+        else:
+            columns[variable] = pc.cast(table[variable], pa.float64())
+    return pa.table(columns), dictionaries
+
+
+def _finish(result, keys, spec, dictionaries, categories):
+    '''
+    A function to turn the aggregated table of the Arrow and DuckDB backends into the partials of rollups.partials.
+
+    Args:
+        result (pa.Table): One row per group with the keys, <variable>_sum, <variable>_count and indicator sums.
+        keys (list): The group keys.
+        spec (dict): The reduction of every variable.
+        dictionaries (dict): The dictionary of every dictionary key.
+        categories (dict): The categorical dtype of every 'mode' variable.
+
+    Returns:
+        pd.DataFrame: The partial aggregates sorted by the keys.
+    '''
+    result = result.sort_by([(key, 'ascending') for key in keys])
+    frame = {}
+    for key in keys:
+        values = result[key].to_numpy()
+        if key in dictionaries:
+            frame[key] = pd.Categorical.from_codes(values, categories=dictionaries[key].to_pylist())
+        else:
+            frame[key] = values
+    for variable, func in spec.items():
+        if func == 'mode':
+            for name in partial_columns(variable, func, categories[variable]):
+                frame[name] = pc.fill_null(result[name], 0).to_numpy().astype('int32')
+        else:
+            frame[f'{variable}_sum'] = pc.fill_null(result[f'{variable}_sum'], 0.0).to_numpy().astype('float64')
+            frame[f'{variable}_count'] = result[f'{variable}_count'].to_numpy().astype('int32')
+    return pd.DataFrame(frame)
+
+
+def _mode_categories(table, spec):
+    ''' The categorical dtype of every 'mode' variable of spec, from the dictionary of its column. '''
+    return {variable: pd.CategoricalDtype(_codes(table[variable])[1].to_pylist())
+            for variable, func in spec.items() if func == 'mode'}
+
+
+class PandasBackend:
+    ''' The partial aggregates computed by pandas groupby (rollups.partials). '''
+    name = 'pandas'
+
+    def partials(self, table, keys, spec=AGG_SPEC):
+        '''
+        A function to compute the partial aggregates of an Arrow table of hourly rows by groups.
+
+        Args:
+            table (pa.Table): The hourly rows with a date_h column.
+            keys (list): The group columns, 'date' for the day of date_h.
+            spec (dict): The reduction of every variable ('mean', 'sum' or 'mode').
+
+        Returns:
+            pd.DataFrame: One row per group with the keys as columns and the partial columns.
+        '''
+        data = table.to_pandas()
+        if HOURLY_INDEX in data.columns:
+            data = data.set_index(HOURLY_INDEX)
+        keys = [data.index.normalize().rename('date') if key == 'date' else key for key in keys]
+        return partials(data, keys, spec)
+
+
+class ArrowBackend:
+    ''' The partial aggregates computed by the multi-threaded hash aggregation of Arrow. '''
+    name = 'arrow'
+
+    def partials(self, table, keys, spec=AGG_SPEC):
+        ''' See PandasBackend.partials. '''
+        work, dictionaries = _prepare(table, keys, spec)
+        categories = _mode_categories(table, spec)
+        aggregations = []
+        indicators = []
+        for variable, func in spec.items():
+            if func == 'mode':
+                indicators += partial_columns(variable, func, categories[variable])
+            else:
+                aggregations += [(variable, 'sum'), (variable, 'count')]
+        aggregations += [(name, 'sum') for name in indicators]
+        result = work.group_by(keys).aggregate(aggregations)
+        # Arrow names the indicator sums <name>_sum
+        renames = {f'{name}_sum': name for name in indicators}
+        result = result.rename_columns([renames.get(name, name) for name in result.column_names])
+        return _finish(result, keys, spec, dictionaries, categories)
+
+
+class DuckDBBackend:
+    ''' The partial aggregates computed by a SQL GROUP BY in DuckDB, over the Arrow table without copying it. '''
+    name = 'duckdb'
+
+    def __init__(self):
+        if duckdb is None:
+            raise ImportError('the duckdb backend needs the duckdb package (pip install -r requirements-optional.txt)')
+
+    def partials(self, table, keys, spec=AGG_SPEC):
+        ''' See PandasBackend.partials. '''
+        work, dictionaries = _prepare(table, keys, spec)
+        categories = _mode_categories(table, spec)
+        selects = [f'"{key}"' for key in keys]
+        for variable, func in spec.items():
+            if func == 'mode':
+                selects += [f'SUM("{name}") AS "{name}"' for name in partial_columns(variable, func, categories[variable])]
+            else:
+                selects += [f'SUM("{variable}") AS "{variable}_sum"', f'COUNT("{variable}") AS "{variable}_count"']
+        group = ', '.join(f'"{key}"' for key in keys)
+        connection = duckdb.connect()
+        try:
+            connection.register('hourly', work)
+            result = connection.execute(f'SELECT {", ".join(selects)} FROM hourly GROUP BY {group}').arrow()
+            # Recent duckdb versions return a RecordBatchReader instead of a Table
+            if isinstance(result, pa.RecordBatchReader):
+                result = result.read_all()
+        finally:
+            connection.close()
+        return _finish(result, keys, spec, dictionaries, categories)
+
+
+BACKENDS = {
+    'pandas': PandasBackend,
+    'arrow': ArrowBackend,
+    'duckdb': DuckDBBackend,
+}
+
+
+def available_backends():
+    ''' The names of the backends that can run here. '''
+    return [name for name in BACKENDS if name != 'duckdb' or duckdb is not None]
+
+
+def get_backend(name):
+    ''' The backend of a name in BACKENDS. '''
+    if name not in BACKENDS:
+        raise ValueError(f'unknown backend {name!r}, expected one of {sorted(BACKENDS)}')
+    return BACKENDS[name]()
+
+
+def rollup_levels(backend, table, spec=AGG_SPEC):
+    '''
+    A function to aggregate hourly rows to every level with a backend.
+
+    Args:
+        backend: A backend of BACKENDS.
+        table (pa.Table): The hourly rows with a date_h column.
+        spec (dict): The reduction of every variable ('mean', 'sum' or 'mode').
+
+    Returns:
+        dict: The daily, monthly by year, monthly, yearly and station DataFrames by name.
+    '''
+    daily = backend.partials(table, LEVEL_KEYS['daily'], spec)
+    first_year = first_hydrological_year(pd.DatetimeIndex([pc.min(table[HOURLY_INDEX]).as_py()]))
+    return finalize_levels(rollup_partials(daily, first_year), spec, _mode_categories(table, spec))
+
+
+def imputation_stats(backend, table, settings):
+    '''
+    A function to compute the station-hour imputation statistics with a backend.
+    The result is the one of imputation.imputation_stats and fills the rows with impute_from_stats.
+
+    Args:
+        backend: A backend of BACKENDS.
+        table (pa.Table): The hourly rows before imputation.
+        settings (dict): The keyword arguments of imputation.impute.
+
+    Returns:
+        pd.DataFrame: One row per group with the keys and the partial columns.
+    '''
+    spec = {variable: 'mean' for variable in settings['mean_variables']}
+    spec.update({variable: 'mode' for variable in settings['mode_variables']})
+    return backend.partials(table, settings['keys'], spec)
+
+
+def frame_imputation_stats(data, settings, backend='pandas'):
+    '''
+    A function to compute the imputation statistics of a DataFrame, like imputation.imputation_stats, with a backend.
+
+    Args:
+        data (pd.DataFrame): The hourly data before imputation, indexed by the hourly datetime.
+        settings (dict): The keyword arguments of imputation.impute.
+        backend (str): The name of a backend of BACKENDS, 'pandas' runs imputation.imputation_stats.
+
+    Returns:
+        pd.DataFrame: One row per group with the keys and the partial columns.
+    '''
+    if backend == 'pandas':
+        return pandas_imputation_stats(data, settings['mean_variables'], settings['mode_variables'], settings['keys'])
+    return imputation_stats(get_backend(backend), arrow_table(data), settings)
+
+
+def frame_daily_partials(data, backend='pandas'):
+    '''
+    A function to compute the daily partial aggregates of a DataFrame, like rollups.daily_partials, with a backend.
+
+    Args:
+        data (pd.DataFrame): The hourly data indexed by the hourly datetime.
+        backend (str): The name of a backend of BACKENDS, 'pandas' runs rollups.daily_partials.
+
+    Returns:
+        pd.DataFrame: One row per station and day with the partial columns.
+    '''
+    if backend == 'pandas':
+        return daily_partials(data)
+    return get_backend(backend).partials(arrow_table(data), LEVEL_KEYS['daily'])
+
+
+def compare(expected, actual, rtol=1e-6, atol=1e-5):
+    '''
+    A function to check that two backends returned the same tables.
+    Float columns are compared with a tolerance, sums added in another order differ in
+    their last bits (and means close to 0, like winter temperatures, by more than rtol).
+
+    Args:
+        expected (dict or pd.DataFrame): The tables of the reference backend.
+        actual (dict or pd.DataFrame): The tables of the other backend.
+        rtol (float): The relative tolerance of the float columns.
+        atol (float): The absolute tolerance of the float columns.
+    '''
+    if isinstance(expected, pd.DataFrame):
+        expected, actual = {'table': expected}, {'table': actual}
+    for name, table in expected.items():
+        other = actual[name]
+        assert list(table.columns) == list(other.columns), f'{name}: columns differ'
+        assert len(table) == len(other), f'{name}: {len(table)} rows against {len(other)}'
+        for column in table.columns:
+            left, right = table[column], other[column]
+            if pd.api.types.is_float_dtype(left):
+                np.testing.assert_allclose(left.to_numpy(), right.to_numpy(), rtol=rtol, atol=atol,
+                                           err_msg=f'{name}.{column}')
+            else:
+                assert (left.astype(str).to_numpy() == right.astype(str).to_numpy()).all(), f'{name}.{column} differ'
@@ -0,0 +1,533 @@
+'''
+Benchmarks of the data preparation of the dashboard on the PRSA dataset.
+
+The default run compares the current implementation with the legacy one. With --stages,
+every stage of the pipeline is timed and memory-profiled on its own, on the bundled
+dataset and on synthetic copies scaled up by station or by year, and the results can be
+saved as JSON to compare runs.
+
+Usage:
+    python benchmark.py [--sessions N]
+    python benchmark.py --stages [--scales 1 10 100] [--scale-by stations|years] [--output stages.json]
+'''
+import argparse
+import contextlib
+import json
+import multiprocessing
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from aggregation import aggregate, AGG_SPEC
+from backends import arrow_table, available_backends, compare, get_backend, imputation_stats, rollup_levels
+from cache import cached_frame, fingerprint
+from charts import (climate_figure, correlation_figure, ranking_figure, seasonal_figure, to_png,
+                    wind_speed_figure, POLLUTANTS)
+from correlation import Correlations
+from geo import load_boundary, station_map, station_points
+from imputation import impute, imputation_mean, imputation_modus, GROUP_KEYS, MEAN_VARIABLES, MODE_VARIABLES
+from ingest import build_dates, read_stations
+from instrumentation import peak_rss
+from pipeline import (add_locations, load_air_qi, prepare_air_qi, station_files, COLUMNS, IMPUTATION_SETTINGS,
+                      LOCATION_FILE)
+from rollups import (add_periods, combine, daily_partials, finalize, first_hydrological_year, hydrological_year,
+                     mode_dtypes, rollup, LEVEL_KEYS)
+from schema import csv_dtypes, station_name
+
+
+def legacy_read_stations(dire):
+    ''' The sequential reading with inferred dtypes and pairwise concatenation used before ingest.read_stations. '''
+    all_data = [pd.read_csv(os.path.join(dire, file)) for file in os.listdir(dire)]
+    i = 1
+    while i < len(all_data):
+        if (i == 1):
+            air_qi = pd.concat([all_data[0], all_data[1]], axis=0)
+        else:
+            air_qi = pd.concat([air_qi, all_data[i]], axis=0)
+        i += 1
+    air_qi['date'] = pd.to_datetime(air_qi[['year', 'month', 'day']])
+    air_qi['date_h'] = pd.to_datetime(air_qi[['year', 'month', 'day', 'hour']])
+    return air_qi.reindex(columns=COLUMNS)
+
+
+def legacy_imputation_mean(data, variables, stations, hours):
+    ''' The loop based mean imputation used by the dashboard before the groupby engine. '''
+    for variable in variables:
+        for station in stations:
+            for hour in hours:
+                mask = (data['station'] == station) & (data['hour'] == hour)
+                data.loc[mask, variable] = data.loc[mask, variable].fillna(data.loc[mask, variable].mean())
+    return data
+
+
+def legacy_imputation_modus(data, variables, stations, hours):
+    ''' The loop based mode imputation used by the dashboard before the groupby engine. '''
+    for variable in variables:
+        for station in stations:
+            for hour in hours:
+                mask = (data['station'] == station) & (data['hour'] == hour)
+                modus = statistics.mode(data.loc[mask, variable])
+                data.loc[mask, variable] = data.loc[mask, variable].fillna(modus)
+    return data
+
+
+def tied_rows(data, keys, variable='wd'):
+    '''
+    A function to find the rows of the groups whose mode is tied between several values.
+    statistics.mode breaks such ties by the first value seen, the vectorized mode by the lowest code.
+
+    Args:
+        data (pd.DataFrame): The DataFrame.
+        keys (list): The columns defining a group.
+        variable (str): The variable of the mode.
+
+    Returns:
+        np.ndarray: True for the rows of a group with a tie.
+    '''
+    counts = data.groupby(keys + [variable], observed=True).size()
+    top = counts.groupby(level=list(range(len(keys))), observed=True).transform('max')
+    tied = (counts == top).groupby(level=list(range(len(keys))), observed=True).sum() > 1
+    return pd.MultiIndex.from_frame(data[keys]).isin(tied.index[tied.to_numpy()])
+
+
+def mib(size):
+    ''' A size in bytes printed in MiB, n/a where it could not be measured. '''
+    return 'n/a' if size is None else f'{size / 2**20:7.1f} MiB'
+
+
+def timed(func, *args, **kwargs):
+    ''' Run a function once and return its result with the elapsed seconds. '''
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def bench_imputation(air_qi):
+    '''
+    A function to compare the loop based and the groupby based imputation.
+
+    Args:
+        air_qi (pd.DataFrame): The hourly data before imputation.
+
+    Returns:
+        dict: The elapsed seconds of both implementations and the speedup.
+    '''
+    stations = air_qi['station'].unique()
+    hours = air_qi['hour'].unique()
+
+    legacy = air_qi.copy()
+    _, legacy_mean = timed(legacy_imputation_mean, legacy, MEAN_VARIABLES, stations, hours)
+    _, legacy_modus = timed(legacy_imputation_modus, legacy, MODE_VARIABLES, stations, hours)
+
+    vectorized, elapsed = timed(impute, air_qi.copy())
+
+    np.testing.assert_allclose(vectorized[MEAN_VARIABLES].to_numpy(), legacy[MEAN_VARIABLES].to_numpy(), rtol=1e-5)
+    untied = ~tied_rows(air_qi, GROUP_KEYS)
+    pd.testing.assert_series_equal(vectorized['wd'][untied], legacy['wd'][untied])
+
+    return {
+        'legacy': legacy_mean + legacy_modus,
+        'vectorized': elapsed,
+        'speedup': (legacy_mean + legacy_modus) / elapsed,
+    }
+
+
+def _ingest_child(path_name, dire):
+    ''' Run one ingestion path in a fresh process and report its time, frame size and peak RSS. '''
+    read = {'legacy': legacy_read_stations, 'parallel': lambda dire: read_stations(station_files(dire), COLUMNS)}[path_name]
+    air_qi, elapsed = timed(read, dire)
+    return {'seconds': elapsed, 'frame_bytes': int(air_qi.memory_usage(deep=True).sum()), 'peak_rss': peak_rss()}
+
+
+def bench_ingestion(dire):
+    '''
+    A function to compare the legacy and the parallel, dtype-aware ingestion.
+    Each path runs in its own process so the peak RSS of one does not hide the other.
+
+    Args:
+        dire (str): The directory of the station CSV files.
+
+    Returns:
+        dict: For both paths, the elapsed seconds, the size of the frame and the peak RSS in bytes.
+    '''
+    context = multiprocessing.get_context('spawn')
+    result = {}
+    for path_name in ['legacy', 'parallel']:
+        with context.Pool(1) as pool:
+            result[path_name] = pool.apply(_ingest_child, (path_name, dire))
+    return result
+
+
+def bench_mode(air_qi):
+    '''
+    A function to compare the daily wind direction mode of statistics.mode with the vectorized mode.
+    Both agree except on ties, which statistics.mode breaks by the first value seen and the
+    vectorized mode by the first sector clockwise from north.
+
+    Args:
+        air_qi (pd.DataFrame): The imputed hourly data.
+
+    Returns:
+        dict: The elapsed seconds of both reducers, the number of groups and of groups with a tie.
+    '''
+    keys = ['station', air_qi.index.normalize().rename('date')]
+    legacy, legacy_time = timed(lambda: air_qi.groupby(keys, observed=True)['wd'].agg(statistics.mode))
+    vectorized, elapsed = timed(aggregate, air_qi, keys, {'wd': 'mode'})
+
+    counts = air_qi.groupby(keys + ['wd'], observed=True).size()
+    top = counts.groupby(level=[0, 1], observed=True).transform('max')
+    ties = int(((counts == top).groupby(level=[0, 1], observed=True).sum() > 1).sum())
+    differ = int((legacy.astype(str).to_numpy() != vectorized['wd'].astype(str).to_numpy()).sum())
+    assert differ <= ties
+    return {'legacy': legacy_time, 'vectorized': elapsed, 'groups': len(vectorized), 'ties': ties}
+
+
+def bench_rollups(air_qi):
+    '''
+    A function to compare aggregating every level from the hourly rows with the rollup engine.
+    The yearly level is left out of the check, the rollup engine assigns hydrological years
+    from real dates instead of blocks of 365 days.
+
+    Args:
+        air_qi (pd.DataFrame): The imputed hourly data.
+
+    Returns:
+        dict: The elapsed seconds of the separate aggregations and of the rollup engine.
+    '''
+    def separate():
+        keys = dict(LEVEL_KEYS, daily=['station', air_qi.index.normalize().rename('date')])
+        return {name: aggregate(air_qi, keys[name]) for name in ['daily', 'monthly_ey', 'monthly', 'station']}
+
+    expected, separate_time = timed(separate)
+    levels, rollup_time = timed(rollup, air_qi)
+    for name, table in expected.items():
+        columns = [column for column, func in AGG_SPEC.items() if func != 'mode']
+        np.testing.assert_allclose(levels[name][columns].to_numpy(), table[columns].to_numpy(), rtol=1e-5)
+        pd.testing.assert_series_equal(levels[name]['wd'], table['wd'])
+    return {'separate': separate_time, 'rollup': rollup_time}
+
+
+def bench_footprint(dire):
+    '''
+    A function to compare the memory footprint of the legacy hourly frame with the compact schema.
+    The legacy per-row shapely geometry column is left out, so the legacy size is a lower bound.
+
+    Args:
+        dire (str): The directory of the station CSV files.
+
+    Returns:
+        dict: The deep memory usage in bytes of both frames.
+    '''
+    legacy = legacy_read_stations(dire)
+    legacy = pd.merge(left=legacy, right=pd.read_excel(LOCATION_FILE), how='left', on='station')
+    compact = load_air_qi(dire)
+    return {
+        'legacy': int(legacy.memory_usage(deep=True).sum()),
+        'compact': int(compact.memory_usage(deep=True).sum()),
+    }
+
+
+def bench_cache(dire):
+    '''
+    A function to compare preparing the hourly data from the CSV files with reading it from the cache.
+
+    Args:
+        dire (str): The directory of the station CSV files.
+
+    Returns:
+        dict: The elapsed seconds of the cold (build and write) and warm (memory-mapped read) start.
+    '''
+    key = fingerprint(station_files(dire) + [LOCATION_FILE], IMPUTATION_SETTINGS)
+    with tempfile.TemporaryDirectory() as cache_dir:
+        cold, cold_time = timed(cached_frame, 'air_qi', key, lambda: prepare_air_qi(dire), cache_dir)
+        warm, warm_time = timed(cached_frame, 'air_qi', key, lambda: prepare_air_qi(dire), cache_dir)
+    pd.testing.assert_frame_equal(cold, warm)
+    return {'cold': cold_time, 'warm': warm_time}
+
+
+def bench_sessions(sessions, script='dashboard-proyek-cad2.py'):
+    '''
+    A function to run the dashboard for several sessions in one server process.
+    The cached loaders are shared, so only the first session pays for the data preparation.
+
+    Args:
+        sessions (int): The number of sessions to run one after the other.
+        script (str): The Streamlit script of the dashboard.
+
+    Returns:
+        list: For every session, the elapsed seconds and the peak RSS of the process in bytes.
+    '''
+    from streamlit.testing.v1 import AppTest
+
+    # streamlit run puts the directory of the script on the path, AppTest does not
+    sys.path.insert(0, os.path.dirname(os.path.abspath(script)))
+    result = []
+    for _ in range(sessions):
+        app = AppTest.from_file(script, default_timeout=600)
+        _, elapsed = timed(app.run)
+        if app.exception:
+            raise RuntimeError(app.exception[0].message)
+        result.append({'seconds': elapsed, 'peak_rss': peak_rss()})
+    return result
+
+
+def bench_backends(air_qi, backends=None):
+    '''
+    A function to run the rollups and the imputation statistics with every query backend.
+    The results of every backend are checked against the pandas backend.
+
+    Args:
+        air_qi (pd.DataFrame): The hourly data.
+        backends (list): The names of the backends, None for every available one.
+
+    Returns:
+        dict: The elapsed seconds of the rollups and of the imputation statistics of every backend.
+    '''
+    table = arrow_table(air_qi)
+    result = {}
+    expected = None
+    for name in backends or available_backends():
+        backend = get_backend(name)
+        levels, levels_time = timed(rollup_levels, backend, table)
+        stats, stats_time = timed(imputation_stats, backend, table, IMPUTATION_SETTINGS)
+        if expected is None:
+            expected = (levels, stats)
+        else:
+            compare(expected[0], levels)
+            compare(expected[1], stats)
+        result[name] = {'rollups': levels_time, 'imputation_stats': stats_time}
+    return result
+
+
+def synthetic_dataset(dire, location_file, out, stations=1, years=1, seed=0):
+    '''
+    A function to write a scaled-up copy of the PRSA dataset.
+    Every station is copied under new names (Dongsi, Dongsi1, ...) with its location moved
+    slightly, and every file is repeated after its last year, shifted by multiples of 4
+    years so leap days stay valid.
+
+    Args:
+        dire (str): The directory of the station CSV files.
+        location_file (str): The Excel file of the longitude and latitude of the stations.
+        out (str): The directory of the synthetic dataset.
+        stations (int): The number of copies of every station.
+        years (int): The number of copies of the observation period.
+        seed (int): The seed of the station locations.
+
+    Returns:
+        tuple: The directory of the synthetic CSV files and the path of its location file.
+    '''
+    rng = np.random.default_rng(seed)
+    locsta = pd.read_excel(location_file)
+    data_dir = os.path.join(out, 'data')
+    os.makedirs(data_dir, exist_ok=True)
+
+    locations = []
+    for path in station_files(dire):
+        data = pd.read_csv(path)
+        name = station_name(path)
+        span = data['year'].max() - data['year'].min() + 1
+        shift = -(-span // 4) * 4
+        periods = [data.assign(year=data['year'] + shift * i) for i in range(years)]
+        data = pd.concat(periods, ignore_index=True)
+        start, end = os.path.basename(path).split('_')[3].split('.')[0].split('-')
+        end = str(int(end[:4]) + shift * (years - 1)) + end[4:]
+
+        location = locsta[locsta['station'] == name]
+        for i in range(stations):
+            copy_name = name if i == 0 else f'{name}{i}'
+            data['station'] = copy_name
+            data.to_csv(os.path.join(data_dir, f'PRSA_Data_{copy_name}_{start}-{end}.csv'), index=False)
+            moved = location.assign(station=copy_name)
+            if i:
+                moved = moved.assign(lon=moved['lon'] + rng.normal(0, 0.05), lat=moved['lat'] + rng.normal(0, 0.05))
+            locations.append(moved)
+
+    synthetic_location_file = os.path.join(out, 'lonlat_sta.xlsx')
+    pd.concat(locations, ignore_index=True).to_excel(synthetic_location_file, index=False)
+    return data_dir, synthetic_location_file
+
+
+@contextlib.contextmanager
+def stage(results, name):
+    '''
+    A context manager recording the elapsed seconds and the peak memory allocated by a stage.
+    The memory is traced by tracemalloc, which must be started by the caller.
+
+    Args:
+        results (list): The list receiving the record of the stage.
+        name (str): The name of the stage.
+    '''
+    tracemalloc.reset_peak()
+    before = tracemalloc.get_traced_memory()[0]
+    start = time.perf_counter()
+    yield
+    elapsed = time.perf_counter() - start
+    results.append({'stage': name, 'seconds': elapsed, 'peak_bytes': tracemalloc.get_traced_memory()[1] - before})
+
+
+def bench_stages(dire, location_file=LOCATION_FILE):
+    '''
+    A function to time and memory-profile every stage of the pipeline of the dashboard separately.
+    The times include the overhead of tracemalloc, they are meant to be compared between runs.
+
+    Args:
+        dire (str): The directory of the station CSV files.
+        location_file (str): The Excel file of the longitude and latitude of the stations.
+
+    Returns:
+        list: For every stage, its name, the elapsed seconds and the peak allocated bytes.
+    '''
+    results = []
+    paths = station_files(dire)
+    dtypes = csv_dtypes([station_name(path) for path in paths])
+    tracemalloc.start()
+    try:
+        with stage(results, 'csv load'):
+            all_data = [pd.read_csv(path, usecols=list(dtypes), dtype=dtypes) for path in paths]
+        with stage(results, 'concat'):
+            air_qi = pd.concat(all_data, axis=0, ignore_index=True)
+        del all_data
+        with stage(results, 'datetime'):
+            air_qi['date_h'] = build_dates(air_qi)
+        with stage(results, 'location merge'):
+            air_qi = add_locations(air_qi.reindex(columns=COLUMNS), location_file)
+        with stage(results, 'imputation_mean'):
+            imputation_mean(air_qi, MEAN_VARIABLES, GROUP_KEYS)
+        with stage(results, 'imputation_modus'):
+            imputation_modus(air_qi, MODE_VARIABLES, GROUP_KEYS)
+
+        first_year = first_hydrological_year(air_qi.index)
+        with stage(results, 'rollup daily_partials'):
+            daily = daily_partials(air_qi)
+        with stage(results, 'rollup add_periods (yearly)'):
+            daily = add_periods(daily, first_year)
+        levels = {'daily': daily}
+        with stage(results, 'rollup combine monthly_ey'):
+            levels['monthly_ey'] = combine(daily, LEVEL_KEYS['monthly_ey'])
+            levels['monthly_ey']['yearly'] = hydrological_year(
+                levels['monthly_ey']['year'], levels['monthly_ey']['month'], first_year)
+        for name, source in [('monthly', 'monthly_ey'), ('yearly', 'monthly_ey'), ('station', 'yearly')]:
+            with stage(results, f'rollup combine {name}'):
+                levels[name] = combine(levels[source], LEVEL_KEYS[name])
+        dtypes = mode_dtypes(air_qi)
+        tables = {}
+        for name, partial in levels.items():
+            with stage(results, f'rollup finalize {name}'):
+                tables[name] = finalize(partial, LEVEL_KEYS[name], AGG_SPEC, dtypes)
+        tables['monthly_ey']['date'] = pd.to_datetime(pd.DataFrame({
+            'year': tables['monthly_ey']['year'], 'month': tables['monthly_ey']['month'], 'day': 1}))
+
+        # The correlation of the pollutants with the rain as in the dashboard
+        with stage(results, 'correlation'):
+            correlation = Correlations({'monthly': tables['monthly']}).target('monthly', 'RAIN', POLLUTANTS)
+
+        boundary = load_boundary()
+        points = station_points(pd.read_excel(location_file))
+        wd_points = points.merge(aggregate(tables['monthly'], ['station'], {'wd': 'mode'}), on='station')
+        figures = {
+            'station map': lambda: station_map(boundary, points, 'station'),
+            'climate TEMP': lambda: climate_figure('TEMP', tables['monthly'], 'Air Temperature'),
+            'climate RAIN': lambda: climate_figure('RAIN', tables['monthly'], 'Rainfall', kind='bar'),
+            'climate PRES': lambda: climate_figure('PRES', tables['monthly'], 'Air Pressure'),
+            'wind speed': lambda: wind_speed_figure(tables['monthly']),
+            'wind direction map': lambda: station_map(boundary, wd_points, 'wd', (16, 16)),
+            'seasonal monthly': lambda: seasonal_figure('PM2.5', tables['monthly_ey'], tables['yearly'], 'Monthly'),
+            'seasonal yearly': lambda: seasonal_figure('PM2.5', tables['monthly_ey'], tables['yearly'], 'Yearly'),
+            'ranking': lambda: ranking_figure('PM2.5', tables['station']),
+            'correlation': lambda: correlation_figure(correlation),
+        }
+        for name, draw in figures.items():
+            with stage(results, f'figure {name}'):
+                to_png(draw())
+    finally:
+        tracemalloc.stop()
+    return results
+
+
+def bench_scaling(dire, location_file=LOCATION_FILE, scales=(1, 10), scale_by='stations'):
+    '''
+    A function to run the stage benchmark on the dataset and on synthetic copies scaled up by station or year.
+
+    Args:
+        dire (str): The directory of the station CSV files.
+        location_file (str): The Excel file of the longitude and latitude of the stations.
+        scales (list): The scale factors, 1 is the dataset itself.
+        scale_by (str): 'stations' or 'years'.
+
+    Returns:
+        dict: The stage results of every scale factor.
+    '''
+    result = {}
+    for scale in scales:
+        if scale == 1:
+            result[scale] = bench_stages(dire, location_file)
+            continue
+        with tempfile.TemporaryDirectory() as out:
+            copies = {'stations': 1, 'years': 1, scale_by: scale}
+            data_dir, synthetic_location_file = synthetic_dataset(dire, location_file, out, **copies)
+            result[scale] = bench_stages(data_dir, synthetic_location_file)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--data', default='Air-quality-dataset', help='directory of the station CSV files')
+    parser.add_argument('--sessions', type=int, default=0, help='also run the dashboard for this many sessions')
+    parser.add_argument('--stages', action='store_true', help='time and memory-profile every stage instead')
+    parser.add_argument('--scales', type=int, nargs='+', default=[1, 10], help='scale factors of the stage benchmark')
+    parser.add_argument('--scale-by', choices=['stations', 'years'], default='stations',
+                        help='scale the dataset up by copying stations or years')
+    parser.add_argument('--output', help='save the stage results to this JSON file')
+    args = parser.parse_args()
+
+    if args.stages:
+        result = bench_scaling(args.data, LOCATION_FILE, args.scales, args.scale_by)
+        print(f"{'stage':32s}" + ''.join(f'{f"x{scale} s":>10s}{f"x{scale} MiB":>12s}' for scale in result))
+        for i, record in enumerate(result[args.scales[0]]):
+            print(f"{record['stage']:32s}" + ''.join(
+                f"{stages[i]['seconds']:10.3f}{stages[i]['peak_bytes'] / 2**20:12.1f}" for stages in result.values()))
+        if args.output:
+            with open(args.output, 'w') as file:
+                json.dump({'scale_by': args.scale_by, 'scales': result}, file, indent=2)
+        return
+
+    for path_name, result in bench_ingestion(args.data).items():
+        print(f"ingestion   {path_name:8s} {result['seconds']:8.2f} s  "
+              f"frame {result['frame_bytes'] / 2**20:7.1f} MiB  peak RSS {mib(result['peak_rss'])}")
+
+    result = bench_footprint(args.data)
+    print(f"footprint   legacy {result['legacy'] / 2**20:7.1f} MiB  compact {result['compact'] / 2**20:7.1f} MiB  "
+          f"ratio {result['legacy'] / result['compact']:4.1f}x")
+
+    air_qi = load_air_qi(args.data)
+    result = bench_imputation(air_qi)
+    print(f"imputation  legacy {result['legacy']:8.2f} s  "
+          f"vectorized {result['vectorized']:8.3f} s  speedup {result['speedup']:6.0f}x")
+
+    result = bench_mode(impute(air_qi))
+    print(f"daily mode  legacy {result['legacy']:8.2f} s  vectorized {result['vectorized']:8.3f} s  "
+          f"speedup {result['legacy'] / result['vectorized']:6.0f}x  ({result['ties']} ties in {result['groups']} groups)")
+
+    result = bench_rollups(air_qi)
+    print(f"rollups     separate {result['separate']:6.2f} s  rollup engine {result['rollup']:8.3f} s")
+
+    for name, result in bench_backends(air_qi).items():
+        print(f"backend     {name:8s} rollups {result['rollups']:8.3f} s  "
+              f"imputation stats {result['imputation_stats']:8.3f} s")
+
+    result = bench_cache(args.data)
+    print(f"startup     cold {result['cold']:8.2f} s  warm (cached) {result['warm']:8.3f} s")
+
+    for i, result in enumerate(bench_sessions(args.sessions)):
+        print(f"session {i + 1:3d} {result['seconds']:8.2f} s  peak RSS {mib(result['peak_rss'])}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+import glob
+import hashlib
+import json
+import os
+
+import pyarrow as pa
+import pyarrow.feather as feather
+
+CACHE_DIR = '.cache'
+
+# Bump when the layout of the cached tables changes so old files are not read back
+CACHE_VERSION = 6
+
+
+def fingerprint(paths, settings=None):
+    '''
+    A function to compute the cache key of a set of source files and settings.
+    Files are identified by their name, size and modification time so the contents are never read.
+
+    Args:
+        paths (list): The paths of the source files.
+        settings (dict): The settings used to build the cached table (must be JSON serializable).
+
+    Returns:
+        str: A short hexadecimal key.
+    '''
+    digest = hashlib.sha256()
+    digest.update(str(CACHE_VERSION).encode())
+    for path in sorted(paths):
+        stat = os.stat(path)
+        digest.update(f'{os.path.basename(path)}:{stat.st_size}:{stat.st_mtime_ns};'.encode())
+    digest.update(json.dumps(settings, sort_keys=True, default=str).encode())
+    return digest.hexdigest()[:16]
+
+
+def cache_path(name, key, cache_dir=CACHE_DIR):
+    ''' The path of the cached table called name for the given key. '''
+    return os.path.join(cache_dir, f'{name}-{key}.feather')
+
+
+def write_frame(data, name, key, cache_dir=CACHE_DIR):
+    '''
+    A function to store a DataFrame as an uncompressed Feather (Arrow IPC) file.
+    Older versions of the same table are removed and the file is written atomically,
+    so concurrent readers never see a partial file.
+
+    Args:
+        data (pd.DataFrame): The DataFrame to store.
+        name (str): The name of the table.
+        key (str): The cache key of the table.
+        cache_dir (str): The cache directory.
+
+    Returns:
+        str: The path of the written file.
+    '''
+    os.makedirs(cache_dir, exist_ok=True)
+    path = cache_path(name, key, cache_dir)
+    for old in glob.glob(os.path.join(cache_dir, f'{name}-*.feather')):
+        if old != path:
+            os.remove(old)
+    table = pa.Table.from_pandas(data, preserve_index=True)
+    tmp = f'{path}.{os.getpid()}.tmp'
+    # Uncompressed files can be memory-mapped back without decoding
+    feather.write_feather(table, tmp, compression='uncompressed')
+    os.replace(tmp, path)
+    return path
+
+
+def read_table(name, key, cache_dir=CACHE_DIR):
+    '''
+    A function to read a cached table back as an Arrow table through a memory map.
+
+    Args:
+        name (str): The name of the table.
+        key (str): The cache key of the table.
+        cache_dir (str): The cache directory.
+
+    Returns:
+        pa.Table: The cached table, or None when there is no table for the key.
+    '''
+    path = cache_path(name, key, cache_dir)
+    if not os.path.exists(path):
+        return None
+    return feather.read_table(path, memory_map=True)
+
+
+def read_frame(name, key, cache_dir=CACHE_DIR):
+    '''
+    A function to read a cached table back through a memory map.
+
+    Args:
+        name (str): The name of the table.
+        key (str): The cache key of the table.
+        cache_dir (str): The cache directory.
+
+    Returns:
+        pd.DataFrame: The cached DataFrame, or None when there is no table for the key.
+    '''
+    table = read_table(name, key, cache_dir)
+    return None if table is None else table.to_pandas()
+
+
+def cached_frame(name, key, build, cache_dir=CACHE_DIR):
+    '''
+    A function to read a cached table, building and storing it first when it is missing.
+
+    Args:
+        name (str): The name of the table.
+        key (str): The cache key of the table.
+        build (callable): A function without arguments returning the DataFrame.
+        cache_dir (str): The cache directory.
+
+    Returns:
+        pd.DataFrame: The cached DataFrame.
+    '''
+    data = read_frame(name, key, cache_dir)
+    if data is None:
+        data = build()
+        write_frame(data, name, key, cache_dir)
+    return data
@@ -0,0 +1,224 @@
+import io
+
+import matplotlib.pyplot as plt
+import numpy as np
+import seaborn as sns
+
+POLLUTANTS = ['PM2.5', 'PM10', 'CO', 'SO2', 'NO2', 'O3']
+RESOLUTIONS = ['Monthly', 'Yearly']
+
+
+def seasonal_figure(pollutant, air_qi_monthly_ey, air_qi_yearly, resolution):
+    '''
+    A function to plot the seasonal pattern of a pollutant in Beijing and in each station.
+
+    Args:
+        pollutant (str): The pollutant column.
+        air_qi_monthly_ey (pd.DataFrame): The monthly data since 2013 until 2017.
+        air_qi_yearly (pd.DataFrame): The yearly data.
+        resolution (str): 'Monthly' or 'Yearly'.
+
+    Returns:
+        matplotlib.figure.Figure: The figure with the average in Beijing and in each station.
+    '''
+    fig, axes = plt.subplots(nrows=1, ncols=2, figsize=(25, 5))
+    if resolution == 'Monthly':
+        sns.lineplot(x='date', y=pollutant, data=air_qi_monthly_ey, ax=axes[0])
+        axes[0].set_title(f'{pollutant} monthly average in Beijing for 4 years ', size=20)
+        sns.lineplot(x='date', y=pollutant, data=air_qi_monthly_ey, hue='station', legend='auto', ax=axes[1])
+        axes[1].set_title(f'{pollutant} monthly average in each stations in Beijing for 4 years', size=20)
+    else:
+        sns.lineplot(x='yearly', y=pollutant, data=air_qi_yearly, ax=axes[0])
+        axes[0].set_title(f'{pollutant} trends average in Beijing ', size=20)
+        sns.lineplot(x='yearly', y=pollutant, data=air_qi_yearly, hue='station', legend='auto', ax=axes[1])
+        axes[1].set_title(f'{pollutant} trends in each stations in Beijing for 4 years', size=20)
+
+    axes[0].set_xlabel('')
+    axes[0].set_ylabel(pollutant, size=20)
+    axes[1].set_xlabel('')
+    axes[1].set_ylabel('')
+    axes[1].legend(loc='lower right')
+    fig.tight_layout()
+    return fig
+
+
+def station_seasonal_figure(pollutant, station, air_qi_monthly_ey, air_qi_yearly, resolution):
+    '''
+    A function to plot the seasonal pattern of a pollutant in one station.
+
+    Args:
+        pollutant (str): The pollutant column.
+        station (str): The station.
+        air_qi_monthly_ey (pd.DataFrame): The monthly data of the station since 2013 until 2017.
+        air_qi_yearly (pd.DataFrame): The yearly data of the station.
+        resolution (str): 'Monthly' or 'Yearly'.
+
+    Returns:
+        matplotlib.figure.Figure: The figure.
+    '''
+    fig, ax = plt.subplots(figsize=(12, 5))
+    if resolution == 'Monthly':
+        sns.lineplot(x='date', y=pollutant, data=air_qi_monthly_ey, ax=ax)
+        ax.set_title(f'{pollutant} monthly average in {station} for 4 years', size=20)
+    else:
+        sns.lineplot(x='yearly', y=pollutant, data=air_qi_yearly, ax=ax)
+        ax.set_title(f'{pollutant} trends in {station}', size=20)
+    ax.set_xlabel('')
+    ax.set_ylabel(pollutant, size=20)
+    fig.tight_layout()
+    return fig
+
+
+def ranking_figure(pollutant, air_qi_sta, title=None):
+    '''
+    A function to plot the concentration of a pollutant in each station.
+    The highest station is red, the lowest is green and the others are orange.
+
+    Args:
+        pollutant (str): The pollutant column.
+        air_qi_sta (pd.DataFrame): The data by station.
+        title (str): The title, None for the concentration of the pollutant.
+
+    Returns:
+        matplotlib.figure.Figure: The horizontal bar chart.
+    '''
+    fig, ax = plt.subplots(nrows=1, ncols=1, figsize=(25, 10))
+    data = air_qi_sta[pollutant]
+
+    max_value = max(data)
+    min_value = min(data)
+    colors = []
+    for value in data:
+        if value == max_value:
+            colors.append('red')
+        elif value == min_value:
+            colors.append('green')
+        else:
+            colors.append('orange')
+    ax.barh(air_qi_sta['station'].astype(str), data, color=colors)
+    ax.set_title(f'Concentration of {pollutant}' if title is None else title)
+    return fig
+
+
+def climate_figure(variable, air_qi_monthly, title, kind='line'):
+    '''
+    A function to plot the monthly pattern of a climate variable in Beijing.
+
+    Args:
+        variable (str): The climate column.
+        air_qi_monthly (pd.DataFrame): The data by station and month.
+        title (str): The title of the figure.
+        kind (str): 'line' or 'bar'.
+
+    Returns:
+        matplotlib.figure.Figure: The figure.
+    '''
+    fig, ax = plt.subplots(figsize=(16, 10))
+    if kind == 'bar':
+        sns.barplot(x='month', y=variable, data=air_qi_monthly, ax=ax)
+    else:
+        sns.lineplot(x='month', y=variable, data=air_qi_monthly, ax=ax)
+    ax.set_title(title, fontsize=100)
+    return fig
+
+
+def wind_speed_figure(air_qi_monthly):
+    '''
+    A function to plot the monthly wind speed in each station.
+
+    Args:
+        air_qi_monthly (pd.DataFrame): The data by station and month.
+
+    Returns:
+        matplotlib.figure.Figure: The figure.
+    '''
+    fig, ax = plt.subplots(figsize=(16, 16))
+    sns.lineplot(x='month', y='WSPM', data=air_qi_monthly, hue='station', legend='auto', ax=ax)
+    fig.tight_layout()
+    return fig
+
+
+def correlation_figure(correlation):
+    '''
+    A function to plot the correlation of the pollutants to another variable.
+
+    Args:
+        correlation (pd.Series): The correlation coefficients by pollutant.
+
+    Returns:
+        matplotlib.figure.Figure: The bar chart.
+    '''
+    fig, ax = plt.subplots(figsize=(25, 15))
+    sns.barplot(correlation, color='red', ax=ax)
+    ax.set_ylabel('')
+    return fig
+
+
+def coverage_figure(coverage):
+    '''
+    A function to plot the share of observed hours of every station and month as a heatmap.
+
+    Args:
+        coverage (pd.DataFrame): One row per station and one column per month, from 0 to 1 (see quality.coverage_matrix).
+
+    Returns:
+        matplotlib.figure.Figure: The heatmap.
+    '''
+    fig, ax = plt.subplots(figsize=(25, 8))
+    sns.heatmap(coverage, vmin=0, vmax=1, cmap='RdYlGn', linewidths=0.5,
+                xticklabels=coverage.columns.strftime('%Y-%m'), cbar_kws={'label': 'Observed hours'}, ax=ax)
+    ax.set_xlabel('')
+    ax.set_ylabel('')
+    return fig
+
+
+def wind_rose_figure(rose, title):
+    '''
+    A function to plot a wind rose, one stacked bar per sector with one segment per speed band.
+
+    Args:
+        rose (pd.DataFrame): One row per sector, clockwise from north, and one column per speed band (see wind.wind_rose).
+        title (str): The title.
+
+    Returns:
+        matplotlib.figure.Figure: The polar bar chart.
+    '''
+    fig, ax = plt.subplots(figsize=(10, 10), subplot_kw={'projection': 'polar'})
+    ax.set_theta_zero_location('N')
+    ax.set_theta_direction(-1)
+    angles = np.linspace(0, 2 * np.pi, len(rose), endpoint=False)
+    width = 2 * np.pi / len(rose) * 0.9
+    bottom = np.zeros(len(rose))
+    colors = sns.color_palette('viridis', len(rose.columns))
+    for band, color in zip(rose.columns, colors):
+        ax.bar(angles, rose[band].to_numpy(), width=width, bottom=bottom, color=color, label=f'{band} m/s')
+        bottom += rose[band].to_numpy()
+    ax.set_xticks(angles)
+    ax.set_xticklabels(rose.index.astype(str))
+    ax.set_title(title)
+    ax.legend(loc='lower left', bbox_to_anchor=(1.0, 0.0))
+    return fig
+
+
+def to_image(fig, fmt='png'):
+    '''
+    A function to render a figure to image bytes and close it.
+
+    Args:
+        fig (matplotlib.figure.Figure): The figure.
+        fmt (str): The image format, e.g. 'png' or 'svg'.
+
+    Returns:
+        bytes: The image.
+    '''
+    buffer = io.BytesIO()
+    try:
+        fig.savefig(buffer, format=fmt, bbox_inches='tight')
+    finally:
+        plt.close(fig)
+    return buffer.getvalue()
+
+
+def to_png(fig):
+    ''' The PNG image of a figure, closing it. '''
+    return to_image(fig, 'png')
@@ -0,0 +1,193 @@
+'''
+Correlations of the air quality tables, selected by column name.
+
+The tables of every resolution are turned once into time x station matrices of a variable
+(cached), and every correlation is computed on those matrices with batched NumPy
+operations: one pass for a target against many variables, one matrix product for every
+pair of stations and one vectorized pass over the stations for every lag. Missing values
+are left out pairwise. Results are cached per resolution and query.
+
+    ============  ================  ========================================
+    resolution    time column       table
+    ============  ================  ========================================
+    hourly        date_h (index)    the prepared hourly rows
+    daily         date              the daily level
+    monthly_ey    date              the monthly level of every year
+    monthly       month             the monthly level (one row per calendar month)
+    ============  ================  ========================================
+'''
+import numpy as np
+import pandas as pd
+
+from schema import HOURLY_INDEX
+
+TIME_COLUMNS = {
+    'hourly': HOURLY_INDEX,
+    'daily': 'date',
+    'monthly_ey': 'date',
+    'monthly': 'month',
+}
+
+# The step of the regular resolutions, the matrices get a row for every step so lags are steps
+FREQUENCIES = {
+    'hourly': 'h',
+    'daily': 'D',
+    'monthly_ey': 'MS',
+}
+
+
+def pearson_columns(x, y):
+    '''
+    A function to compute the Pearson correlation of every column of x with the same column of y.
+    Rows where either value is missing are left out of the pair.
+
+    Args:
+        x (np.ndarray): The values, one row per observation and one column per series.
+        y (np.ndarray): The values of the other series, with the shape of x.
+
+    Returns:
+        np.ndarray: The correlation of every column, NaN when it is undefined.
+    '''
+    x = np.asarray(x, dtype='float64')
+    y = np.asarray(y, dtype='float64')
+    valid = ~(np.isnan(x) | np.isnan(y))
+    n = valid.sum(axis=0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        x_mean = np.where(valid, x, 0).sum(axis=0) / n
+        y_mean = np.where(valid, y, 0).sum(axis=0) / n
+        xc = np.where(valid, x - x_mean, 0)
+        yc = np.where(valid, y - y_mean, 0)
+        return (xc * yc).sum(axis=0) / np.sqrt((xc * xc).sum(axis=0) * (yc * yc).sum(axis=0))
+
+
+def pearson_matrix(x):
+    '''
+    A function to compute the Pearson correlation of every pair of columns with matrix products.
+    Rows where either value of a pair is missing are left out of the pair.
+
+    Args:
+        x (np.ndarray): The values, one row per observation and one column per series.
+
+    Returns:
+        np.ndarray: The correlation matrix, NaN where it is undefined.
+    '''
+    x = np.asarray(x, dtype='float64')
+    valid = ~np.isnan(x)
+    # Centering first keeps the sums of squares small, the correlation does not depend on it
+    x = np.where(valid, x - np.nanmean(x, axis=0), 0)
+    mask = valid.astype('float64')
+    n = mask.T @ mask
+    sums = x.T @ mask
+    squares = (x * x).T @ mask
+    products = x.T @ x
+    with np.errstate(invalid='ignore', divide='ignore'):
+        covariance = products - sums * sums.T / n
+        variance = (squares - sums * sums / n) * (squares - sums * sums / n).T
+        return covariance / np.sqrt(variance)
+
+
+class Correlations:
+    '''
+    The correlations of the tables of every resolution, cached per resolution and query.
+
+    Args:
+        tables (dict): The table of every resolution of TIME_COLUMNS, with a station column.
+    '''
+
+    def __init__(self, tables):
+        self.tables = tables
+        self._matrices = {}
+        self._results = {}
+
+    def _cached(self, key, compute):
+        if key not in self._results:
+            self._results[key] = compute()
+        return self._results[key]
+
+    def matrix(self, resolution, variable):
+        '''
+        A function to get a variable as a time x station matrix.
+
+        Args:
+            resolution (str): The resolution of TIME_COLUMNS.
+            variable (str): The variable.
+
+        Returns:
+            pd.DataFrame: One row per time, sorted, and one column per station, NaN where a station has no value.
+        '''
+        key = (resolution, variable)
+        if key not in self._matrices:
+            table = self.tables[resolution]
+            time = TIME_COLUMNS[resolution]
+            times = table.index if time == table.index.name else table[time]
+            matrix = pd.DataFrame({
+                'time': np.asarray(times), 'station': table['station'].to_numpy(), 'value': table[variable].to_numpy(),
+            }).pivot(index='time', columns='station', values='value').sort_index()
+            if resolution in FREQUENCIES and len(matrix):
+                matrix = matrix.reindex(pd.date_range(matrix.index[0], matrix.index[-1], freq=FREQUENCIES[resolution]))
+            self._matrices[key] = matrix
+        return self._matrices[key]
+
+    def target(self, resolution, target, variables):
+        '''
+        A function to correlate variables with a target over every station and time of a resolution.
+
+        Args:
+            resolution (str): The resolution of TIME_COLUMNS.
+            target (str): The target variable, e.g. 'RAIN'.
+            variables (list): The variables, selected by name.
+
+        Returns:
+            pd.Series: The correlation of every variable with the target.
+        '''
+        def compute():
+            table = self.tables[resolution]
+            values = table[list(variables)].to_numpy(dtype='float64')
+            repeated = np.repeat(table[target].to_numpy(dtype='float64')[:, None], len(variables), axis=1)
+            return pd.Series(pearson_columns(values, repeated), index=list(variables), name=target)
+        return self._cached(('target', resolution, target, tuple(variables)), compute)
+
+    def cross_station(self, resolution, variable):
+        '''
+        A function to correlate a variable between every pair of stations.
+
+        Args:
+            resolution (str): The resolution of TIME_COLUMNS.
+            variable (str): The variable.
+
+        Returns:
+            pd.DataFrame: The station x station correlation matrix.
+        '''
+        def compute():
+            matrix = self.matrix(resolution, variable)
+            return pd.DataFrame(pearson_matrix(matrix.to_numpy()), index=matrix.columns, columns=matrix.columns)
+        return self._cached(('cross_station', resolution, variable), compute)
+
+    def lagged(self, resolution, x, y, lags):
+        '''
+        A function to correlate a variable with another one some steps later, in every station.
+        The steps are rows of the time x station matrix, e.g. hours at the hourly resolution.
+
+        Args:
+            resolution (str): The resolution of TIME_COLUMNS.
+            x (str): The leading variable.
+            y (str): The lagging variable.
+            lags (list): The lags in steps, a negative lag makes y lead.
+
+        Returns:
+            pd.DataFrame: The correlation of x at t with y at t + lag, one row per lag and one column per station.
+        '''
+        def compute():
+            x_matrix = self.matrix(resolution, x)
+            y_matrix = self.matrix(resolution, y).reindex(index=x_matrix.index, columns=x_matrix.columns)
+            x_values = x_matrix.to_numpy()
+            y_values = y_matrix.to_numpy()
+            n = len(x_values)
+            rows = []
+            for lag in lags:
+                if lag >= 0:
+                    rows.append(pearson_columns(x_values[:n - lag], y_values[lag:]))
+                else:
+                    rows.append(pearson_columns(x_values[-lag:], y_values[:n + lag]))
+            return pd.DataFrame(rows, index=pd.Index(list(lags), name='lag'), columns=x_matrix.columns)
+        return self._cached(('lagged', resolution, x, y, tuple(lags)), compute)
@@ -1,333 +1,327 @@
-import os
+import contextlib
+import uuid
+
 import numpy as np
 import pandas as pd
 import geopandas as gpd
-import matplotlib.pyplot as plt
 import seaborn as sns
-import statistics
 import streamlit as st
 
-from babel.numbers import format_currency
-from shapely.geometry import Point
+from aggregation import aggregate
+from correlation import Correlations
+from charts import (climate_figure, correlation_figure, coverage_figure, ranking_figure, seasonal_figure,
+                    wind_rose_figure, wind_speed_figure, POLLUTANTS, RESOLUTIONS)
+from figure_cache import FigureCache
+from gap_filling import STRATEGIES
+from downsample import METHODS
+from exceedance import category_hours, exceedance_hours, THRESHOLDS
+from geo import load_boundary, station_map, station_points, surface_map
+from imputation import observed
+from instrumentation import TIMINGS
+from interactive import hourly_chart, hourly_series, MAX_POINTS
+from pipeline import IMPUTATION_SETTINGS, LOCATION_FILE
+from rollups import daily_partials
+from quality import coverage_matrix, gap_summary
+from stations import StationView
+from schema import MEASUREMENTS, WIND_DIRECTIONS
+from surface import animation_gif, IDWGrid
+from store import (load_exceedance, load_hourly, load_levels, load_partials, load_quality, load_wind,
+                   open_store, read_meta, store_version, strategy_store_dir)
+from wind import sector_means, wind_rose
+from windows import WindowIndex
 sns.set(style='dark')
 
 # Upload Data
-dire = "Air-quality-dataset"
-files = os.listdir(dire)
-all_data = []
-for file in files:
-    data = pd.read_csv(f'Air-quality-dataset/{file}')
-    data2 = pd.DataFrame(data)
-    all_data.append(data2)
-
-# Joining All Data
-i = 1
-while i < len(all_data):
-    if (i == 1):
-        air_qi = pd.concat([all_data[0], all_data[1]], axis=0)
-    else:
-        air_qi = pd.concat([air_qi, all_data[i]], axis=0)
-    i += 1
-
-# Change Format of Datetime
-air_qi['date'] = pd.to_datetime(air_qi[['year','month','day']])
-air_qi['date_h'] = pd.to_datetime(air_qi[['year','month','day','hour']])
-air_qi = air_qi.iloc[:,1:]
-
-# Change the Position of Features
-new_col = ['date_h', 'PM2.5', 'PM10', 'SO2', 
-           'NO2', 'CO', 'O3', 'TEMP', 'PRES', 'DEWP', 'RAIN', 'wd', 'WSPM', 
-           'station', 'date', 'year', 'month', 'day', 'hour']
-air_qi = air_qi.reindex(columns=new_col)
-
-# Change the name of columns
-new_col = ['date_h', 'PM2.5', 'PM10', 'SO2', 
-           'NO2', 'CO', 'O3', 'TEMP', 'PRES', 'DEWP', 'RAIN', 'wd', 'WSPM', 
-           'station', 'date', 'year', 'month', 'day', 'hour']
-air_qi.columns = new_col
-
-# Upload Longitude and Latitude of Observation Stations
-locsta = pd.read_excel('lonlat_sta.xlsx')
-air_qi = pd.merge(
-    left=air_qi,
-    right=locsta,
-    how='left',
-    left_on='station',
-    right_on='station'
-)
-
-# Upload Shape file of Beijing City, China
-shp_beijing = gpd.read_file('gadm41_CHN_shp/gadm41_CHN_3_Beijing.shp')
-
-# Data Imputation
-stations = air_qi['station'].unique()
-hours = air_qi['hour'].unique()
-
-def imputation_mean(data, variables, stations, hours):
-    ''' 
-    A function of filling the values of missing values with its average.
-    Imputation was did in some variabels or features depending on the station and recording time.
-    
+# The loaders below are cached once per server process (st.cache_resource) and the returned
+# tables are shared by every session, so they must be treated as read-only.
+@st.cache_resource(show_spinner='Loading the air quality data...')
+def load_data(version, store_dir):
+    '''
+    A function to load the prepared hourly data, the station locations and the Beijing boundaries.
+
     Args:
-        data (pd.DataFrame): The DataFrame containing missing values.
-        variables (list): A list of variable names (column names) to impute.
-        stations (list): A list of station observations.
-        hours (list): A list of time measurements.
+        version (str): The version of the data store, a new version reloads the data.
+        store_dir (str): The directory of the store.
 
     Returns:
-        pd.DataFrame: The DataFrame with missing values filled by mean for specified conditions.
+        tuple: The hourly data, the station locations and the Beijing boundaries.
+    '''
+    # Parsed, joined with the station locations and imputed once, then read from the store
+    with TIMINGS.stage('load_hourly', version=version):
+        air_qi = load_hourly(read_meta(store_dir), store_dir)
+
+    # Upload Longitude and Latitude of Observation Stations, one point per station
+    with TIMINGS.stage('load_locations', version=version):
+        locsta = station_points(pd.read_excel(LOCATION_FILE))
+
+    # Upload Shape file of Beijing City, China, simplified for plotting
+    with TIMINGS.stage('load_boundary', version=version):
+        shp_beijing = load_boundary()
+    return air_qi, locsta, shp_beijing
+
+@st.cache_resource(show_spinner='Aggregating the air quality data...')
+def load_tables(version, store_dir):
     '''
-    for variable in variables:
-        for station in stations:
-            for hour in hours:
-                data[variable][(data['station'] == station) &
-                                 (data['hour'] == hour)] = data[(data['station'] == station) &
-                                                                    (data['hour'] == hour)][variable].fillna(
-                                                                        value=data[(data['station'] == station) &
-                                                                                     (data['hour'] == hour)][variable].mean())
-    return data
-
-variabel = ['PM2.5', 'PM10', 'SO2', 'NO2', 'CO', 'O3', 'TEMP', 'PRES', 'DEWP', 'WSPM']
-imputation_mean(air_qi, variables=variabel, stations=stations, hours=hours)
-
-def imputation_modus(data, variables, stations, hours):
-    ''' 
-    A function of filling the values of missing values with its mode.
-    Imputation was did in some variabels or features depending on the station and recording time.
-    
+    A function to compute every aggregate shown in the dashboard.
+
     Args:
-        data (pd.DataFrame): The DataFrame containing missing values.
-        variables (list): A list of variable names (column names) to impute.
-        stations (list): A list of station observations.
-        hours (list): A list of time measurements.
+        version (str): The version of the data store, a new version recomputes the tables.
+        store_dir (str): The directory of the store.
 
     Returns:
-        pd.DataFrame: The DataFrame with missing values filled by mode for specified conditions.
+        dict: The aggregated DataFrames and the rain correlation by name.
     '''
-    for variable in variables:
-        for station in stations:
-            for hour in hours:
-                modus = statistics.mode(data[variable][(data['station'] == station) & (data['hour'] == hour)])
-                data[variable][(data['station'] == station) &
-                                 (data['hour'] == hour)] = data[(data['station'] == station) &
-                                                                    (data['hour'] == hour)][variable].fillna(
-                                                                        value=modus)
-    return data
-
-variabel = ['wd']
-imputation_modus(air_qi, variables=variabel, stations=stations, hours=hours)
-
-# Make a function to filter data by station
-stations = air_qi['station'].unique()
-def filter_sta(data, col, stations, listSta):
+    air_qi, locsta, shp_beijing = load_data(version, store_dir)
+    meta = read_meta(store_dir)
+
+    # Make daily, monthly (since 2013 until 2017 and by month), yearly and station dataframes
+    # from the partial aggregates kept up to date by the store
+    with TIMINGS.stage('load_levels', version=version):
+        levels = load_levels(meta, store_dir)
+    air_qi_daily = levels['daily']
+    air_qi_monthly_ey = levels['monthly_ey']
+    air_qi_monthly = levels['monthly']
+    air_qi_yearly = levels['yearly']
+    air_qi_sta = levels['station']
+
+    with TIMINGS.stage('window_index', version=version):
+        window_index = WindowIndex(load_partials(meta, store_dir)['daily'],
+                                   dtypes={'wd': pd.CategoricalDtype(WIND_DIRECTIONS)})
+        # The same aggregates without the filled values, from the imputation mask of the hourly rows
+        observed_window_index = WindowIndex(daily_partials(observed(air_qi)),
+                                            dtypes={'wd': pd.CategoricalDtype(WIND_DIRECTIONS)})
+
+    # Make a series correlation between rain and pollutant gases, the pollutants are selected
+    # by name and the correlations of every resolution are cached by the Correlations object
+    with TIMINGS.stage('correlation', version=version):
+        correlations = Correlations({
+            'hourly': air_qi,
+            'daily': air_qi_daily,
+            'monthly_ey': air_qi_monthly_ey,
+            'monthly': air_qi_monthly,
+        })
+        correlRainQI = correlations.target('monthly', 'RAIN', POLLUTANTS)
+
+    with TIMINGS.stage('surface_grid', version=version):
+        surface_grid = IDWGrid(shp_beijing, locsta['lon'].to_numpy(), locsta['lat'].to_numpy())
+
+    # Make the main wind direction of each station
+    with TIMINGS.stage('wind_direction', version=version):
+        wd_beijing = aggregate(air_qi_monthly, ['station'], {'wd' : 'mode'})
+        wd_beijing2 = gpd.GeoDataFrame(pd.merge(
+            left=wd_beijing,
+            right=locsta,
+            how='left',
+            left_on='station',
+            right_on='station'
+        ), crs=locsta.crs)
+
+    return {
+        'daily': air_qi_daily,
+        'monthly_ey': air_qi_monthly_ey,
+        'monthly': air_qi_monthly,
+        # Per-station slices of the tables, e.g. tables['daily_sta']['Dongsi']
+        'hourly_sta': StationView(air_qi),
+        'daily_sta': StationView(air_qi_daily),
+        'monthly_ey_sta': StationView(air_qi_monthly_ey),
+        'monthly_sta': StationView(air_qi_monthly),
+        'yearly': air_qi_yearly,
+        'station': air_qi_sta,
+        'rain_correlation': correlRainQI,
+        'correlations': correlations,
+        'wind_direction': wd_beijing2,
+        # Prefix sums of the daily partials, the aggregates of any date window by station
+        'window_index': window_index,
+        'observed_window_index': observed_window_index,
+        # Hours by station, month, pollutant and concentration band, summed for any threshold view
+        'exceedance': load_exceedance(meta, store_dir),
+        # The inverse distance weights of the grid cells inside Beijing City to the stations
+        'surface_grid': surface_grid,
+        # Wind histograms and pollutant sums by station, day and sector, summed for any wind rose
+        'wind': load_wind(meta, store_dir),
+    }
+
+@st.cache_resource(show_spinner='Loading the data-quality scan...')
+def load_quality_tables(version, store_dir):
     '''
-    A function to filter data by a station. Each data is saved to list.
+    A function to load the data-quality scan stored with the data, so a view never reads the hourly rows again.
 
     Args:
-        data (pd.DataFrame): The DataFrame.
-        col (chr): the name of station column in data.
-        stations (list): A list of station observations.
-        listSta (list): An empty list.
+        version (str): The version of the data store, a new version reloads the scan.
+        store_dir (str): The directory of the store.
 
     Returns:
-        list : list of filtered data (in pd.Dataframe) by station.
+        dict: The tables of the scan by name (see quality).
     '''
-
-    for station in stations:
-        filterData = data[data[col]==station]
-        filteredData = pd.DataFrame(filterData)
-        listSta.append(filteredData)
-    return listSta
-
-# Make daily dataframe
-def daily_airqi(data):
-    air_qi_daily = data.groupby(['station','date']).agg({
-        'PM2.5' : 'mean',
-        'PM10' : 'mean',
-        'SO2' : 'mean',
-        'NO2' : 'mean',
-       'CO' : 'mean',
-        'O3' : 'mean',
-        'TEMP' : 'mean',
-        'PRES' : 'mean',
-        'DEWP' : 'mean',
-        'RAIN' : 'sum',
-        'WSPM' : 'mean',
-        'wd' : statistics.mode,
-        })
-    air_qi_daily.reset_index(inplace=True)
-    return air_qi_daily
-
-column_name = 'station'
-
-air_qi_daily = daily_airqi(air_qi)
-list_aq_daily_sta = []
-filter_sta(air_qi_daily, col=column_name, stations=stations, listSta=list_aq_daily_sta)
-
-# Make monthly dataframe since 2013 until 2017
-def monthly_ey_airqi(data):
-    air_qi_monthly_ey = data.groupby(['station','year','month']).agg({
-        'PM2.5' : 'mean',
-        'PM10' : 'mean',
-        'SO2' : 'mean',
-        'NO2' : 'mean',
-        'CO' : 'mean',
-        'O3' : 'mean',
-        'TEMP' : 'mean',
-        'PRES' : 'mean',
-        'DEWP' : 'mean',
-        'RAIN' : 'sum',
-        'WSPM' : 'mean',
-        'wd' : statistics.mode,
-        })
-    air_qi_monthly_ey.reset_index(inplace=True)
-    air_qi_monthly_ey['day'] = 1
-    air_qi_monthly_ey['date'] = pd.to_datetime(air_qi_monthly_ey[['year','month','day']])
-    return air_qi_monthly_ey
-
-column_name = 'station'
-
-air_qi_monthly_ey = monthly_ey_airqi(air_qi)
-list_aq_mon_year_sta = []
-filter_sta(air_qi_monthly_ey, col=column_name, stations=stations, listSta=list_aq_mon_year_sta)
-
-# Make monthly dataframe
-def monthly_airqi(data):
-    air_qi_monthly = data.groupby(['station','month']).agg({
-        'PM2.5' : 'mean',
-        'PM10' : 'mean',
-        'SO2' : 'mean',
-        'NO2' : 'mean',
-       'CO' : 'mean',
-        'O3' : 'mean',
-        'TEMP' : 'mean',
-        'PRES' : 'mean',
-        'DEWP' : 'mean',
-        'RAIN' : 'sum',
-        'WSPM' : 'mean',
-        'wd' : statistics.mode,
-        })
-    air_qi_monthly.reset_index(inplace=True)
-    return air_qi_monthly
-
-column_name = 'station'
-
-air_qi_monthly = monthly_airqi(air_qi)
-list_aq_monthly_sta = []
-filter_sta(air_qi_monthly, col=column_name, stations=stations, listSta=list_aq_monthly_sta)
-
-# Make yearly dataframe
-for i in range(0, len(list_aq_daily_sta)):
-    df = list_aq_daily_sta[i]
-    df['yearly'] = 4
-    df['yearly'].iloc[0:365] = 1
-    df['yearly'].iloc[365:730] = 2
-    df['yearly'].iloc[730:1095] = 3
-
-list_aq_yearly_sta = []
-for i in range(0, len(list_aq_daily_sta)):
-    df = list_aq_daily_sta[i]
-    air_qi_yearly = df.groupby(['station','yearly']).agg({
-    'PM2.5' : 'mean',
-    'PM10' : 'mean',
-    'SO2' : 'mean',
-    'NO2' : 'mean',
-    'CO' : 'mean',
-    'O3' : 'mean',
-    'TEMP' : 'mean',
-    'PRES' : 'mean',
-    'DEWP' : 'mean',
-    'RAIN' : 'sum',
-    'WSPM' : 'mean',
-    'wd' : statistics.mode,
-    })
-    
-    air_qi_yearly.reset_index(inplace=True)
-    list_aq_yearly_sta.append(air_qi_yearly)
-
-i = 1
-while i < len(list_aq_yearly_sta):
-    if (i == 1):
-        air_qi_yearly = pd.concat([list_aq_yearly_sta[0], list_aq_yearly_sta[1]], axis=0)
-    else:
-        air_qi_yearly = pd.concat([air_qi_yearly, list_aq_yearly_sta[i]], axis=0)
-    i += 1
-
-# Make a series correlation between rain and pollutant gases
-dataa = pd.DataFrame(air_qi_monthly)
-cormat = dataa.corr(method='pearson', numeric_only=True)
-correlRainQI = pd.DataFrame(cormat)
-correlRainQI = correlRainQI['RAIN'][1:7]
+    with TIMINGS.stage('load_quality', version=version):
+        return load_quality(read_meta(store_dir), store_dir)
+
+# Figures are built only for the pollutant and resolution chosen by the viewer. The rendered
+# images are shared by every session and kept on disk, keyed by the hash of the plotted
+# table and of the plot options, so a new store version only redraws the charts it changes
+@st.cache_resource
+def figure_cache():
+    ''' The cache of the rendered charts. '''
+    return FigureCache()
+
+def render_seasonal(tables, pollutant, resolution):
+    ''' The PNG image of the seasonal pattern of a pollutant at a resolution. '''
+    data = tables['monthly_ey'] if resolution == 'Monthly' else tables['yearly']
+    columns = ['date' if resolution == 'Monthly' else 'yearly', 'station', pollutant]
+    return figure_cache().render(
+        data[columns], {'chart': 'seasonal', 'pollutant': pollutant, 'resolution': resolution},
+        lambda: seasonal_figure(pollutant, tables['monthly_ey'], tables['yearly'], resolution))
+
+def render_ranking(air_qi_sta, pollutant):
+    ''' The PNG image of the concentration of a pollutant in each station. '''
+    data = air_qi_sta[['station', pollutant]]
+    return figure_cache().render(data, {'chart': 'ranking', 'pollutant': pollutant},
+                                 lambda: ranking_figure(pollutant, data))
+
+def render_station_map(shp_beijing, points, hue, figsize):
+    ''' The PNG image of the stations over the boundaries of Beijing City, colored by hue. '''
+    return figure_cache().render(
+        [shp_beijing, points[['lon', 'lat', hue]]], {'chart': 'station_map', 'hue': hue, 'figsize': figsize},
+        lambda: station_map(shp_beijing, points, hue, figsize))
+
+def render_coverage(quality, variable):
+    ''' The PNG image of the observed hours of a variable by station and month. '''
+    coverage = coverage_matrix(quality['coverage'], variable)
+    return figure_cache().render(coverage, {'chart': 'coverage', 'variable': variable},
+                                 lambda: coverage_figure(coverage))
+
+def render_exceedance(hours, pollutant, threshold):
+    ''' The PNG image of the hours of a pollutant above a threshold in each station. '''
+    data = hours.rename(pollutant).rename_axis('station').reset_index()
+    return figure_cache().render(
+        data, {'chart': 'exceedance', 'pollutant': pollutant, 'threshold': threshold},
+        lambda: ranking_figure(pollutant, data, f'Hours of {pollutant} above {threshold:g} ug/m3'))
+
+def render_surface(shp_beijing, points, grid, surface, title, vmin, vmax):
+    ''' The PNG image of an interpolated surface over the boundaries of Beijing City. '''
+    raster = grid.raster(surface)
+    return figure_cache().render(
+        pd.DataFrame(raster), {'chart': 'surface', 'title': title, 'vmin': vmin, 'vmax': vmax},
+        lambda: surface_map(shp_beijing, points, raster, grid.extent, title, vmin, vmax))
+
+def render_surface_animation(points, grid, values, surfaces, vmin, vmax):
+    ''' The animated GIF of the surfaces of every month. '''
+    labels = values.index.strftime('%Y-%m')
+    return figure_cache().render(
+        values, {'chart': 'surface_animation', 'vmin': vmin, 'vmax': vmax},
+        lambda: animation_gif(grid, surfaces, labels, points['lon'], points['lat'], vmin, vmax),
+        encode=lambda image: image)
+
+def render_wind_rose(rose, title):
+    ''' The PNG image of a wind rose. '''
+    return figure_cache().render(rose, {'chart': 'wind_rose', 'title': title},
+                                 lambda: wind_rose_figure(rose, title))
+
+def render_climate(air_qi_monthly, variable, title, kind='line'):
+    ''' The PNG image of the monthly pattern of a climate variable. '''
+    return figure_cache().render(
+        air_qi_monthly[['month', variable]], {'chart': 'climate', 'variable': variable, 'title': title, 'kind': kind},
+        lambda: climate_figure(variable, air_qi_monthly, title, kind))
+
+# Every step of a run is timed for the session (see instrumentation), the loaders above are
+# also timed inside, where they do the work once per process
+if 'session_id' not in st.session_state:
+    st.session_state['session_id'] = uuid.uuid4().hex[:12]
+    st.session_state['run'] = 0
+st.session_state['run'] += 1
+session_id = st.session_state['session_id']
+run = st.session_state['run']
+
+def timed(name):
+    ''' A timer of a step of the current run. '''
+    return TIMINGS.stage(name, session=session_id, run=run)
+
+# ?diagnostics=json shows the recorded timings of the current session as JSON instead of the page
+if st.query_params.get('diagnostics') == 'json':
+    st.json({'session': session_id, 'records': TIMINGS.select(session=session_id)})
+    st.stop()
+
+page = contextlib.ExitStack()
+page.enter_context(timed('page'))
+
+# Build the store on the first run or when the source files change, new rows are added with
+# python store.py append NEW_ROWS.csv
+# Every imputation strategy has its own store, built the first time it is chosen
+strategy = st.sidebar.selectbox('Imputation strategy', STRATEGIES,
+                                index=STRATEGIES.index(IMPUTATION_SETTINGS['strategy']), key='strategy')
+store_dir = strategy_store_dir(strategy)
+with timed('open_store'):
+    version = store_version(open_store(settings=dict(IMPUTATION_SETTINGS, strategy=strategy), store_dir=store_dir))
+with timed('load_data'):
+    air_qi, locsta, shp_beijing = load_data(version, store_dir)
+with timed('load_tables'):
+    tables = load_tables(version, store_dir)
+air_qi_monthly_ey = tables['monthly_ey']
+air_qi_monthly = tables['monthly']
+air_qi_yearly = tables['yearly']
+air_qi_sta = tables['station']
+correlRainQI = tables['rain_correlation']
+
+# The date window and the stations of the wind rose, the station ranking, the exceedance
+# hours and the hourly series, answered from prefix sums and partials instead of the hourly rows
+window_index = tables['window_index']
+first_date = pd.Timestamp(window_index.first_date).date()
+last_date = pd.Timestamp(window_index.last_date).date()
+window_dates = st.sidebar.date_input('Date window', value=(first_date, last_date), min_value=first_date,
+                                     max_value=last_date, key='window_dates')
+# The end date is missing while the viewer is still picking the window
+start_date, end_date = (window_dates[0], window_dates[-1]) if window_dates else (first_date, last_date)
+# No station chosen means every station
+window_stations = st.sidebar.multiselect('Stations', window_index.stations, default=window_index.stations,
+                                         key='window_stations') or window_index.stations
+st.sidebar.caption('The window and the stations apply to the wind rose, the station ranking, the hours above '
+                   'the standard and the hourly series')
+window_title = f'{start_date} to {end_date}'
 
 st.header('Proyek Analisis Data: Air Quality Dataset')
 st.subheader('Location of Weather Observation Stations')
 
-air_qi['geometry'] = air_qi.apply(lambda row: Point(row['lon'], row['lat']), axis=1)
-fig, ax = plt.subplots(figsize=(10, 10))
-shp_beijing.plot(ax=ax, color='lightgray')
-
-ax.scatter(air_qi['lon'], air_qi['lat'])
-sns.scatterplot(x='lon', y='lat', hue='station', data=air_qi, palette='husl')
-plt.xlabel('')
-plt.ylabel('')
-plt.legend()
-st.pyplot(fig)
+with timed('figure station_map'):
+    st.image(render_station_map(shp_beijing, locsta, 'station', (10, 10)), use_column_width=True)
 
 st.subheader('Climate Characteristic of Beijing City')
 
 col1, col2, col3 = st.columns(3)
  
-with col1:
-    fig, ax = plt.subplots(figsize=(16, 10))
-    sns.lineplot(x=air_qi_monthly['month'], y=air_qi_monthly['TEMP'], legend=True)
-    plt.title('Air Temperature', fontsize=100)
-    st.pyplot(fig)
+with col1, timed('figure climate TEMP'):
+    st.image(render_climate(air_qi_monthly, 'TEMP', 'Air Temperature'), use_column_width=True)
  
-with col2:
-    fig, ax = plt.subplots(figsize=(16, 10))
-    sns.barplot(x='month', y='RAIN', data=air_qi_monthly)
-    plt.title('Rainfall', fontsize=100)
-    st.pyplot(fig)
+with col2, timed('figure climate RAIN'):
+    st.image(render_climate(air_qi_monthly, 'RAIN', 'Rainfall', kind='bar'), use_column_width=True)
  
-with col3:
-    fig, ax = plt.subplots(figsize=(16, 10))
-    sns.lineplot(x='month', y='PRES', data=air_qi_monthly)
-    plt.title('Air Pressure', fontsize=100)
-    st.pyplot(fig)
+with col3, timed('figure climate PRES'):
+    st.image(render_climate(air_qi_monthly, 'PRES', 'Air Pressure'), use_column_width=True)
 
 col1, col2 = st.columns(2)
 
-with col1:
-    fig, ax = plt.subplots(figsize=(16, 16))
-    sns.lineplot(x='month', y='WSPM', data=air_qi_monthly, hue='station', legend='auto')
-    plt.tight_layout()  # Menyesuaikan tata letak agar rapi
-
+with col1, timed('figure wind_speed'):
     st.caption('Wind Speed (m/s)')
-    st.pyplot(fig)
-
-with col2:
-    wd_beijing = air_qi_monthly[['station','wd']].groupby(['station']).agg(statistics.mode)
-    wd_beijing.reset_index(inplace=True)
-    wd_beijing2 = pd.merge(
-        left=wd_beijing,
-        right=locsta,
-        how='left',
-        left_on='station',
-        right_on='station'
-    )
-    wd_beijing2['geometry'] = wd_beijing2.apply(lambda row: Point(row['lon'], row['lat']), axis=1)
-
-    fig, ax = plt.subplots(figsize=(16, 16))
-    shp_beijing.plot(ax=ax, color='lightgray')
-
-    ax.scatter(wd_beijing2['lon'], wd_beijing2['lat'])
-    sns.scatterplot(x='lon', y='lat', hue='wd', data=wd_beijing2, palette='husl')
-    plt.xlabel('')
-    plt.ylabel('')
-    plt.legend()
+    st.image(figure_cache().render(air_qi_monthly[['month', 'station', 'WSPM']], {'chart': 'wind_speed'},
+                                   lambda: wind_speed_figure(air_qi_monthly)), use_column_width=True)
 
+with col2, timed('figure wind_direction'):
     st.caption('Variations of Wind Direction')
-    st.pyplot(fig)
+    st.image(render_station_map(shp_beijing, tables['wind_direction'], 'wd', (16, 16)), use_column_width=True)
+
+st.subheader('Wind Rose')
+st.caption('Hours of wind from each direction and speed, and the pollution each direction brings')
+
+wind = tables['wind']
+with timed('wind_rose'):
+    rose = wind_rose(wind, window_stations, start_date, end_date)
+    means = sector_means(wind, POLLUTANTS, window_stations, start_date, end_date)
+
+col1, col2 = st.columns(2)
+with col1, timed('figure wind_rose'):
+    st.image(render_wind_rose(rose, window_title), use_column_width=True)
+with col2:
+    wind_pollutant = st.radio('Pollutant', POLLUTANTS, horizontal=True, key='wind_pollutant')
+    st.bar_chart(means[[wind_pollutant]].rename(index=str))
 
 st.subheader("Seasonal Pattern of Pollutant Levels in Beijing")
 st.caption('Choose the pollutant gas or materi particulate')
@@ -335,305 +329,138 @@ st.caption('Choose the pollutant gas or materi particulate')
 filtered_data = air_qi_monthly.copy()
 st.dataframe(filtered_data, height=500, width=1000)
 
-# PM2.5 
-st.caption('Seasonal Pattern of PM2.5')
-fig, axes = plt.subplots(nrows=2, ncols=2, figsize=(25, 10))  # Sesuaikan nrows dan ncols dengan jumlah plot
-sns.lineplot(x='date', y='PM2.5', data=air_qi_monthly_ey, ax=axes[0,0])
-axes[0,0].set_title('PM2.5 monthly average in Beijing for 4 years ', size=20)
-axes[0,0].set_xlabel('')
-axes[0,0].set_ylabel("PM2.5", size=20)
-
-sns.lineplot(x='date', y='PM2.5', data=air_qi_monthly_ey, hue='station', legend='auto', ax=axes[0,1])
-axes[0,1].set_title('PM2.5 monthly average in each stations in Beijing for 4 years', size=20)
-axes[0,1].set_xlabel('')
-axes[0,1].set_ylabel('')
-
-sns.lineplot(x='yearly', y='PM2.5', data=air_qi_yearly, ax=axes[1,0])
-axes[1,0].set_title('PM2.5 trends average in Beijing ', size=20)
-axes[1,0].set_xlabel('')
-axes[1,0].set_ylabel("PM2.5", size=20)
-
-sns.lineplot(x='yearly', y='PM2.5', data=air_qi_yearly, hue='station', legend='auto', ax=axes[1,1])
-axes[1,1].set_title('PM2.5 trends in each stations in Beijing for 4 years', size=20)
-axes[1,1].set_xlabel('')
-axes[1,1].set_ylabel('')
-
-plt.legend(loc='lower right')
-plt.tight_layout() 
-st.pyplot(fig)  
-
-# PM10
-st.caption('Seasonal Pattern of PM10')
-fig, axes = plt.subplots(nrows=2, ncols=2, figsize=(25, 10))  # Sesuaikan nrows dan ncols dengan jumlah plot
-sns.lineplot(x='date', y='PM10', data=air_qi_monthly_ey, ax=axes[0,0])
-axes[0,0].set_title('PM10 monthly average in Beijing for 4 years ', size=20)
-axes[0,0].set_xlabel('')
-axes[0,0].set_ylabel("PM10", size=20)
-
-sns.lineplot(x='date', y='PM10', data=air_qi_monthly_ey, hue='station', legend='auto', ax=axes[0,1])
-axes[0,1].set_title('PM10 monthly average in each stations in Beijing for 4 years', size=20)
-axes[0,1].set_xlabel('')
-axes[0,1].set_ylabel('')
-
-sns.lineplot(x='yearly', y='PM10', data=air_qi_yearly, ax=axes[1,0])
-axes[1,0].set_title('PM10 trends average in Beijing ', size=20)
-axes[1,0].set_xlabel('')
-axes[1,0].set_ylabel("PM10", size=20)
-
-sns.lineplot(x='yearly', y='PM10', data=air_qi_yearly, hue='station', legend='auto', ax=axes[1,1])
-axes[1,1].set_title('PM10 trends in each stations in Beijing for 4 years', size=20)
-axes[1,1].set_xlabel('')
-axes[1,1].set_ylabel('')
-
-plt.legend(loc='lower right')
-plt.tight_layout() 
-st.pyplot(fig)  
-
-# CO
-st.caption('Seasonal Pattern of CO')
-fig, axes = plt.subplots(nrows=2, ncols=2, figsize=(25, 10))  # Sesuaikan nrows dan ncols dengan jumlah plot
-sns.lineplot(x='date', y='CO', data=air_qi_monthly_ey, ax=axes[0,0])
-axes[0,0].set_title('CO monthly average in Beijing for 4 years ', size=20)
-axes[0,0].set_xlabel('')
-axes[0,0].set_ylabel("CO", size=20)
-
-sns.lineplot(x='date', y='CO', data=air_qi_monthly_ey, hue='station', legend='auto', ax=axes[0,1])
-axes[0,1].set_title('CO monthly average in each stations in Beijing for 4 years', size=20)
-axes[0,1].set_xlabel('')
-axes[0,1].set_ylabel('')
-
-sns.lineplot(x='yearly', y='CO', data=air_qi_yearly, ax=axes[1,0])
-axes[1,0].set_title('CO trends average in Beijing ', size=20)
-axes[1,0].set_xlabel('')
-axes[1,0].set_ylabel("CO", size=20)
-
-sns.lineplot(x='yearly', y='CO', data=air_qi_yearly, hue='station', legend='auto', ax=axes[1,1])
-axes[1,1].set_title('CO trends in each stations in Beijing for 4 years', size=20)
-axes[1,1].set_xlabel('')
-axes[1,1].set_ylabel('')
-
-plt.legend(loc='lower right')
-plt.tight_layout() 
-st.pyplot(fig)
-
-# SO2
-st.caption('Seasonal Pattern of SO2')
-fig, axes = plt.subplots(nrows=2, ncols=2, figsize=(25, 10))  # Sesuaikan nrows dan ncols dengan jumlah plot
-sns.lineplot(x='date', y='SO2', data=air_qi_monthly_ey, ax=axes[0,0])
-axes[0,0].set_title('SO2 monthly average in Beijing for 4 years ', size=20)
-axes[0,0].set_xlabel('')
-axes[0,0].set_ylabel("SO2", size=20)
-
-sns.lineplot(x='date', y='SO2', data=air_qi_monthly_ey, hue='station', legend='auto', ax=axes[0,1])
-axes[0,1].set_title('SO2 monthly average in each stations in Beijing for 4 years', size=20)
-axes[0,1].set_xlabel('')
-axes[0,1].set_ylabel('')
-
-sns.lineplot(x='yearly', y='SO2', data=air_qi_yearly, ax=axes[1,0])
-axes[1,0].set_title('SO2 trends average in Beijing ', size=20)
-axes[1,0].set_xlabel('')
-axes[1,0].set_ylabel("SO2", size=20)
-
-sns.lineplot(x='yearly', y='SO2', data=air_qi_yearly, hue='station', legend='auto', ax=axes[1,1])
-axes[1,1].set_title('SO2 trends in each stations in Beijing for 4 years', size=20)
-axes[1,1].set_xlabel('')
-axes[1,1].set_ylabel('')
-
-plt.legend(loc='lower right')
-plt.tight_layout() 
-st.pyplot(fig)
-
-# NO2
-st.caption('Seasonal Pattern of NO2')
-fig, axes = plt.subplots(nrows=2, ncols=2, figsize=(25, 10))  # Sesuaikan nrows dan ncols dengan jumlah plot
-sns.lineplot(x='date', y='NO2', data=air_qi_monthly_ey, ax=axes[0,0])
-axes[0,0].set_title('NO2 monthly average in Beijing for 4 years ', size=20)
-axes[0,0].set_xlabel('')
-axes[0,0].set_ylabel("NO2", size=20)
-
-sns.lineplot(x='date', y='NO2', data=air_qi_monthly_ey, hue='station', legend='auto', ax=axes[0,1])
-axes[0,1].set_title('NO2 monthly average in each stations in Beijing for 4 years', size=20)
-axes[0,1].set_xlabel('')
-axes[0,1].set_ylabel('')
-
-sns.lineplot(x='yearly', y='NO2', data=air_qi_yearly, ax=axes[1,0])
-axes[1,0].set_title('NO2 trends average in Beijing ', size=20)
-axes[1,0].set_xlabel('')
-axes[1,0].set_ylabel("NO2", size=20)
-
-sns.lineplot(x='yearly', y='NO2', data=air_qi_yearly, hue='station', legend='auto', ax=axes[1,1])
-axes[1,1].set_title('NO2 trends in each stations in Beijing for 4 years', size=20)
-axes[1,1].set_xlabel('')
-axes[1,1].set_ylabel('')
-
-plt.legend(loc='lower right')
-plt.tight_layout() 
-st.pyplot(fig)
-
-# O3
-st.caption('Seasonal Pattern of O3')
-fig, axes = plt.subplots(nrows=2, ncols=2, figsize=(25, 10))  # Sesuaikan nrows dan ncols dengan jumlah plot
-sns.lineplot(x='date', y='O3', data=air_qi_monthly_ey, ax=axes[0,0])
-axes[0,0].set_title('O3 monthly average in Beijing for 4 years ', size=20)
-axes[0,0].set_xlabel('')
-axes[0,0].set_ylabel("O3", size=20)
-
-sns.lineplot(x='date', y='O3', data=air_qi_monthly_ey, hue='station', legend='auto', ax=axes[0,1])
-axes[0,1].set_title('O3 monthly average in each stations in Beijing for 4 years', size=20)
-axes[0,1].set_xlabel('')
-axes[0,1].set_ylabel('')
-
-sns.lineplot(x='yearly', y='O3', data=air_qi_yearly, ax=axes[1,0])
-axes[1,0].set_title('O3 trends average in Beijing ', size=20)
-axes[1,0].set_xlabel('')
-axes[1,0].set_ylabel("O3", size=20)
-
-sns.lineplot(x='yearly', y='O3', data=air_qi_yearly, hue='station', legend='auto', ax=axes[1,1])
-axes[1,1].set_title('O3 trends in each stations in Beijing for 4 years', size=20)
-axes[1,1].set_xlabel('')
-axes[1,1].set_ylabel('')
-
-plt.legend(loc='lower right')
-plt.tight_layout() 
-st.pyplot(fig)
+pollutant = st.radio('Pollutant', POLLUTANTS, horizontal=True, key='seasonal_pollutant')
+resolution = st.radio('Resolution', RESOLUTIONS, horizontal=True)
+
+st.caption(f'Seasonal Pattern of {pollutant}')
+with timed('figure seasonal'):
+    st.image(render_seasonal(tables, pollutant, resolution), use_column_width=True)
+
+st.subheader('Hourly Series')
+st.caption('Zoom and pan the time axis, or choose a narrower window to see more detail')
+
+hourly_sta = tables['hourly_sta']
+first_hour = pd.Timestamp(start_date).to_pydatetime()
+last_hour = (pd.Timestamp(end_date) + pd.Timedelta(hours=23)).to_pydatetime()
+hourly_pollutant = st.radio('Pollutant', POLLUTANTS, horizontal=True, key='hourly_pollutant')
+hourly_stations = st.multiselect('Stations', window_stations, default=window_stations[:3],
+                                 key='hourly_stations')
+hourly_window = st.slider('Window', min_value=first_hour, max_value=last_hour, value=(first_hour, last_hour),
+                          format='YYYY-MM-DD', key='hourly_window')
+method_label = st.radio('Downsampling', ['LTTB', 'Min/max'], horizontal=True, key='hourly_method')
+method = dict(zip(['LTTB', 'Min/max'], METHODS))[method_label]
+
+# The series are downsampled on the server to at most MAX_POINTS points for the window
+with timed('hourly_series'):
+    points = hourly_series({station: hourly_sta[station] for station in hourly_stations}, hourly_pollutant,
+                           *hourly_window, points=MAX_POINTS, method=method)
+st.altair_chart(hourly_chart(points, hourly_pollutant), use_container_width=True)
 
 st.subheader('Areas with the Highest and Lowest Levels of Air Pollution')
+st.caption(f'Averages over {window_title}')
 
-air_qi_sta = air_qi.groupby(['station']).agg({
-    'PM2.5' : 'mean',
-    'PM10' : 'mean',
-    'SO2' : 'mean',
-    'NO2' : 'mean',
-    'CO' : 'mean',
-    'O3' : 'mean',
-    'TEMP' : 'mean',
-    'PRES' : 'mean',
-    'DEWP' : 'mean',
-    'RAIN' : 'sum',
-    'WSPM' : 'mean',
-    'wd' : statistics.mode,
-})
-air_qi_sta.reset_index(inplace=True)
-
-filtered_data = air_qi_sta.copy()
+observed_only = st.checkbox('Observed hours only', key='ranking_observed',
+                            help='Leave out the hours filled by the imputation')
+with timed('window'):
+    ranking_index = tables['observed_window_index'] if observed_only else window_index
+    filtered_data = ranking_index.window(start_date, end_date, window_stations)
 st.dataframe(filtered_data, height=500, width=1000)
 
-categories = air_qi_sta['station']
-
-
-# PM2.5
-st.caption('Seasonal Pattern of O3')
-fig, axes = plt.subplots(nrows=1, ncols=1, figsize=(25, 10)) 
-data = air_qi_sta['PM2.5']
-
-max_value = max(data)
-min_value = min(data)
-colors = []
-for value in data:
-    if value == max_value:
-        colors.append('red')
-    elif value == min_value:
-        colors.append('green')
-    else:
-        colors.append('orange')
-plt.barh(categories, data, color=colors)
-plt.title('Concentration of PM2.5')
-st.pyplot(fig)
-
-# PM10
-fig, axes = plt.subplots(nrows=1, ncols=1, figsize=(25, 10)) 
-data = air_qi_sta['PM10']
-
-max_value = max(data)
-min_value = min(data)
-colors = []
-for value in data:
-    if value == max_value:
-        colors.append('red')
-    elif value == min_value:
-        colors.append('green')
-    else:
-        colors.append('orange')
-plt.barh(categories, data, color=colors)
-plt.title('Concentration of PM10')
-st.pyplot(fig)
-
-# CO
-fig, axes = plt.subplots(nrows=1, ncols=1, figsize=(25, 10)) 
-data = air_qi_sta['CO']
-
-max_value = max(data)
-min_value = min(data)
-colors = []
-for value in data:
-    if value == max_value:
-        colors.append('red')
-    elif value == min_value:
-        colors.append('green')
-    else:
-        colors.append('orange')
-plt.barh(categories, data, color=colors)
-plt.title('Concentration of CO')
-st.pyplot(fig)
-
-# SO2
-fig, axes = plt.subplots(nrows=1, ncols=1, figsize=(25, 10)) 
-data = air_qi_sta['SO2']
-
-max_value = max(data)
-min_value = min(data)
-colors = []
-for value in data:
-    if value == max_value:
-        colors.append('red')
-    elif value == min_value:
-        colors.append('green')
-    else:
-        colors.append('orange')
-plt.barh(categories, data, color=colors)
-plt.title('Concentration of SO2')
-st.pyplot(fig)
-
-# NO2
-fig, axes = plt.subplots(nrows=1, ncols=1, figsize=(25, 10)) 
-data = air_qi_sta['NO2']
-
-max_value = max(data)
-min_value = min(data)
-colors = []
-for value in data:
-    if value == max_value:
-        colors.append('red')
-    elif value == min_value:
-        colors.append('green')
-    else:
-        colors.append('orange')
-plt.barh(categories, data, color=colors)
-plt.title('Concentration of NO2')
-st.pyplot(fig)
-
-# O3
-fig, axes = plt.subplots(nrows=1, ncols=1, figsize=(25, 10)) 
-data = air_qi_sta['O3']
-
-max_value = max(data)
-min_value = min(data)
-colors = []
-for value in data:
-    if value == max_value:
-        colors.append('red')
-    elif value == min_value:
-        colors.append('green')
-    else:
-        colors.append('orange')
-plt.barh(categories, data, color=colors)
-plt.title('Concentration of O3')
-st.pyplot(fig)
-
+ranked = st.radio('Pollutant', POLLUTANTS, horizontal=True, key='ranking_pollutant')
+with timed('figure ranking'):
+    st.image(render_ranking(filtered_data, ranked), use_column_width=True)
+
+st.subheader('Hours above the Air Quality Standard')
+st.caption('Hours above the Grade II standard and hours in each AQI category, by station, '
+           'in the months of the date window')
+
+exceedance = tables['exceedance']
+exceeded = st.radio('Pollutant', list(THRESHOLDS), horizontal=True, key='exceedance_pollutant')
+observed_only = st.checkbox('Leave imputed hours out', key='exceedance_observed')
+with timed('exceedance'):
+    hours = exceedance_hours(exceedance, exceeded, start=start_date, end=end_date, observed=observed_only)
+    hours = hours[hours.index.isin(window_stations)]
+    categories = category_hours(exceedance, exceeded, start=start_date, end=end_date, observed=observed_only)
+    categories = categories[categories.index.isin(window_stations)]
+with timed('figure exceedance'):
+    st.image(render_exceedance(hours, exceeded, THRESHOLDS[exceeded]), use_column_width=True)
+st.bar_chart(categories.rename(index=str))
+
+st.subheader('Pollutant Surface over Beijing City')
+st.caption('Monthly averages of the stations interpolated by inverse distance weighting')
+
+surface_grid = tables['surface_grid']
+surface_pollutant = st.radio('Pollutant', POLLUTANTS, horizontal=True, key='surface_pollutant')
+# Time x station matrix of the monthly averages, in the order of the stations of the grid
+surface_values = tables['correlations'].matrix('monthly_ey', surface_pollutant)[locsta['station'].astype(str)]
+with timed('surfaces'):
+    # Every month at once: one product with the weight matrix
+    surfaces = surface_grid.surfaces(surface_values.to_numpy())
+vmin, vmax = float(np.nanmin(surfaces)), float(np.nanmax(surfaces))
+surface_months = list(surface_values.index.strftime('%Y-%m'))
+if st.checkbox('Animate every month', key='surface_animate'):
+    with timed('figure surface_animation'):
+        st.image(render_surface_animation(locsta, surface_grid, surface_values, surfaces, vmin, vmax))
+else:
+    surface_month = st.select_slider('Month', surface_months, value=surface_months[-1], key='surface_month')
+    with timed('figure surface'):
+        st.image(render_surface(shp_beijing, locsta, surface_grid, surfaces[surface_months.index(surface_month)],
+                                f'{surface_pollutant} in {surface_month}', vmin, vmax), use_column_width=True)
 
 st.subheader('Correlation of Pollutant Gas/Materi Particulate to Rain')
 
-fig, ax = plt.subplots(figsize=(25, 15))
-sns.barplot(correlRainQI, color='red')
-plt.ylabel('')
-st.pyplot(fig)
\ No newline at end of file
+with timed('figure correlation'):
+    st.image(figure_cache().render(correlRainQI, {'chart': 'correlation'}, lambda: correlation_figure(correlRainQI)),
+             use_column_width=True)
+
+st.subheader('Correlation between Stations')
+st.caption('Choose the pollutant gas or materi particulate and the resolution')
+
+correlations = tables['correlations']
+cross_pollutant = st.radio('Pollutant', POLLUTANTS, horizontal=True, key='cross_pollutant')
+cross_resolution = st.radio('Resolution', ['Hourly', 'Daily', 'Monthly'], horizontal=True, key='cross_resolution')
+with timed('cross_station'):
+    cross = correlations.cross_station({'Hourly': 'hourly', 'Daily': 'daily', 'Monthly': 'monthly_ey'}[cross_resolution],
+                                       cross_pollutant)
+st.dataframe(cross.style.background_gradient(cmap='RdYlGn', vmin=-1, vmax=1).format('{:.2f}'), width=1000)
+
+st.caption(f'Correlation of the weather with {cross_pollutant} some hours later, in each station')
+driver = st.radio('Weather variable', ['WSPM', 'TEMP', 'DEWP', 'PRES', 'RAIN'], horizontal=True, key='lag_driver')
+with timed('lagged'):
+    lagged = correlations.lagged('hourly', driver, cross_pollutant, range(-24, 25))
+st.line_chart(lagged.rename(columns=str))
+
+st.subheader('Data Quality')
+st.caption('Observed hours of each station and month before imputation, from the scan stored with the data')
+
+with timed('load_quality'):
+    quality = load_quality_tables(version, store_dir)
+quality_variable = st.radio('Variable', MEASUREMENTS, horizontal=True, key='quality_variable')
+with timed('figure coverage'):
+    st.image(render_coverage(quality, quality_variable), use_column_width=True)
+
+col1, col2, col3 = st.columns(3)
+with col1:
+    runs = quality['gaps'][quality['gaps']['variable'] == quality_variable]
+    st.metric('Missing hours', f"{int(runs['length'].sum()):,}")
+with col2:
+    st.metric('Longest gap (hours)', int(runs['length'].max()) if len(runs) else 0)
+with col3:
+    outliers = quality['outliers'][quality['outliers']['variable'] == quality_variable]
+    st.metric('Outliers', f'{len(outliers):,}')
+st.dataframe(gap_summary(quality['gaps'], quality_variable), hide_index=True, width=1000)
+if len(quality['timestamps']):
+    st.caption('Duplicate, unordered and missing hours')
+    st.dataframe(quality['timestamps'], hide_index=True, width=1000)
+
+page.close()
+
+# Diagnostics: the steps of this run and the loaders of the process (run once per data version)
+if st.sidebar.checkbox('Show diagnostics'):
+    st.sidebar.caption(f'Session {session_id}, run {run}')
+    st.sidebar.dataframe(pd.DataFrame(TIMINGS.select(session=session_id, run=run)),
+                         column_order=['stage', 'seconds', 'rss_peak', 'rss_delta'], hide_index=True)
+    st.sidebar.caption('Loaders')
+    st.sidebar.dataframe(pd.DataFrame([record for record in TIMINGS.select() if 'session' not in record]),
+                         column_order=['stage', 'version', 'seconds', 'rss_peak', 'rss_delta'], hide_index=True)
+    st.sidebar.caption('JSON: add ?diagnostics=json to the page address')
\ No newline at end of file
@@ -0,0 +1,110 @@
+'''
+Level-of-detail downsampling of long time series for interactive charts.
+
+Both methods return the positions of the points to keep, always with the first and the
+last point, so a window of any length is drawn with a bounded number of points:
+
+    - lttb: Largest-Triangle-Three-Buckets, keeps the visual shape of the series,
+    - minmax: the lowest and the highest point of equal buckets, keeps every peak.
+'''
+import numpy as np
+import pandas as pd
+
+METHODS = ['lttb', 'minmax']
+
+
+def lttb(x, y, points):
+    '''
+    A function to pick points of a series with Largest-Triangle-Three-Buckets.
+    The average of every bucket is computed for all buckets at once with cumulative sums,
+    only the choice of the point of a bucket depends on the point chosen before it.
+
+    Args:
+        x (np.ndarray): The sorted x values (e.g. timestamps as numbers).
+        y (np.ndarray): The y values, without missing values.
+        points (int): The number of points to keep, at least 3.
+
+    Returns:
+        np.ndarray: The sorted positions of the kept points.
+    '''
+    n = len(x)
+    if points >= n or points < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype='float64')
+    y = np.asarray(y, dtype='float64')
+
+    # Bucket i (from 0 to points - 3) covers rows [edges[i], edges[i + 1]), the first and last rows are kept
+    edges = np.floor(np.arange(points - 1) * (n - 2) / (points - 2)).astype(np.int64) + 1
+    edges[-1] = n - 1
+    x_sums = np.concatenate([[0], np.cumsum(x)])
+    y_sums = np.concatenate([[0], np.cumsum(y)])
+    # The average point of the next bucket of every bucket, the last one is the last row
+    next_start = edges[1:]
+    next_end = np.append(edges[2:], n)
+    sizes = next_end - next_start
+    x_avg = (x_sums[next_end] - x_sums[next_start]) / sizes
+    y_avg = (y_sums[next_end] - y_sums[next_start]) / sizes
+
+    kept = np.empty(points, dtype=np.int64)
+    kept[0] = 0
+    kept[-1] = n - 1
+    a = 0
+    for i in range(points - 2):
+        start, end = edges[i], edges[i + 1]
+        area = np.abs((x[a] - x_avg[i]) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (y_avg[i] - y[a]))
+        a = start + int(area.argmax())
+        kept[i + 1] = a
+    return kept
+
+
+def minmax(y, points):
+    '''
+    A function to pick the lowest and the highest point of equal buckets of a series.
+
+    Args:
+        y (np.ndarray): The y values, without missing values.
+        points (int): The maximum number of points to keep.
+
+    Returns:
+        np.ndarray: The sorted positions of the kept points.
+    '''
+    n = len(y)
+    buckets = max(points // 2 - 1, 1)
+    if n <= points:
+        return np.arange(n)
+    ids = np.arange(n) * buckets // n
+    # Sorted by bucket, then by value: the first and last rows of a bucket are its minimum and maximum
+    order = np.lexsort((y, ids))
+    starts = np.searchsorted(ids, np.arange(buckets))
+    ends = np.append(starts[1:], n) - 1
+    return np.unique(np.concatenate([[0, n - 1], order[starts], order[ends]]))
+
+
+def downsample(series, points, method='lttb'):
+    '''
+    A function to downsample a time series to a bounded number of points.
+
+    Args:
+        series (pd.Series): The values indexed by a sorted DatetimeIndex.
+        points (int): The maximum number of points to keep.
+        method (str): A method of METHODS.
+
+    Returns:
+        pd.Series: The kept points of the series, missing values are dropped.
+    '''
+    series = series.dropna()
+    if method == 'lttb':
+        kept = lttb(series.index.asi8, series.to_numpy(), points)
+    elif method == 'minmax':
+        kept = minmax(series.to_numpy(), points)
+    else:
+        raise ValueError(f'unknown method {method!r}, expected one of {METHODS}')
+    return series.iloc[kept]
+
+
+def window(series, start, end):
+    ''' The values of a series indexed by a sorted DatetimeIndex between two timestamps, found by binary search. '''
+    index = series.index
+    lo = index.searchsorted(pd.Timestamp(start), side='left')
+    hi = index.searchsorted(pd.Timestamp(end), side='right')
+    return series.iloc[lo:hi]
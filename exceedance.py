@@ -0,0 +1,180 @@
+'''
+The exceedance cube: hours of every station, month and pollutant in every concentration band.
+
+The bands of a pollutant are bounded by the breakpoints of the Chinese AQI categories
+(HJ 633-2012, 24-hour values except O3, 1-hour values; CO in ug/m3 like the data) and by
+the air quality standards of THRESHOLDS, a band (lower, upper] holds the values above its
+lower and up to its upper edge. The cube is built in one bincount pass per pollutant and
+the counts are additive, so the hours of any category or above any threshold, over any
+stations and months, are sums of cells of the cube instead of scans of the hourly rows.
+
+    ========  ========  ===============================================================
+    column    dtype     note
+    ========  ========  ===============================================================
+    station   category
+    month     datetime  first day of the month
+    pollutant category  CUBE_POLLUTANTS
+    band      int8      index of the band of the pollutant, 0 for the lowest values
+    hours     int32     hours in the band
+    imputed   int32     of which filled by the imputation (see imputation.MASK_COLUMN)
+    ========  ========  ===============================================================
+
+Only the cells with hours are kept. Bump cache.CACHE_VERSION when the edges change.
+'''
+import numpy as np
+import pandas as pd
+
+from imputation import mask_bit, MASK_COLUMN
+
+CATEGORIES = ['Excellent', 'Good', 'Lightly polluted', 'Moderately polluted', 'Heavily polluted',
+              'Severely polluted']
+
+# The upper concentration of every category but the last
+BREAKPOINTS = {
+    'PM2.5': [35, 75, 115, 150, 250],
+    'PM10': [50, 150, 250, 350, 420],
+    'SO2': [50, 150, 475, 800, 1600],
+    'NO2': [40, 80, 180, 280, 565],
+    'CO': [2000, 4000, 14000, 24000, 36000],
+    'O3': [160, 200, 300, 400, 800],
+}
+
+# The air quality standards (Grade II), hours above them are exceedance hours
+THRESHOLDS = {
+    'PM2.5': 75,
+    'PM10': 150,
+    'O3': 200,
+}
+
+CUBE_POLLUTANTS = list(BREAKPOINTS)
+
+
+def band_edges(pollutant):
+    ''' The upper edges of the bands of a pollutant but the last: its breakpoints and threshold. '''
+    edges = set(BREAKPOINTS[pollutant])
+    if pollutant in THRESHOLDS:
+        edges.add(THRESHOLDS[pollutant])
+    return sorted(edges)
+
+
+def exceedance_cube(data, pollutants=CUBE_POLLUTANTS):
+    '''
+    A function to count the hours of every station, month and pollutant in every band.
+
+    Args:
+        data (pd.DataFrame): The prepared hourly data indexed by the hourly datetime.
+        pollutants (list): The pollutants of BREAKPOINTS.
+
+    Returns:
+        pd.DataFrame: The cells of the cube with hours, see the columns above.
+    '''
+    station_dtype = data['station'].dtype
+    stations = data['station'].cat.codes.to_numpy().astype(np.int64)
+    months = data.index.to_numpy(dtype='datetime64[ns]').astype('datetime64[M]')
+    first = months.min() if len(months) else np.datetime64('1970-01', 'M')
+    month_ids = (months - first).astype(np.int64)
+    n_months = int(month_ids.max()) + 1 if len(month_ids) else 0
+    cells = stations * n_months + month_ids
+    n_cells = len(station_dtype.categories) * n_months
+    mask = data[MASK_COLUMN].to_numpy() if MASK_COLUMN in data.columns else None
+
+    frames = []
+    for pollutant in pollutants:
+        edges = band_edges(pollutant)
+        n_bands = len(edges) + 1
+        values = data[pollutant].to_numpy(dtype='float64')
+        valid = ~np.isnan(values)
+        ids = (cells * n_bands + np.searchsorted(edges, values, side='left'))[valid]
+        hours = np.bincount(ids, minlength=n_cells * n_bands)
+        imputed = np.zeros_like(hours)
+        if mask is not None:
+            filled = (mask[valid] & mask_bit(pollutant)) != 0
+            imputed = np.bincount(ids[filled], minlength=n_cells * n_bands)
+        kept = np.flatnonzero(hours)
+        cell, band = np.divmod(kept, n_bands)
+        station, month = np.divmod(cell, max(n_months, 1))
+        frames.append(pd.DataFrame({
+            'station': pd.Categorical.from_codes(station, dtype=station_dtype),
+            'month': (first + month.astype('timedelta64[M]')).astype('datetime64[ns]'),
+            'pollutant': pollutant,
+            'band': band.astype('int8'),
+            'hours': hours[kept].astype('int32'),
+            'imputed': imputed[kept].astype('int32'),
+        }))
+    cube = pd.concat(frames, ignore_index=True)
+    cube['pollutant'] = cube['pollutant'].astype(pd.CategoricalDtype(list(BREAKPOINTS)))
+    return cube
+
+
+def merge_cubes(cubes):
+    ''' A function to add up the cubes of several chunks of hourly rows. '''
+    cube = pd.concat([cube for cube in cubes if cube is not None], ignore_index=True)
+    cube['station'] = cube['station'].astype(cubes[0]['station'].dtype)
+    return cube.groupby(['station', 'month', 'pollutant', 'band'], observed=True, sort=True)[
+        ['hours', 'imputed']].sum().reset_index()
+
+
+def _select(cube, pollutant, start=None, end=None, observed=False):
+    ''' The cells of a pollutant between two months, both included, with the hours counted. '''
+    cells = cube[cube['pollutant'] == pollutant]
+    if start is not None:
+        cells = cells[cells['month'] >= pd.Timestamp(start).to_period('M').to_timestamp()]
+    if end is not None:
+        cells = cells[cells['month'] <= pd.Timestamp(end).to_period('M').to_timestamp()]
+    hours = cells['hours'] - cells['imputed'] if observed else cells['hours']
+    return cells, hours
+
+
+def category_hours(cube, pollutant, by='station', start=None, end=None, observed=False):
+    '''
+    A function to look up the hours of every AQI category of a pollutant.
+
+    Args:
+        cube (pd.DataFrame): The cube returned by exceedance_cube.
+        pollutant (str): The pollutant.
+        by (str): The column of the rows, 'station' or 'month'.
+        start: The first month, None for the first one.
+        end: The last month, None for the last one.
+        observed (bool): Leave the hours filled by the imputation out.
+
+    Returns:
+        pd.DataFrame: One row per station (or month) and one column per category of CATEGORIES.
+    '''
+    cells, hours = _select(cube, pollutant, start, end, observed)
+    # The band of a threshold between two breakpoints belongs to the category of its upper edge
+    edges = band_edges(pollutant)
+    upper = np.append(edges, np.inf)[cells['band'].to_numpy()]
+    category = np.searchsorted(BREAKPOINTS[pollutant], upper, side='left')
+    table = pd.DataFrame({by: cells[by].to_numpy(), 'category': category, 'hours': hours.to_numpy()})
+    table = table.pivot_table(index=by, columns='category', values='hours', aggfunc='sum', fill_value=0,
+                              observed=True)
+    table = table.reindex(columns=range(len(CATEGORIES)), fill_value=0)
+    table.columns = CATEGORIES
+    return table
+
+
+def exceedance_hours(cube, pollutant, threshold=None, by='station', start=None, end=None, observed=False):
+    '''
+    A function to look up the hours of a pollutant above a threshold.
+
+    Args:
+        cube (pd.DataFrame): The cube returned by exceedance_cube.
+        pollutant (str): The pollutant.
+        threshold (float): An edge of band_edges(pollutant), None for the standard of THRESHOLDS.
+        by (str): The column of the rows, 'station' or 'month'.
+        start: The first month, None for the first one.
+        end: The last month, None for the last one.
+        observed (bool): Leave the hours filled by the imputation out.
+
+    Returns:
+        pd.Series: The hours above the threshold by station (or month), sorted from the most.
+    '''
+    threshold = THRESHOLDS[pollutant] if threshold is None else threshold
+    edges = band_edges(pollutant)
+    if threshold not in edges:
+        raise ValueError(f'{pollutant} hours can only be counted above one of {edges}, not {threshold}')
+    cells, hours = _select(cube, pollutant, start, end, observed)
+    above = cells['band'].to_numpy() > edges.index(threshold)
+    result = pd.Series(np.where(above, hours, 0), index=cells[by].to_numpy()).groupby(level=0, observed=True).sum()
+    result.index.name = by
+    return result.rename(f'{pollutant} > {threshold:g}').sort_values(ascending=False, kind='stable')
@@ -0,0 +1,169 @@
+import glob
+import hashlib
+import json
+import os
+import threading
+
+import cachetools
+import pandas as pd
+
+from cache import CACHE_DIR
+from charts import to_png
+
+FIGURE_DIR = os.path.join(CACHE_DIR, 'figures')
+
+# Bump when the plotting code changes so stored images are not served for the new charts
+CHART_VERSION = 2
+
+# The file recording the chart version of the stored images
+VERSION_FILE = 'VERSION'
+
+
+def content_hash(data):
+    '''
+    A function to hash the contents of the inputs of a chart.
+
+    Args:
+        data: A DataFrame, a Series, or a list/tuple/dict of them (other values are hashed from their repr).
+
+    Returns:
+        str: The hexadecimal SHA-256 of the contents.
+    '''
+    digest = hashlib.sha256()
+
+    def update(value):
+        if isinstance(value, (pd.DataFrame, pd.Series)):
+            frame = value.to_frame() if isinstance(value, pd.Series) else value
+            # Geometries are hashed from their WKB
+            if hasattr(frame, 'to_wkb'):
+                frame = pd.DataFrame(frame.to_wkb())
+            digest.update(repr((type(value).__name__, list(frame.columns), [str(dtype) for dtype in frame.dtypes])).encode())
+            digest.update(pd.util.hash_pandas_object(frame, index=True).to_numpy().tobytes())
+        elif isinstance(value, (list, tuple)):
+            for item in value:
+                update(item)
+        elif isinstance(value, dict):
+            for name in sorted(value):
+                digest.update(str(name).encode())
+                update(value[name])
+        else:
+            digest.update(repr(value).encode())
+
+    update(data)
+    return digest.hexdigest()
+
+
+class FigureCache:
+    '''
+    A cache of rendered charts.
+    Images are keyed by the hash of the chart inputs and of the plot spec, kept in memory
+    in an LRU cache bounded in bytes and stored on disk, where the least recently used
+    files are removed past a size limit. Figures are closed as soon as they are rendered.
+
+    Args:
+        directory (str): The directory of the stored images, None to keep them in memory only.
+        memory_bytes (int): The size limit of the images kept in memory.
+        disk_bytes (int): The size limit of the images stored on disk.
+    '''
+
+    def __init__(self, directory=FIGURE_DIR, memory_bytes=64 * 2**20, disk_bytes=512 * 2**20):
+        self.directory = directory
+        self.disk_bytes = disk_bytes
+        self.memory = cachetools.LRUCache(maxsize=memory_bytes, getsizeof=len)
+        self.lock = threading.Lock()
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            self._check_version()
+
+    def key(self, data, spec):
+        ''' The key of a chart, from the hash of its inputs and its plot spec. '''
+        spec = json.dumps({'chart_version': CHART_VERSION, 'spec': spec}, sort_keys=True, default=str)
+        return hashlib.sha256((content_hash(data) + spec).encode()).hexdigest()[:32]
+
+    def _check_version(self):
+        ''' Remove the images stored by another chart version once, then record the current one. '''
+        marker = os.path.join(self.directory, VERSION_FILE)
+        try:
+            with open(marker) as file:
+                version = file.read().strip()
+        except FileNotFoundError:
+            version = None
+        if version == str(CHART_VERSION):
+            return
+        for path in glob.glob(os.path.join(self.directory, '*')):
+            if os.path.basename(path) != VERSION_FILE:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+        tmp = f'{marker}.{os.getpid()}.tmp'
+        with open(tmp, 'w') as file:
+            file.write(str(CHART_VERSION))
+        os.replace(tmp, marker)
+
+    def path(self, key):
+        return os.path.join(self.directory, f'{key}.img')
+
+    def render(self, data, spec, draw, encode=to_png):
+        '''
+        A function to get the PNG image of a chart, drawing it only when it is not cached.
+
+        Args:
+            data: The inputs of the chart (see content_hash).
+            spec (dict): The plot spec: the chart name and every option changing the image.
+            draw (callable): A function without arguments returning the matplotlib figure.
+            encode (callable): A function turning the result of draw into the image bytes.
+
+        Returns:
+            bytes: The image, PNG by default.
+        '''
+        key = self.key(data, spec)
+        with self.lock:
+            image = self.memory.get(key)
+        if image is not None:
+            return image
+
+        image = self._read(key)
+        if image is None:
+            image = encode(draw())
+            self._write(key, image)
+        with self.lock:
+            self.memory[key] = image
+        return image
+
+    def _read(self, key):
+        if not self.directory or not os.path.exists(self.path(key)):
+            return None
+        with open(self.path(key), 'rb') as file:
+            image = file.read()
+        # The modification time records the last use for the eviction
+        os.utime(self.path(key))
+        return image
+
+    def _write(self, key, image):
+        if not self.directory:
+            return
+        tmp = f'{self.path(key)}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp, 'wb') as file:
+            file.write(image)
+        os.replace(tmp, self.path(key))
+        self._evict()
+
+    def _evict(self):
+        ''' Remove the least recently used images until the directory fits in disk_bytes. '''
+        files = []
+        for path in glob.glob(os.path.join(self.directory, '*.img')):
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.disk_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
@@ -0,0 +1,201 @@
+'''
+Time-series fill strategies of the hourly data.
+
+    ============  ==========================================================
+    strategy      fill
+    ============  ==========================================================
+    mean          nothing here, the (station, hour) average of imputation
+    interpolate   linear in time inside gaps of at most MAX_GAP hours
+    seasonal      average of the same hour over SEASONAL_DAYS days around
+    neighbor      value of the most correlated station at the same time,
+                  shifted by the difference of the averages of both stations
+    ============  ==========================================================
+
+Every strategy works on the rows of one station at a time (the neighbor strategy after
+one pass building the time x station matrices), and the stations run in a thread pool.
+The gaps a strategy leaves, e.g. at the edges of a series or longer than MAX_GAP, are
+filled by the (station, hour) average afterwards (see imputation.impute).
+'''
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from correlation import pearson_matrix
+
+STRATEGIES = ['mean', 'interpolate', 'seasonal', 'neighbor']
+
+# The longest gap filled by interpolation, in rows (hours)
+MAX_GAP = 72
+
+# The width of the window of the seasonal average, centered on the missing hour
+SEASONAL_DAYS = 31
+
+# The number of stations a station borrows from, the most correlated first
+NEIGHBORS = 3
+
+_HOUR = np.timedelta64(1, 'h')
+
+
+def station_positions(data):
+    ''' The positions of the rows of every station, sorted by time. '''
+    times = data.index.to_numpy()
+    positions = data.groupby('station', observed=True).indices
+    return {station: rows[np.argsort(times[rows], kind='stable')] for station, rows in positions.items()}
+
+
+def gap_lengths(missing):
+    '''
+    A function to measure the run of missing values every missing value belongs to.
+
+    Args:
+        missing (np.ndarray): True where a value is missing.
+
+    Returns:
+        np.ndarray: The length of the run of every missing value, 0 for the values present.
+    '''
+    starts = missing & ~np.concatenate([[False], missing[:-1]])
+    runs = np.cumsum(starts) * missing
+    return np.where(missing, np.bincount(runs)[runs], 0)
+
+
+def interpolate_values(values, times, max_gap=MAX_GAP):
+    '''
+    A function to interpolate the gaps of the series of one station linearly in time.
+
+    Args:
+        values (np.ndarray): The values, one row per hour sorted by time and one column per variable.
+        times (np.ndarray): The datetime of every row.
+        max_gap (int): The longest gap filled, in rows.
+
+    Returns:
+        np.ndarray: The filled values, missing outside the series and in longer gaps.
+    '''
+    hours = (times - times[0]) / _HOUR
+    filled = values.copy()
+    for j in range(values.shape[1]):
+        missing = np.isnan(values[:, j])
+        if not missing.any() or missing.all():
+            continue
+        known = hours[~missing]
+        fill = np.interp(hours[missing], known, values[~missing, j])
+        inside = (hours[missing] > known[0]) & (hours[missing] < known[-1])
+        short = gap_lengths(missing)[missing] <= max_gap
+        filled[missing, j] = np.where(inside & short, fill, np.nan)
+    return filled
+
+
+def seasonal_values(values, times, days=SEASONAL_DAYS):
+    '''
+    A function to fill the series of one station with the average of the same hour over a window of days.
+    The windows of every row are found by binary search on (hour, time) and averaged with prefix sums.
+
+    Args:
+        values (np.ndarray): The values, one row per hour sorted by time and one column per variable.
+        times (np.ndarray): The datetime of every row.
+        days (int): The width of the window, centered on the row.
+
+    Returns:
+        np.ndarray: The filled values, missing where the window has no value.
+    '''
+    hours = ((times - times[0]) / _HOUR).astype(np.int64)
+    hour_of_day = times.astype('datetime64[h]').astype(np.int64) % 24
+    # Rows of the same hour of the day are contiguous and sorted by time in this order
+    keys = hour_of_day * 10**9 + hours
+    order = np.argsort(keys, kind='stable')
+    keys = keys[order]
+    half = days * 24 // 2
+    lo = np.searchsorted(keys, keys - half, side='left')
+    hi = np.searchsorted(keys, keys + half, side='right')
+
+    sorted_values = values[order]
+    present = ~np.isnan(sorted_values)
+    sums = np.vstack([np.zeros(values.shape[1]), np.cumsum(np.where(present, sorted_values, 0), axis=0)])
+    counts = np.vstack([np.zeros(values.shape[1]), np.cumsum(present, axis=0)])
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means = (sums[hi] - sums[lo]) / (counts[hi] - counts[lo])
+
+    filled = values.copy()
+    missing = np.isnan(sorted_values)
+    sorted_filled = np.where(missing, means, sorted_values)
+    filled[order] = sorted_filled
+    return filled
+
+
+def neighbor_values(wide, rows, station, correlations, means, neighbors=NEIGHBORS):
+    '''
+    A function to fill the series of one station from the most correlated stations.
+
+    Args:
+        wide (np.ndarray): The time x station matrix of one variable.
+        rows (np.ndarray): The rows of the matrix of the station's values.
+        station (int): The column of the station.
+        correlations (np.ndarray): The station x station correlation matrix of the variable.
+        means (np.ndarray): The average of every station.
+        neighbors (int): The number of stations borrowed from.
+
+    Returns:
+        np.ndarray: The filled values, missing where no neighbor has a value.
+    '''
+    ranking = np.where(np.isnan(correlations[station]), -np.inf, correlations[station])
+    ranking[station] = -np.inf
+    order = [other for other in np.argsort(-ranking, kind='stable')[:neighbors] if np.isfinite(ranking[other])]
+    filled = wide[rows, station].copy()
+    for other in order:
+        missing = np.isnan(filled)
+        filled[missing] = wide[rows[missing], other] + (means[station] - means[other])
+    return filled
+
+
+def fill_gaps(data, variables, strategy='mean', max_workers=None):
+    '''
+    A function to fill the missing values of float variables with a time-series strategy.
+    The values a strategy cannot fill stay missing.
+
+    Args:
+        data (pd.DataFrame): The hourly data indexed by the hourly datetime, with a station column.
+        variables (list): The float variables to fill.
+        strategy (str): A strategy of STRATEGIES.
+        max_workers (int): The number of threads filling stations in parallel (default: chosen by ThreadPoolExecutor).
+
+    Returns:
+        pd.DataFrame: The DataFrame, filled in place.
+    '''
+    if strategy not in STRATEGIES:
+        raise ValueError(f'unknown imputation strategy {strategy!r}, expected one of {STRATEGIES}')
+    if strategy == 'mean' or not variables or data.empty:
+        return data
+
+    positions = station_positions(data)
+    times = data.index.to_numpy()
+    values = data[variables].to_numpy(dtype='float64')
+    filled = values.copy()
+
+    if strategy == 'neighbor':
+        grid = np.unique(times)
+        stations = list(positions)
+        rows = {station: np.searchsorted(grid, times[positions[station]]) for station in stations}
+        for j in range(len(variables)):
+            wide = np.full((len(grid), len(stations)), np.nan)
+            for s, station in enumerate(stations):
+                wide[rows[station], s] = values[positions[station], j]
+            correlations = pearson_matrix(wide)
+            means = np.nanmean(wide, axis=0)
+
+            def fill_station(s):
+                station = stations[s]
+                filled[positions[station], j] = neighbor_values(wide, rows[station], s, correlations, means)
+
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                list(executor.map(fill_station, range(len(stations))))
+    else:
+        fill = interpolate_values if strategy == 'interpolate' else seasonal_values
+
+        def fill_station(rows):
+            filled[rows] = fill(values[rows], times[rows])
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            list(executor.map(fill_station, positions.values()))
+
+    for j, variable in enumerate(variables):
+        data[variable] = filled[:, j].astype(data[variable].dtype)
+    return data
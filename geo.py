@@ -0,0 +1,91 @@
+import geopandas as gpd
+import matplotlib.pyplot as plt
+import pandas as pd
+import seaborn as sns
+
+SHAPE_FILE = 'gadm41_CHN_shp/gadm41_CHN_3_Beijing.shp'
+
+# Simplification tolerance of the boundary in degrees (about 200 m), far below what the maps can show
+BOUNDARY_TOLERANCE = 0.002
+
+
+def load_boundary(path=SHAPE_FILE, tolerance=BOUNDARY_TOLERANCE):
+    '''
+    A function to load the district boundaries of Beijing City and simplify them for plotting.
+
+    Args:
+        path (str): The shape file.
+        tolerance (float): The simplification tolerance in degrees, 0 keeps the original polygons.
+
+    Returns:
+        gpd.GeoDataFrame: The district names and simplified polygons.
+    '''
+    boundary = gpd.read_file(path)[['NAME_3', 'geometry']]
+    if tolerance:
+        boundary['geometry'] = boundary.geometry.simplify(tolerance, preserve_topology=True)
+    return boundary
+
+
+def station_points(locsta):
+    '''
+    A function to build the station locations as points, one row per station.
+
+    Args:
+        locsta (pd.DataFrame): The longitude and latitude of the stations.
+
+    Returns:
+        gpd.GeoDataFrame: The station locations with a point geometry.
+    '''
+    return gpd.GeoDataFrame(locsta, geometry=gpd.points_from_xy(locsta['lon'], locsta['lat']), crs='EPSG:4326')
+
+
+def station_map(boundary, points, hue, figsize=(10, 10)):
+    '''
+    A function to plot the stations over the boundaries of Beijing City.
+
+    Args:
+        boundary (gpd.GeoDataFrame): The boundaries of Beijing City.
+        points (gpd.GeoDataFrame): The station locations.
+        hue (str): The column coloring the stations.
+        figsize (tuple): The size of the figure in inches.
+
+    Returns:
+        matplotlib.figure.Figure: The map.
+    '''
+    fig, ax = plt.subplots(figsize=figsize)
+    boundary.plot(ax=ax, color='lightgray')
+
+    data = pd.DataFrame({'lon': points['lon'], 'lat': points['lat'], hue: points[hue].astype(str)})
+    ax.scatter(data['lon'], data['lat'])
+    sns.scatterplot(x='lon', y='lat', hue=hue, data=data, palette='husl', ax=ax)
+    ax.set_xlabel('')
+    ax.set_ylabel('')
+    ax.legend()
+    return fig
+
+
+def surface_map(boundary, points, raster, extent, title, vmin=None, vmax=None):
+    '''
+    A function to plot an interpolated surface over the boundaries of Beijing City.
+
+    Args:
+        boundary (gpd.GeoDataFrame): The boundaries of Beijing City.
+        points (gpd.GeoDataFrame): The station locations.
+        raster (np.ndarray): The grid of the surface, one row per latitude from north to south (see surface.IDWGrid).
+        extent (tuple): The west, east, south and north edges of the grid.
+        title (str): The title.
+        vmin (float): The value of the lowest color, None for the lowest value.
+        vmax (float): The value of the highest color, None for the highest value.
+
+    Returns:
+        matplotlib.figure.Figure: The map.
+    '''
+    fig, ax = plt.subplots(figsize=(10, 10))
+    image = ax.imshow(raster, extent=extent, origin='upper', cmap='RdYlGn_r', vmin=vmin, vmax=vmax)
+    boundary.boundary.plot(ax=ax, color='gray', linewidth=0.3)
+    ax.scatter(points['lon'], points['lat'], color='black', s=15)
+    fig.colorbar(image, ax=ax, shrink=0.6)
+    ax.set_title(title)
+    ax.set_xlabel('')
+    ax.set_ylabel('')
+    return fig
@@ -0,0 +1,188 @@
+import numpy as np
+import pandas as pd
+
+from aggregation import mode, mode_of_counts
+from gap_filling import fill_gaps
+from rollups import partial_columns, partials
+
+# Variables filled with their (station, hour) average and with their (station, hour) mode
+MEAN_VARIABLES = ['PM2.5', 'PM10', 'SO2', 'NO2', 'CO', 'O3', 'TEMP', 'PRES', 'DEWP', 'WSPM']
+MODE_VARIABLES = ['wd']
+GROUP_KEYS = ['station', 'hour']
+
+# One bit per variable in the imputation mask, set where the value was filled
+MASK_COLUMN = 'imputed'
+MASK_VARIABLES = MEAN_VARIABLES + MODE_VARIABLES
+
+
+def mask_bit(variable):
+    ''' The bit of a variable in the imputation mask. '''
+    return np.int16(1 << MASK_VARIABLES.index(variable))
+
+
+def record_mask(data, variables):
+    '''
+    A function to record the missing values of variables in the imputation mask, before they are filled.
+
+    Args:
+        data (pd.DataFrame): The DataFrame containing missing values.
+        variables (list): The variables to record, of MASK_VARIABLES.
+
+    Returns:
+        pd.DataFrame: The DataFrame with the MASK_COLUMN column (int16).
+    '''
+    mask = np.zeros(len(data), dtype=np.int16)
+    if MASK_COLUMN in data.columns:
+        mask |= data[MASK_COLUMN].to_numpy(dtype=np.int16)
+    for variable in variables:
+        mask[data[variable].isna().to_numpy()] |= mask_bit(variable)
+    data[MASK_COLUMN] = mask
+    return data
+
+
+def imputed(data, variable):
+    ''' True where the value of a variable was filled, from the imputation mask. '''
+    return (data[MASK_COLUMN].to_numpy() & mask_bit(variable)) != 0
+
+
+def observed(data, variables=MASK_VARIABLES):
+    '''
+    A function to blank the filled values again, so aggregates only count the observations.
+
+    Args:
+        data (pd.DataFrame): The imputed DataFrame with the MASK_COLUMN column.
+        variables (list): The variables to blank.
+
+    Returns:
+        pd.DataFrame: A copy with the filled values of the variables missing.
+    '''
+    data = data.copy()
+    for variable in variables:
+        data[variable] = data[variable].mask(imputed(data, variable))
+    return data
+
+
+def group_means(data, variables=MEAN_VARIABLES, keys=GROUP_KEYS):
+    ''' The average of every variable over the group of every row, in one groupby pass. '''
+    return data.groupby(keys, observed=True, sort=False)[variables].transform('mean')
+
+
+def imputation_mean(data, variables=MEAN_VARIABLES, keys=GROUP_KEYS, means=None):
+    '''
+    A function of filling the values of missing values with its average.
+    All variables are filled in one groupby pass over the station and recording time.
+
+    Args:
+        data (pd.DataFrame): The DataFrame containing missing values.
+        variables (list): A list of variable names (column names) to impute.
+        keys (list): The columns defining a group (station and recording time).
+        means (pd.DataFrame): The averages returned by group_means, None to compute them from data.
+
+    Returns:
+        pd.DataFrame: The DataFrame with missing values filled by mean for specified conditions.
+    '''
+    if means is None:
+        means = group_means(data, variables, keys)
+    data[variables] = data[variables].fillna(means)
+    return data
+
+
+def imputation_modus(data, variables=MODE_VARIABLES, keys=GROUP_KEYS):
+    '''
+    A function of filling the values of missing values with its mode.
+    The modes of every group are counted with one bincount (see aggregation.mode) and
+    ties are broken by the lowest category code, like impute_from_stats, so the rows of a
+    cold build, of a streaming build and of an append are filled the same way.
+
+    Args:
+        data (pd.DataFrame): The DataFrame containing missing values.
+        variables (list): A list of variable names (column names) to impute.
+        keys (list): The columns defining a group (station and recording time).
+
+    Returns:
+        pd.DataFrame: The DataFrame with missing values filled by mode for specified conditions.
+    '''
+    group_ids = data.groupby(keys, observed=True, sort=False).ngroup().to_numpy()
+    n_groups = int(group_ids.max()) + 1 if len(group_ids) else 0
+    for variable in variables:
+        modus = mode(data[variable], group_ids, n_groups)
+        data[variable] = data[variable].fillna(pd.Series(modus.take(group_ids), index=data.index))
+    return data
+
+
+def impute(data, mean_variables=MEAN_VARIABLES, mode_variables=MODE_VARIABLES, keys=GROUP_KEYS, strategy='mean'):
+    '''
+    A function to fill every missing value of the hourly data.
+    The filled values are recorded in the imputation mask first, then the mean variables
+    are filled with the strategy and what it leaves with their average.
+
+    Args:
+        data (pd.DataFrame): The DataFrame containing missing values.
+        mean_variables (list): Variables filled with the strategy, then with their average.
+        mode_variables (list): Variables filled with their mode.
+        keys (list): The columns defining a group (station and recording time).
+        strategy (str): A strategy of gap_filling.STRATEGIES.
+
+    Returns:
+        pd.DataFrame: The DataFrame with missing values filled and the MASK_COLUMN column.
+    '''
+    record_mask(data, mean_variables + mode_variables)
+    # The averages of the observed values, before the strategy fills some of them
+    means = group_means(data, mean_variables, keys)
+    fill_gaps(data, mean_variables, strategy)
+    imputation_mean(data, mean_variables, keys, means)
+    imputation_modus(data, mode_variables, keys)
+    return data
+
+
+def imputation_stats(data, mean_variables=MEAN_VARIABLES, mode_variables=MODE_VARIABLES, keys=GROUP_KEYS):
+    '''
+    A function to compute the imputation statistics as mergeable partial aggregates.
+    Means are kept as sums and counts and modes as histograms, so the statistics of new
+    observations can be added to them without reading the history again.
+
+    Args:
+        data (pd.DataFrame): The DataFrame before imputation.
+        mean_variables (list): Variables filled with their average.
+        mode_variables (list): Variables filled with their mode.
+        keys (list): The columns defining a group (station and recording time).
+
+    Returns:
+        pd.DataFrame: One row per group with the keys and the partial columns (see rollups).
+    '''
+    spec = {variable: 'mean' for variable in mean_variables}
+    spec.update({variable: 'mode' for variable in mode_variables})
+    return partials(data, keys, spec)
+
+
+def impute_from_stats(data, stats, mean_variables=MEAN_VARIABLES, mode_variables=MODE_VARIABLES,
+                      keys=GROUP_KEYS, strategy='mean'):
+    '''
+    A function to fill missing values from precomputed imputation statistics.
+    Modes computed from the histograms break ties by the lowest category code.
+    The strategy only sees the rows given, e.g. one chunk of the hourly data.
+
+    Args:
+        data (pd.DataFrame): The DataFrame containing missing values.
+        stats (pd.DataFrame): The statistics returned by imputation_stats.
+        mean_variables (list): Variables filled with the strategy, then with their average.
+        mode_variables (list): Variables filled with their mode.
+        keys (list): The columns defining a group (station and recording time).
+        strategy (str): A strategy of gap_filling.STRATEGIES.
+
+    Returns:
+        pd.DataFrame: The DataFrame with missing values filled and the MASK_COLUMN column.
+    '''
+    record_mask(data, mean_variables + mode_variables)
+    fill_gaps(data, mean_variables, strategy)
+    rows = data[keys].merge(stats, on=keys, how='left')
+    for variable in mean_variables:
+        with np.errstate(invalid='ignore', divide='ignore'):
+            means = (rows[f'{variable}_sum'] / rows[f'{variable}_count']).to_numpy()
+        data[variable] = data[variable].fillna(pd.Series(means, index=data.index, dtype=data[variable].dtype))
+    for variable in mode_variables:
+        dtype = data[variable].dtype
+        counts = rows[partial_columns(variable, 'mode', dtype)].fillna(0).to_numpy()
+        modus = pd.Categorical.from_codes(mode_of_counts(counts), dtype=dtype)
+        data[variable] = data[variable].fillna(pd.Series(modus, index=data.index))
+    return data
@@ -0,0 +1,81 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from schema import csv_dtypes, station_name
+
+
+def build_dates(data):
+    '''
+    A function to build the hourly datetime from the time parts.
+    The dates are computed with numpy datetime arithmetic instead of parsing.
+
+    Args:
+        data (pd.DataFrame): The DataFrame with year, month, day and hour columns.
+
+    Returns:
+        np.ndarray: The hourly datetimes.
+    '''
+    months = (data['year'].to_numpy(np.int64) - 1970) * 12 + data['month'].to_numpy(np.int64) - 1
+    date = months.astype('datetime64[M]').astype('datetime64[D]') + (data['day'].to_numpy(np.int64) - 1)
+    date_h = date.astype('datetime64[h]') + data['hour'].to_numpy(np.int64)
+    return date_h.astype('datetime64[ns]')
+
+
+def read_station(path, dtypes, columns):
+    '''
+    A function to read the CSV file of one station with an explicit schema.
+
+    Args:
+        path (str): The path of the CSV file.
+        dtypes (dict): The dtype of every column.
+        columns (list): The columns of the returned DataFrame, in order.
+
+    Returns:
+        pd.DataFrame: The hourly data of the station.
+    '''
+    data = pd.read_csv(path, usecols=list(dtypes), dtype=dtypes)
+    data['date_h'] = build_dates(data)
+    return data.reindex(columns=columns)
+
+
+def read_station_chunks(path, dtypes, columns, chunksize=None):
+    '''
+    A function to read the CSV file of one station in chunks of rows.
+
+    Args:
+        path (str): The path of the CSV file.
+        dtypes (dict): The dtype of every column.
+        columns (list): The columns of the returned DataFrames, in order.
+        chunksize (int): The number of rows of a chunk, None to read the whole file at once.
+
+    Returns:
+        generator: The hourly data of the station, one DataFrame per chunk.
+    '''
+    if chunksize is None:
+        yield read_station(path, dtypes, columns)
+        return
+    with pd.read_csv(path, usecols=list(dtypes), dtype=dtypes, chunksize=chunksize) as reader:
+        for data in reader:
+            data['date_h'] = build_dates(data)
+            yield data.reindex(columns=columns)
+
+
+def read_stations(paths, columns, max_workers=None):
+    '''
+    A function to read the CSV files of all stations concurrently and join them.
+    The files are parsed in a thread pool and concatenated once.
+
+    Args:
+        paths (list): The paths of the CSV files.
+        columns (list): The columns of the returned DataFrame, in order.
+        max_workers (int): The number of reading threads (default: chosen by ThreadPoolExecutor).
+
+    Returns:
+        pd.DataFrame: The hourly data of all stations.
+    '''
+    dtypes = csv_dtypes([station_name(path) for path in paths])
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        all_data = list(executor.map(lambda path: read_station(path, dtypes, columns), paths))
+    return pd.concat(all_data, axis=0, ignore_index=True)
@@ -0,0 +1,159 @@
+'''
+Timers and peak memory sampling of the pipeline stages.
+
+Every stage run inside Timings.stage is recorded with its elapsed seconds and the peak
+resident memory of the process sampled while it ran, kept in a bounded history and
+logged as one JSON line on the 'air_quality.timings' logger, e.g.
+
+    {"stage": "load_tables", "seconds": 0.41, "rss_peak": 412.3, "rss_delta": 18.2, "session": "..."}
+
+Memory is in MiB, and left out of the records where the process cannot read it (no
+/proc and no resource module, e.g. on Windows). The records are read back by the
+diagnostics of the dashboard.
+'''
+import collections
+import contextlib
+import json
+import logging
+import os
+import sys
+import threading
+import time
+
+LOGGER_NAME = 'air_quality.timings'
+
+# Seconds between two samples of the resident memory during a stage
+SAMPLE_INTERVAL = 0.01
+
+_PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+
+def peak_rss():
+    ''' The peak resident memory of the process in bytes, None where there is no resource module (Windows). '''
+    try:
+        import resource
+    except ImportError:
+        return None
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def current_rss():
+    ''' The resident memory of the process in bytes, its peak when the current one is not available, or None. '''
+    try:
+        with open('/proc/self/statm') as file:
+            return int(file.read().split()[1]) * _PAGE_SIZE
+    except (OSError, IndexError, ValueError):
+        return peak_rss()
+
+
+class PeakSampler:
+    '''
+    One background thread sampling the resident memory of the process while stages are open.
+    The thread starts with the first open stage and ends with the last one, so the nested
+    stages of a run share the thread of the outermost one; every stage keeps the peak
+    sampled since it started.
+
+    Args:
+        interval (float): The seconds between two samples.
+    '''
+
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        self.interval = interval
+        self.lock = threading.Lock()
+        # [resident memory at the start, peak] of every open stage
+        self.open = {}
+        self._stop = None
+
+    def _run(self, stop):
+        while not stop.wait(self.interval):
+            rss = current_rss()
+            with self.lock:
+                for watch in self.open.values():
+                    watch[1] = max(watch[1], rss)
+
+    def start(self):
+        ''' Start watching the peak of a stage and return its token. '''
+        rss = current_rss()
+        token = object()
+        with self.lock:
+            self.open[token] = [rss, rss]
+            if self._stop is None:
+                self._stop = threading.Event()
+                threading.Thread(target=self._run, args=(self._stop,), daemon=True).start()
+        return token
+
+    def stop(self, token):
+        ''' Stop watching a stage and return its resident memory at the start and its peak in bytes. '''
+        rss = current_rss()
+        with self.lock:
+            start, peak = self.open.pop(token)
+            if not self.open:
+                self._stop.set()
+                self._stop = None
+        return start, max(peak, rss)
+
+
+def timings_logger():
+    ''' The logger of the stage records, writing one JSON line per record to stderr unless configured otherwise. '''
+    logger = logging.getLogger(LOGGER_NAME)
+    if not logger.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+    return logger
+
+
+class Timings:
+    '''
+    The records of the timed stages of a process, shared by every session.
+
+    Args:
+        history (int): The number of records kept, the oldest are dropped first.
+        sample_memory (bool): Sample the peak resident memory of every stage, where it can be read.
+        logger (logging.Logger): The logger of the JSON lines, None to only keep the records.
+    '''
+
+    def __init__(self, history=2000, sample_memory=True, logger=None):
+        self.records = collections.deque(maxlen=history)
+        self.sampler = PeakSampler() if sample_memory and current_rss() is not None else None
+        self.logger = logger
+        self.lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def stage(self, name, **fields):
+        '''
+        A context manager timing a stage.
+
+        Args:
+            name (str): The name of the stage.
+            **fields: Extra fields of the record, e.g. the session.
+        '''
+        token = self.sampler.start() if self.sampler is not None else None
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            record = {'stage': name, 'seconds': round(time.perf_counter() - start, 6)}
+            if token is not None:
+                start_rss, peak = self.sampler.stop(token)
+                record['rss_peak'] = round(peak / 2**20, 1)
+                record['rss_delta'] = round((peak - start_rss) / 2**20, 1)
+            record['time'] = round(time.time(), 3)
+            record.update(fields)
+            with self.lock:
+                self.records.append(record)
+            if self.logger is not None:
+                self.logger.info(json.dumps(record))
+
+    def select(self, **fields):
+        ''' The records matching every given field, oldest first. '''
+        with self.lock:
+            records = list(self.records)
+        return [record for record in records if all(record.get(k) == v for k, v in fields.items())]
+
+
+TIMINGS = Timings(logger=timings_logger())
@@ -0,0 +1,54 @@
+import altair as alt
+import pandas as pd
+
+from downsample import downsample, window
+
+# The number of points sent to the browser for one chart, shared by the stations shown
+# (Altair refuses to embed more than 5000 rows by default)
+MAX_POINTS = 4000
+
+
+def hourly_series(stations, variable, start, end, points=MAX_POINTS, method='lttb'):
+    '''
+    A function to downsample the hourly series of several stations over a window.
+
+    Args:
+        stations (dict): The hourly rows of every station (e.g. a StationView), indexed by the hourly datetime.
+        variable (str): The variable.
+        start: The first hour of the window.
+        end: The last hour of the window.
+        points (int): The maximum number of points of all stations together.
+        method (str): A method of downsample.METHODS.
+
+    Returns:
+        pd.DataFrame: The kept points with date_h, station and variable columns.
+    '''
+    frames = []
+    per_station = max(points // max(len(stations), 1), 3)
+    for station, rows in stations.items():
+        series = downsample(window(rows[variable], start, end), per_station, method)
+        frames.append(pd.DataFrame({'date_h': series.index, 'station': str(station), variable: series.to_numpy()}))
+    if not frames:
+        return pd.DataFrame(columns=['date_h', 'station', variable])
+    return pd.concat(frames, ignore_index=True)
+
+
+def hourly_chart(data, variable):
+    '''
+    A function to draw downsampled hourly series as an interactive line chart, zoomed and panned on the time axis.
+
+    Args:
+        data (pd.DataFrame): The points returned by hourly_series.
+        variable (str): The variable.
+
+    Returns:
+        alt.Chart: The chart.
+    '''
+    # Vega-Lite reads a dot in a field name (PM2.5) as a nested field
+    field = variable.replace('.', '\\.')
+    return alt.Chart(data).mark_line(strokeWidth=1).encode(
+        x=alt.X('date_h:T', title=''),
+        y=alt.Y(f'{field}:Q', title=variable),
+        color=alt.Color('station:N', title='Station'),
+        tooltip=['station:N', alt.Tooltip('date_h:T', format='%Y-%m-%d %H:00'), alt.Tooltip(f'{field}:Q', title=variable)],
+    ).properties(height=400).interactive(bind_y=False)
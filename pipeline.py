@@ -0,0 +1,97 @@
+import glob
+import os
+
+import pandas as pd
+
+from cache import fingerprint
+from ingest import read_stations
+from schema import compact
+from imputation import impute, MEAN_VARIABLES, MODE_VARIABLES, GROUP_KEYS
+
+DATA_DIR = 'Air-quality-dataset'
+LOCATION_FILE = 'lonlat_sta.xlsx'
+
+COLUMNS = ['date_h', 'PM2.5', 'PM10', 'SO2',
+           'NO2', 'CO', 'O3', 'TEMP', 'PRES', 'DEWP', 'RAIN', 'wd', 'WSPM',
+           'station', 'year', 'month', 'day', 'hour']
+
+IMPUTATION_SETTINGS = {
+    'mean_variables': MEAN_VARIABLES,
+    'mode_variables': MODE_VARIABLES,
+    'keys': GROUP_KEYS,
+    # The time-series fill strategy of gap_filling.STRATEGIES, part of the cache key
+    'strategy': 'mean',
+}
+
+
+def station_files(dire=DATA_DIR):
+    ''' The paths of the station CSV files in a directory. '''
+    return sorted(glob.glob(os.path.join(dire, 'PRSA_Data_*.csv')))
+
+
+def load_air_qi(dire=DATA_DIR, location_file=LOCATION_FILE):
+    '''
+    A function to load the hourly data of every station with the location of the stations.
+
+    Args:
+        dire (str): The directory of the station CSV files.
+        location_file (str): The Excel file of the longitude and latitude of the stations.
+
+    Returns:
+        pd.DataFrame: The hourly data of all stations before imputation, in the compact schema.
+    '''
+    air_qi = read_stations(station_files(dire), COLUMNS)
+    return add_locations(air_qi, location_file)
+
+
+def add_locations(air_qi, location_file=LOCATION_FILE, locsta=None):
+    '''
+    A function to join the hourly data with the location of the stations.
+
+    Args:
+        air_qi (pd.DataFrame): The hourly data with a date_h column.
+        location_file (str): The Excel file of the longitude and latitude of the stations.
+        locsta (pd.DataFrame): The locations already read from location_file, None to read them.
+
+    Returns:
+        pd.DataFrame: The hourly data with the station locations, in the compact schema.
+    '''
+    # Longitude and Latitude of Observation Stations
+    locsta = pd.read_excel(location_file) if locsta is None else locsta.copy()
+    locsta['station'] = locsta['station'].astype(air_qi['station'].dtype)
+    # The categories of every station, so chunks of different stations can be concatenated
+    locsta['location'] = locsta['location'].astype('category')
+    air_qi = pd.merge(left=air_qi, right=locsta, how='left', on='station')
+    return compact(air_qi)
+
+
+def prepare_air_qi(dire=DATA_DIR, location_file=LOCATION_FILE, settings=IMPUTATION_SETTINGS):
+    '''
+    A function to load the hourly data and fill its missing values.
+
+    Args:
+        dire (str): The directory of the station CSV files.
+        location_file (str): The Excel file of the longitude and latitude of the stations.
+        settings (dict): The keyword arguments of imputation.impute.
+
+    Returns:
+        pd.DataFrame: The hourly data of all stations ready for the dashboard.
+    '''
+    air_qi = load_air_qi(dire, location_file)
+    return impute(air_qi, **settings)
+
+
+def air_qi_key(dire=DATA_DIR, location_file=LOCATION_FILE, settings=IMPUTATION_SETTINGS):
+    '''
+    A function to compute the cache key of the prepared hourly data.
+
+    Args:
+        dire (str): The directory of the station CSV files.
+        location_file (str): The Excel file of the longitude and latitude of the stations.
+        settings (dict): The keyword arguments of imputation.impute.
+
+    Returns:
+        str: The fingerprint of the source files and the imputation settings.
+    '''
+    return fingerprint(station_files(dire) + [location_file], settings)
+
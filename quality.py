@@ -0,0 +1,275 @@
+'''
+Data-quality scan of the hourly data before imputation.
+
+One pass over the rows, sorted once by station and time, gives the tables:
+
+    ==========  ===================================================================
+    table       rows
+    ==========  ===================================================================
+    gaps        station, variable, start, length: every run of missing values (hours)
+    outliers    station, variable, date_h, value, score: modified z-scores above
+                OUTLIER_SCORE, on a log scale for LOG_VARIABLES
+    timestamps  station, date_h, issue, hours: duplicate, unordered and missing hours
+    coverage    station, month and the number of observed values of every variable
+    bounds      station, first, last: the first and last hour of every station
+    robust      station and the median and MAD of every variable, for the scores
+    ==========  ===================================================================
+
+The tables are small next to the hourly rows and mergeable, so the scans of chunks of
+rows (or of appended rows) are combined with merge_scans: gap runs continuing from one
+chunk to the next are joined, the coverage of months split between chunks is added up
+and the hours between chunks are checked. The outliers of every chunk must be scored
+against the medians of the whole station, collected beforehand with RobustCollector.
+'''
+import numpy as np
+import pandas as pd
+
+from schema import MEASUREMENTS
+
+QUALITY_TABLES = ['gaps', 'outliers', 'timestamps', 'coverage', 'bounds', 'robust']
+
+# Modified z-score (0.6745 * (x - median) / MAD) above which a value is an outlier
+OUTLIER_SCORE = 3.5
+
+# Skewed, non-negative variables, scored on log1p of the value
+LOG_VARIABLES = ['PM2.5', 'PM10', 'SO2', 'NO2', 'CO', 'O3', 'WSPM']
+
+_HOUR = np.timedelta64(1, 'h')
+
+
+def _scaled(values, variables):
+    ''' The values scored, log1p of LOG_VARIABLES. '''
+    values = values.copy()
+    for j, variable in enumerate(variables):
+        if variable in LOG_VARIABLES:
+            values[:, j] = np.log1p(np.clip(values[:, j], 0, None))
+    return values
+
+
+def robust_stats(data, variables=MEASUREMENTS):
+    '''
+    A function to compute the median and the median absolute deviation of every variable and station.
+
+    Args:
+        data (pd.DataFrame): The hourly data before imputation.
+        variables (list): The variables.
+
+    Returns:
+        pd.DataFrame: One row per station with the <variable>_median and <variable>_mad columns.
+    '''
+    scaled = pd.DataFrame(_scaled(data[variables].to_numpy(dtype='float64'), variables), columns=variables)
+    station = data['station'].to_numpy()
+    medians = scaled.groupby(station, observed=True).median()
+    deviations = (scaled - medians.reindex(station).to_numpy()).abs()
+    mads = deviations.groupby(station, observed=True).median()
+    robust = pd.concat([medians.add_suffix('_median'), mads.add_suffix('_mad')], axis=1)
+    robust.index.name = 'station'
+    return robust.reset_index()
+
+
+class RobustCollector:
+    '''
+    A sink collecting the medians and MADs of every station from chunks of rows, e.g. the
+    first pass of a streaming build. The rows of a station are kept until a chunk without
+    it arrives, so with chunks coming one station file at a time only the rows of one
+    station are in memory and the statistics are those of all its rows.
+
+    Args:
+        variables (list): The variables.
+    '''
+
+    def __init__(self, variables=MEASUREMENTS):
+        self.variables = variables
+        self.pending = {}
+        self.tables = []
+
+    def __call__(self, chunk):
+        stations = set(chunk['station'].unique())
+        for station in [station for station in self.pending if station not in stations]:
+            self._finish(station)
+        for station, rows in chunk.groupby('station', observed=True):
+            self.pending.setdefault(station, []).append(rows[['station'] + self.variables])
+
+    def _finish(self, station):
+        self.tables.append(robust_stats(pd.concat(self.pending.pop(station)), self.variables))
+
+    def result(self):
+        ''' The medians and MADs of every station seen, like robust_stats. '''
+        for station in list(self.pending):
+            self._finish(station)
+        return pd.concat(self.tables, ignore_index=True)
+
+
+def _runs(flags, boundary):
+    ''' The first and last positions of every run of True, runs do not cross a boundary. '''
+    previous = np.concatenate([[False], flags[:-1]]) & ~boundary
+    following = np.concatenate([flags[1:], [False]]) & ~np.concatenate([boundary[1:], [True]])
+    return np.flatnonzero(flags & ~previous), np.flatnonzero(flags & ~following)
+
+
+def scan(data, variables=MEASUREMENTS, robust=None):
+    '''
+    A function to scan the hourly data for gaps, outliers and irregular timestamps.
+
+    Args:
+        data (pd.DataFrame): The hourly data before imputation, indexed by the hourly datetime.
+        variables (list): The variables to scan.
+        robust (pd.DataFrame): The medians and MADs returned by robust_stats, None to compute them from data.
+
+    Returns:
+        dict: The DataFrames of QUALITY_TABLES by name.
+    '''
+    station_dtype = data['station'].dtype
+    codes = data['station'].cat.codes.to_numpy()
+    times = data.index.to_numpy(dtype='datetime64[ns]')
+
+    # Rows of a station in file order, for the unordered hours, then in time order
+    in_file = np.argsort(codes, kind='stable')
+    order = in_file[np.lexsort((times[in_file], codes[in_file]))]
+    codes = codes[order]
+    times = times[order]
+    boundary = np.concatenate([[True], codes[1:] != codes[:-1]])
+    stations = pd.Categorical.from_codes(codes, dtype=station_dtype)
+
+    # Duplicate and missing hours in time order, unordered hours in file order
+    file_codes = data['station'].cat.codes.to_numpy()[in_file]
+    file_times = data.index.to_numpy(dtype='datetime64[ns]')[in_file]
+    steps = np.diff(times) / _HOUR
+    file_steps = np.diff(file_times) / _HOUR
+    same = ~boundary[1:]
+    duplicate = np.flatnonzero(same & (steps == 0)) + 1
+    skipped = np.flatnonzero(same & (steps > 1)) + 1
+    unordered = np.flatnonzero((file_codes[1:] == file_codes[:-1]) & (file_steps < 0)) + 1
+    timestamps = pd.DataFrame({
+        'station': pd.Categorical.from_codes(
+            np.concatenate([codes[duplicate], codes[skipped], file_codes[unordered]]), dtype=station_dtype),
+        'date_h': np.concatenate([times[duplicate], times[skipped], file_times[unordered]]),
+        'issue': np.repeat(['duplicate', 'missing', 'unordered'], [len(duplicate), len(skipped), len(unordered)]),
+        'hours': np.concatenate([np.zeros(len(duplicate)), steps[skipped - 1] - 1,
+                                 np.zeros(len(unordered))]).astype('int32'),
+    })
+
+    values = data[variables].to_numpy(dtype='float64')[order]
+    missing = np.isnan(values)
+
+    # Gap runs of every variable
+    gaps = []
+    for j, variable in enumerate(variables):
+        first, last = _runs(missing[:, j], boundary)
+        gaps.append(pd.DataFrame({
+            'station': stations[first], 'variable': variable, 'start': times[first],
+            'length': (last - first + 1).astype('int32'),
+        }))
+    gaps = pd.concat(gaps, ignore_index=True)
+
+    # Outliers, scored against the medians of the station
+    if robust is None:
+        robust = robust_stats(data, variables)
+    reference = robust.set_index('station').reindex(pd.Categorical(station_dtype.categories, dtype=station_dtype))
+    medians = reference[[f'{variable}_median' for variable in variables]].to_numpy()[codes]
+    mads = reference[[f'{variable}_mad' for variable in variables]].to_numpy()[codes]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        scores = 0.6745 * (_scaled(values, variables) - medians) / mads
+    rows, columns = np.nonzero(np.abs(np.where(mads > 0, scores, 0)) > OUTLIER_SCORE)
+    outliers = pd.DataFrame({
+        'station': stations[rows], 'variable': np.asarray(variables)[columns], 'date_h': times[rows],
+        'value': values[rows, columns].astype('float32'), 'score': scores[rows, columns].astype('float32'),
+    })
+
+    # Observed values by station and month
+    month = times.astype('datetime64[M]').astype('datetime64[ns]')
+    observed = pd.DataFrame(~missing, columns=variables).astype('int32')
+    observed['station'] = stations
+    observed['month'] = month
+    coverage = observed.groupby(['station', 'month'], observed=True, sort=True)[variables].sum().reset_index()
+
+    starts = np.flatnonzero(boundary)
+    ends = np.append(starts[1:], len(codes)) - 1
+    bounds = pd.DataFrame({'station': stations[starts], 'first': times[starts], 'last': times[ends]})
+    return {'gaps': gaps, 'outliers': outliers, 'timestamps': timestamps, 'coverage': coverage,
+            'bounds': bounds, 'robust': robust}
+
+
+def merge_scans(scans):
+    '''
+    A function to combine the scans of consecutive chunks of rows.
+
+    Args:
+        scans (list): The scans returned by scan, in the order of the chunks.
+
+    Returns:
+        dict: The DataFrames of QUALITY_TABLES of all the chunks by name.
+    '''
+    scans = [scan for scan in scans if scan is not None]
+    if len(scans) == 1:
+        return scans[0]
+    tables = {name: pd.concat([scan[name] for scan in scans], ignore_index=True) for name in QUALITY_TABLES}
+
+    # The hours between the chunks of a station
+    bounds = tables['bounds'].sort_values(['station', 'first'], kind='stable').reset_index(drop=True)
+    same = (bounds['station'].to_numpy()[1:] == bounds['station'].to_numpy()[:-1])
+    steps = (bounds['first'].to_numpy()[1:] - bounds['last'].to_numpy()[:-1]) / _HOUR
+    rows = np.flatnonzero(same & (steps != 1))
+    between = pd.DataFrame({
+        'station': bounds['station'].iloc[rows + 1].to_numpy(),
+        'date_h': bounds['first'].iloc[rows + 1].to_numpy(),
+        'issue': np.select([steps[rows] == 0, steps[rows] < 0], ['duplicate', 'unordered'], 'missing'),
+        'hours': np.where(steps[rows] > 1, steps[rows] - 1, 0).astype('int32'),
+    })
+    timestamps = pd.concat([tables['timestamps'], between], ignore_index=True)
+    timestamps['station'] = timestamps['station'].astype(bounds['station'].dtype)
+    tables['timestamps'] = timestamps.sort_values(['station', 'date_h'], kind='stable').reset_index(drop=True)
+    tables['bounds'] = bounds.groupby('station', observed=True).agg(
+        first=('first', 'min'), last=('last', 'max')).reset_index()
+
+    # A run ending on the hour before the start of another run of the same variable is the same run
+    gaps = tables['gaps'].sort_values(['station', 'variable', 'start'], kind='stable').reset_index(drop=True)
+    ends = gaps['start'].to_numpy() + (gaps['length'].to_numpy() - 1) * _HOUR
+    continues = np.concatenate([[False], (
+        (gaps['station'].to_numpy()[1:] == gaps['station'].to_numpy()[:-1])
+        & (gaps['variable'].to_numpy()[1:] == gaps['variable'].to_numpy()[:-1])
+        & (gaps['start'].to_numpy()[1:] == ends[:-1] + _HOUR))])
+    run = np.cumsum(~continues) - 1
+    tables['gaps'] = gaps.groupby(run).agg(
+        station=('station', 'first'), variable=('variable', 'first'), start=('start', 'first'),
+        length=('length', 'sum')).reset_index(drop=True)
+
+    coverage = tables['coverage']
+    tables['coverage'] = coverage.groupby(['station', 'month'], observed=True, sort=True).sum().reset_index()
+    tables['robust'] = tables['robust'].drop_duplicates('station', keep='first').reset_index(drop=True)
+    tables['outliers'] = tables['outliers'].sort_values(['station', 'date_h'], kind='stable').reset_index(drop=True)
+    return tables
+
+
+def coverage_matrix(coverage, variable):
+    '''
+    A function to compute the share of the hours of every month with an observed value.
+
+    Args:
+        coverage (pd.DataFrame): The coverage table of a scan.
+        variable (str): The variable.
+
+    Returns:
+        pd.DataFrame: One row per station and one column per month, from 0 to 1.
+    '''
+    hours = coverage['month'].dt.days_in_month * 24
+    share = pd.DataFrame({'station': coverage['station'], 'month': coverage['month'],
+                          'share': coverage[variable] / hours})
+    matrix = share.pivot(index='station', columns='month', values='share')
+    return matrix.reindex(columns=pd.date_range(matrix.columns.min(), matrix.columns.max(), freq='MS')).fillna(0)
+
+
+def gap_summary(gaps, variable):
+    '''
+    A function to summarize the gap runs of a variable in every station.
+
+    Args:
+        gaps (pd.DataFrame): The gaps table of a scan.
+        variable (str): The variable.
+
+    Returns:
+        pd.DataFrame: One row per station with the number of runs, the missing hours and the longest run.
+    '''
+    runs = gaps[gaps['variable'] == variable]
+    return runs.groupby('station', observed=True)['length'].agg(
+        runs='size', hours='sum', longest='max').reset_index()
@@ -0,0 +1,150 @@
+'''
+Export the charts and tables of the dashboard without running Streamlit.
+
+Every pollutant x resolution seasonal chart, for Beijing and for each station, and every
+pollutant ranking is rendered from the same store and rollup levels as the dashboard.
+The charts are spread over a process pool, where each worker reads the levels from the
+store once. The daily, monthly, yearly and station tables are written as CSV files.
+
+Output layout:
+    OUT/seasonal/<pollutant>_<resolution>.<format>
+    OUT/stations/<station>/<pollutant>_<resolution>.<format>
+    OUT/ranking/<pollutant>.<format>
+    OUT/csv/<level>.csv
+
+Usage:
+    python report.py [--out reports] [--formats png svg] [--workers N]
+'''
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import matplotlib
+matplotlib.use('Agg')
+
+from charts import (ranking_figure, seasonal_figure, station_seasonal_figure, to_image,
+                    POLLUTANTS, RESOLUTIONS)
+from stations import StationView
+from store import load_levels, open_store, read_meta, STORE_DIR
+
+REPORT_DIR = 'reports'
+CSV_LEVELS = ['daily', 'monthly_ey', 'monthly', 'yearly', 'station']
+
+# The rollup levels of the worker process and their station views, read once by init_worker
+_levels = None
+_views = None
+
+
+def init_worker(store_dir):
+    ''' Read the rollup levels of the store in a worker process. '''
+    global _levels, _views
+    _levels = load_levels(read_meta(store_dir), store_dir)
+    _views = {name: StationView(_levels[name]) for name in ['monthly_ey', 'yearly']}
+
+
+def chart_tasks(stations, formats):
+    '''
+    A function to list the charts of the report.
+
+    Args:
+        stations (list): The stations.
+        formats (list): The image formats.
+
+    Returns:
+        list: The (kind, pollutant, resolution, station, format) tuple of every chart.
+    '''
+    tasks = []
+    for fmt in formats:
+        for pollutant in POLLUTANTS:
+            tasks.append(('ranking', pollutant, None, None, fmt))
+            for resolution in RESOLUTIONS:
+                tasks.append(('seasonal', pollutant, resolution, None, fmt))
+                tasks.extend(('station', pollutant, resolution, station, fmt) for station in stations)
+    return tasks
+
+
+def chart_path(out, kind, pollutant, resolution, station, fmt):
+    ''' The path of a chart in the report. '''
+    if kind == 'ranking':
+        return os.path.join(out, 'ranking', f'{pollutant}.{fmt}')
+    if kind == 'seasonal':
+        return os.path.join(out, 'seasonal', f'{pollutant}_{resolution}.{fmt}')
+    return os.path.join(out, 'stations', station, f'{pollutant}_{resolution}.{fmt}')
+
+
+def render_chart(task, out):
+    '''
+    A function to render one chart of the report to its file.
+
+    Args:
+        task (tuple): The (kind, pollutant, resolution, station, format) of the chart.
+        out (str): The directory of the report.
+
+    Returns:
+        str: The path of the chart.
+    '''
+    kind, pollutant, resolution, station, fmt = task
+    if kind == 'ranking':
+        fig = ranking_figure(pollutant, _levels['station'])
+    elif kind == 'seasonal':
+        fig = seasonal_figure(pollutant, _levels['monthly_ey'], _levels['yearly'], resolution)
+    else:
+        fig = station_seasonal_figure(pollutant, station, _views['monthly_ey'][station],
+                                      _views['yearly'][station], resolution)
+
+    path = chart_path(out, *task)
+    image = to_image(fig, fmt)
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'wb') as file:
+        file.write(image)
+    os.replace(tmp, path)
+    return path
+
+
+def write_tables(levels, out):
+    ''' Write the rollup levels of the report as CSV files. '''
+    for name in CSV_LEVELS:
+        levels[name].to_csv(os.path.join(out, 'csv', f'{name}.csv'), index=False)
+
+
+def export_report(out=REPORT_DIR, formats=('png',), workers=None, store_dir=STORE_DIR):
+    '''
+    A function to export every chart and table of the report.
+
+    Args:
+        out (str): The directory of the report.
+        formats (list): The image formats of the charts.
+        workers (int): The number of worker processes, None for the number of CPUs.
+        store_dir (str): The directory of the store.
+
+    Returns:
+        list: The paths of the charts.
+    '''
+    meta = open_store(store_dir=store_dir)
+    levels = load_levels(meta, store_dir)
+    stations = [str(station) for station in meta['stations']]
+
+    for sub in ['seasonal', 'ranking', 'csv'] + [os.path.join('stations', station) for station in stations]:
+        os.makedirs(os.path.join(out, sub), exist_ok=True)
+    write_tables(levels, out)
+
+    tasks = chart_tasks(stations, formats)
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(store_dir,)) as executor:
+        return list(executor.map(render_chart, tasks, [out] * len(tasks), chunksize=4))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--out', default=REPORT_DIR, help='the directory of the report')
+    parser.add_argument('--formats', nargs='+', default=['png'], choices=['png', 'svg'], help='the image formats')
+    parser.add_argument('--workers', type=int, default=None, help='the number of worker processes')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    paths = export_report(args.out, args.formats, args.workers)
+    print(f'wrote {len(paths)} charts and {len(CSV_LEVELS)} tables to {args.out} in {time.perf_counter() - start:.1f} s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,278 @@
+'''
+The rollup engine of the hourly data.
+
+Every level is first computed as mergeable partial aggregates:
+
+    - ``<variable>_sum`` and ``<variable>_count`` for the variables reduced by 'mean' or 'sum',
+    - ``<variable>_<category>`` counts (a histogram) for the variables reduced by 'mode'.
+
+Partials of a coarser level are the sums of the partials of a finer level, so only the daily
+level scans the hourly rows: daily -> monthly by year -> yearly -> station, and
+monthly by year -> monthly. ``finalize`` turns partials into the means, sums and modes
+shown in the dashboard.
+'''
+import numpy as np
+import pandas as pd
+
+from aggregation import AGG_SPEC, category_counts, mode_of_counts
+
+# The hydrological year runs from March to February, like the PRSA recording period
+YEAR_START_MONTH = 3
+
+LEVEL_KEYS = {
+    'daily': ['station', 'date'],
+    'monthly_ey': ['station', 'year', 'month'],
+    'monthly': ['station', 'month'],
+    'yearly': ['station', 'yearly'],
+    'station': ['station'],
+}
+
+# Columns derived from the date of a daily partial, recomputed at every level instead of summed
+_PERIOD_COLUMNS = ['date', 'year', 'month', 'yearly']
+
+
+def hydrological_year(year, month, first_year):
+    '''
+    A function to number the hydrological years (March to February) from real dates.
+
+    Args:
+        year (array-like): The calendar years.
+        month (array-like): The months.
+        first_year (int): The calendar year in which hydrological year 1 starts.
+
+    Returns:
+        np.ndarray: The hydrological year of every date, 1 for the first one.
+    '''
+    year = np.asarray(year, dtype=np.int16)
+    month = np.asarray(month)
+    return (year - (month < YEAR_START_MONTH) - first_year + 1).astype(np.int8)
+
+
+def first_hydrological_year(dates):
+    ''' The calendar year in which the hydrological year of the earliest date starts. '''
+    first = dates.min()
+    return first.year - int(first.month < YEAR_START_MONTH)
+
+
+def partial_columns(variable, func, dtype=None):
+    ''' The names of the partial columns of a variable. '''
+    if func == 'mode':
+        return [f'{variable}_{category}' for category in dtype.categories]
+    return [f'{variable}_sum', f'{variable}_count']
+
+
+def partials(data, keys, spec=AGG_SPEC):
+    '''
+    A function to compute the partial aggregates of the data by groups.
+
+    Args:
+        data (pd.DataFrame): The hourly data.
+        keys (list): The group keys (column names or arrays), as accepted by groupby.
+        spec (dict): The reduction of every variable ('mean', 'sum' or 'mode').
+
+    Returns:
+        pd.DataFrame: One row per group with the keys as columns and the partial columns.
+    '''
+    grouped = data.groupby(keys, observed=True)
+    numeric = [variable for variable, func in spec.items() if func != 'mode']
+    sums = grouped[numeric].sum().astype('float64')
+    counts = grouped[numeric].count().astype('int32')
+    columns = {}
+    for variable in numeric:
+        columns[f'{variable}_sum'] = sums[variable]
+        columns[f'{variable}_count'] = counts[variable]
+    result = pd.DataFrame(columns, index=sums.index)
+
+    modes = [variable for variable, func in spec.items() if func == 'mode']
+    if modes:
+        group_ids = grouped.ngroup().to_numpy()
+        for variable in modes:
+            dtype = data[variable].dtype
+            counts = category_counts(data[variable].cat.codes.to_numpy(), group_ids,
+                                     len(result), len(dtype.categories))
+            names = partial_columns(variable, 'mode', dtype)
+            result[names] = counts.astype('int32')
+
+    result.reset_index(inplace=True)
+    return result
+
+
+def daily_partials(data, spec=AGG_SPEC):
+    '''
+    A function to compute the daily partial aggregates of every station from the hourly data.
+
+    Args:
+        data (pd.DataFrame): The hourly data indexed by the hourly datetime.
+        spec (dict): The reduction of every variable ('mean', 'sum' or 'mode').
+
+    Returns:
+        pd.DataFrame: One row per station and day with the partial columns.
+    '''
+    return partials(data, ['station', data.index.normalize().rename('date')], spec)
+
+
+def mode_dtypes(data, spec=AGG_SPEC):
+    ''' The categorical dtype of every 'mode' variable of spec. '''
+    return {variable: data[variable].dtype for variable, func in spec.items() if func == 'mode'}
+
+
+def combine(partial, keys):
+    '''
+    A function to merge partial aggregates into coarser groups by adding them up.
+
+    Args:
+        partial (pd.DataFrame): The partial aggregates with the keys as columns.
+        keys (list): The columns of the coarser groups.
+
+    Returns:
+        pd.DataFrame: One row per coarser group with the keys as columns and the partial columns.
+    '''
+    values = [column for column in partial.columns if column not in keys and column not in _PERIOD_COLUMNS]
+    result = partial.groupby(keys, observed=True)[values].sum()
+    result.reset_index(inplace=True)
+    return result
+
+
+def merge(partial, delta, keys):
+    '''
+    A function to add new partial aggregates into existing ones.
+    Only the groups present in delta are updated, new groups are appended.
+
+    Args:
+        partial (pd.DataFrame): The existing partial aggregates with the keys as columns.
+        delta (pd.DataFrame): The partial aggregates of new observations, at the same level.
+        keys (list): The key columns of the level.
+
+    Returns:
+        pd.DataFrame: The merged partial aggregates, sorted by the keys.
+    '''
+    values = [column for column in partial.columns if column not in keys and column not in _PERIOD_COLUMNS]
+    partial = partial.set_index(keys)
+    delta = delta.set_index(keys)
+    common = delta.index.isin(partial.index)
+    rows = delta.index[common]
+    for column in values:
+        partial.loc[rows, column] = partial.loc[rows, column].to_numpy() + delta.loc[common, column].to_numpy()
+    result = pd.concat([partial, delta.loc[~common, partial.columns]]).sort_index()
+    result.reset_index(inplace=True)
+    return result
+
+
+def finalize(partial, keys, spec=AGG_SPEC, dtypes=None):
+    '''
+    A function to turn partial aggregates into means, sums and modes.
+
+    Args:
+        partial (pd.DataFrame): The partial aggregates with the keys as columns.
+        keys (list): The key columns to keep.
+        spec (dict): The reduction of every variable ('mean', 'sum' or 'mode').
+        dtypes (dict): The categorical dtype of every 'mode' variable.
+
+    Returns:
+        pd.DataFrame: One row per group with the keys and every variable of spec.
+    '''
+    result = partial[keys].copy()
+    for variable, func in spec.items():
+        if func == 'mode':
+            counts = partial[partial_columns(variable, func, dtypes[variable])].to_numpy()
+            result[variable] = pd.Categorical.from_codes(mode_of_counts(counts), dtype=dtypes[variable])
+        elif func == 'sum':
+            result[variable] = partial[f'{variable}_sum'].astype('float32')
+        else:
+            with np.errstate(invalid='ignore', divide='ignore'):
+                result[variable] = (partial[f'{variable}_sum'] / partial[f'{variable}_count']).astype('float32')
+    return result
+
+
+def add_periods(daily, first_year):
+    '''
+    A function to add the calendar and hydrological periods of the daily partials.
+
+    Args:
+        daily (pd.DataFrame): The daily partial aggregates with a date column.
+        first_year (int): The calendar year in which hydrological year 1 starts.
+
+    Returns:
+        pd.DataFrame: The daily partial aggregates with year, month and yearly columns.
+    '''
+    dates = pd.DatetimeIndex(daily['date'])
+    daily['year'] = dates.year.astype('int16')
+    daily['month'] = dates.month.astype('int8')
+    daily['yearly'] = hydrological_year(daily['year'], daily['month'], first_year)
+    return daily
+
+
+def rollup_partials(daily, first_year):
+    '''
+    A function to derive the partial aggregates of every level from the daily partials.
+
+    Args:
+        daily (pd.DataFrame): The daily partial aggregates with a date column.
+        first_year (int): The calendar year in which hydrological year 1 starts.
+
+    Returns:
+        dict: The partial aggregates of every level of LEVEL_KEYS by name.
+    '''
+    daily = add_periods(daily, first_year)
+    monthly_ey = combine(daily, LEVEL_KEYS['monthly_ey'])
+    monthly_ey['yearly'] = hydrological_year(monthly_ey['year'], monthly_ey['month'], first_year)
+    yearly = combine(monthly_ey, LEVEL_KEYS['yearly'])
+    return {
+        'daily': daily,
+        'monthly_ey': monthly_ey,
+        'monthly': combine(monthly_ey, LEVEL_KEYS['monthly']),
+        'yearly': yearly,
+        'station': combine(yearly, LEVEL_KEYS['station']),
+    }
+
+
+def update_partials(levels, daily, first_year):
+    '''
+    A function to add the daily partials of new observations to the partials of every level.
+    The new days are rolled up on their own and merged into the affected buckets only.
+
+    Args:
+        levels (dict): The partial aggregates of every level by name.
+        daily (pd.DataFrame): The daily partial aggregates of the new observations.
+        first_year (int): The calendar year in which hydrological year 1 starts.
+
+    Returns:
+        dict: The updated partial aggregates of every level by name.
+    '''
+    delta = rollup_partials(daily, first_year)
+    return {name: merge(levels[name], delta[name], LEVEL_KEYS[name]) for name in levels}
+
+
+def finalize_levels(levels, spec=AGG_SPEC, dtypes=None):
+    '''
+    A function to finalize the partial aggregates of every level.
+    The monthly by year level gets a date column (the first day of the month) for plotting.
+
+    Args:
+        levels (dict): The partial aggregates of every level by name.
+        spec (dict): The reduction of every variable ('mean', 'sum' or 'mode').
+        dtypes (dict): The categorical dtype of every 'mode' variable.
+
+    Returns:
+        dict: The aggregated DataFrames of every level by name.
+    '''
+    tables = {name: finalize(partial, LEVEL_KEYS[name], spec, dtypes) for name, partial in levels.items()}
+    monthly_ey = tables['monthly_ey']
+    monthly_ey['date'] = pd.to_datetime(pd.DataFrame({
+        'year': monthly_ey['year'], 'month': monthly_ey['month'], 'day': 1}))
+    return tables
+
+
+def rollup(data, spec=AGG_SPEC):
+    '''
+    A function to aggregate the hourly data to every level in one pass over the hourly rows.
+
+    Args:
+        data (pd.DataFrame): The hourly data indexed by the hourly datetime.
+        spec (dict): The reduction of every variable ('mean', 'sum' or 'mode').
+
+    Returns:
+        dict: The daily, monthly by year, monthly, yearly and station DataFrames by name.
+    '''
+    levels = rollup_partials(daily_partials(data, spec), first_hydrological_year(data.index))
+    return finalize_levels(levels, spec, mode_dtypes(data, spec))
@@ -0,0 +1,102 @@
+'''
+The compact schema of the hourly table.
+
+One row per station and hour, indexed by a single DatetimeIndex ``date_h``:
+
+    ============================  ==========  =========================================
+    column                        dtype       note
+    ============================  ==========  =========================================
+    PM2.5 ... RAIN, WSPM          float32     measurements
+    wd                            category    16 fixed compass sectors (WIND_DIRECTIONS)
+    station                       category    station names, sorted
+    year                          int16
+    month, day, hour              int8
+    location                      category    station location name
+    lon, lat                      float32     station coordinates
+    elevation                     int16       station elevation (m)
+    imputed                       int16       bits of the filled variables (imputation)
+    ============================  ==========  =========================================
+
+The daily date is not stored, it is the floor of the index, and the station
+geometry lives in a 12 row table instead of one shapely Point per row.
+Aggregations group with observed=True so the categoricals and float32
+columns are kept in the daily, monthly and yearly tables.
+'''
+import os
+
+import pandas as pd
+
+# The 16 compass sectors of the wind direction, clockwise from north
+WIND_DIRECTIONS = ['N', 'NNE', 'NE', 'ENE', 'E', 'ESE', 'SE', 'SSE',
+                   'S', 'SSW', 'SW', 'WSW', 'W', 'WNW', 'NW', 'NNW']
+
+MEASUREMENTS = ['PM2.5', 'PM10', 'SO2', 'NO2', 'CO', 'O3', 'TEMP', 'PRES', 'DEWP', 'RAIN', 'WSPM']
+
+TIME_DTYPES = {
+    'year': 'int16',
+    'month': 'int8',
+    'day': 'int8',
+    'hour': 'int8',
+}
+
+HOURLY_INDEX = 'date_h'
+
+LOCATION_DTYPES = {
+    'location': 'category',
+    'lon': 'float32',
+    'lat': 'float32',
+    'elevation': 'int16',
+}
+
+
+def station_name(path):
+    ''' The station name of a PRSA_Data_<station>_<period>.csv file. '''
+    return os.path.basename(path).split('_')[2]
+
+
+def csv_dtypes(stations):
+    '''
+    A function to build the explicit dtypes of the station CSV files.
+    Measurements are read as float32, the time parts as small integers and the
+    station and wind direction as categoricals with fixed categories, so the
+    files can be concatenated without falling back to object columns.
+
+    Args:
+        stations (list): The names of all stations.
+
+    Returns:
+        dict: The dtype of every column read from the CSV files.
+    '''
+    dtypes = dict(TIME_DTYPES)
+    dtypes.update({measurement: 'float32' for measurement in MEASUREMENTS})
+    dtypes['wd'] = pd.CategoricalDtype(WIND_DIRECTIONS)
+    dtypes['station'] = pd.CategoricalDtype(sorted(stations))
+    return dtypes
+
+
+def compact(data):
+    '''
+    A function to apply the compact schema to the hourly data.
+    The hourly datetime becomes the index, the redundant daily date and geometry
+    columns are dropped and the remaining columns are downcast.
+
+    Args:
+        data (pd.DataFrame): The hourly data.
+
+    Returns:
+        pd.DataFrame: The hourly data in the compact schema.
+    '''
+    if HOURLY_INDEX in data.columns:
+        data = data.set_index(HOURLY_INDEX)
+    data = data.drop(columns=['date', 'geometry'], errors='ignore')
+    dtypes = dict(TIME_DTYPES)
+    dtypes.update({measurement: 'float32' for measurement in MEASUREMENTS})
+    dtypes.update(LOCATION_DTYPES)
+    dtypes = {column: dtype for column, dtype in dtypes.items()
+              if column in data.columns and data[column].dtype != dtype}
+    data = data.astype(dtypes)
+    categories = {'station': pd.CategoricalDtype(), 'wd': pd.CategoricalDtype(WIND_DIRECTIONS)}
+    for column, dtype in categories.items():
+        if column in data.columns and not isinstance(data[column].dtype, pd.CategoricalDtype):
+            data[column] = data[column].astype(dtype)
+    return data
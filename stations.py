@@ -0,0 +1,52 @@
+import numpy as np
+import pandas as pd
+
+
+class StationView:
+    '''
+    A station-indexed view of a table.
+    The table is sorted by station once (no copy when it already is, like the rollup
+    levels) and every station is a contiguous block of rows, so a station is looked up
+    in O(1) and returned as a slice of the table instead of a boolean-masked copy.
+
+    Args:
+        data (pd.DataFrame): The DataFrame.
+        col (str): The name of the station column in data.
+    '''
+
+    def __init__(self, data, col='station'):
+        codes, uniques = pd.factorize(data[col], sort=True)
+        if len(codes) and (np.diff(codes) < 0).any():
+            order = np.argsort(codes, kind='stable')
+            data = data.iloc[order]
+            codes = codes[order]
+        self.data = data
+        self.col = col
+        bounds = np.searchsorted(codes, np.arange(len(uniques) + 1))
+        self._slices = {station: slice(bounds[i], bounds[i + 1]) for i, station in enumerate(uniques)}
+
+    def __getitem__(self, station):
+        ''' The rows of a station. '''
+        return self.data.iloc[self._slices[station]]
+
+    def __contains__(self, station):
+        return station in self._slices
+
+    def __iter__(self):
+        return iter(self._slices)
+
+    def __len__(self):
+        return len(self._slices)
+
+    @property
+    def stations(self):
+        ''' The stations of the table, sorted. '''
+        return list(self._slices)
+
+    def positions(self, station):
+        ''' The slice of the rows of a station in the sorted table. '''
+        return self._slices[station]
+
+    def items(self):
+        ''' The (station, rows) pairs of the table. '''
+        return ((station, self[station]) for station in self._slices)
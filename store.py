@@ -0,0 +1,430 @@
+'''
+A persistent, appendable store of the prepared data.
+
+The store keeps, next to the prepared hourly rows, everything needed to add new
+observations without reading the history again:
+
+    - the imputation statistics of every (station, hour) as sums, counts and wd histograms,
+    - the partial aggregates of every rollup level (see rollups),
+    - the data-quality scan of the rows before imputation (see quality),
+    - the exceedance cube of the prepared rows (see exceedance),
+    - the wind histograms and sector sums of the prepared rows (see wind).
+
+New rows are imputed from the updated statistics and rolled up on their own, then merged
+into the affected daily, monthly and yearly buckets. The hourly rows are stored in
+segments, so an append writes only the new rows. Values filled before an append are
+not filled again with the updated statistics.
+
+The appended rows are also kept as read, before imputation, in the appended directory
+of the store. A rebuild (e.g. after the station files or the location file changed)
+appends them again, except the hours now in the station files, so they are not lost
+with the old segments. Remove the appended directory to drop them.
+
+The store can also be built without loading all the hourly rows at once (see streaming):
+the filled chunks are buffered and written as segments of about SEGMENT_ROWS rows, so
+reading the hourly rows back does not depend on the chunk size. Only the fill strategies
+of streaming.STREAMING_STRATEGIES can be streamed, the others need every station at once.
+
+Usage:
+    python store.py build [--streaming] [--chunksize ROWS] [--strategy STRATEGY] [--backend BACKEND]
+    python store.py append [--strategy STRATEGY] NEW_ROWS.csv [NEW_ROWS.csv ...]
+
+Without --strategy, the new rows are appended to the default store and to the store of
+every other strategy already built.
+'''
+import argparse
+import glob
+import json
+import os
+
+import pandas as pd
+
+from backends import available_backends, frame_daily_partials, frame_imputation_stats
+from cache import cache_path, CACHE_DIR, read_frame, write_frame
+from exceedance import exceedance_cube, merge_cubes
+from gap_filling import STRATEGIES
+from imputation import impute, impute_from_stats, imputation_stats
+from ingest import read_station
+from pipeline import (add_locations, air_qi_key, load_air_qi, station_files, COLUMNS, DATA_DIR,
+                      IMPUTATION_SETTINGS, LOCATION_FILE)
+from quality import merge_scans, scan, RobustCollector, QUALITY_TABLES
+from rollups import (daily_partials, finalize_levels, first_hydrological_year, merge,
+                     rollup_partials, update_partials, LEVEL_KEYS)
+from schema import csv_dtypes, station_name, LOCATION_DTYPES, WIND_DIRECTIONS
+from streaming import check_strategy, stream_daily_partials, stream_imputation_stats, STREAMING_STRATEGIES
+from wind import merge_wind, update_wind, wind_partials
+
+STORE_DIR = os.path.join(CACHE_DIR, 'store')
+
+# The rows of a hourly segment written by a streaming build
+SEGMENT_ROWS = 100_000
+
+# The subdirectory of the store keeping the appended rows before imputation, and their cache key
+APPENDED_DIR = 'appended'
+APPENDED_KEY = 'raw'
+
+
+def read_meta(store_dir=STORE_DIR):
+    ''' The metadata of the store, None when there is no store. '''
+    path = os.path.join(store_dir, 'meta.json')
+    if not os.path.exists(path):
+        return None
+    with open(path) as file:
+        return json.load(file)
+
+
+def write_meta(meta, store_dir=STORE_DIR):
+    ''' Write the metadata of the store atomically. '''
+    path = os.path.join(store_dir, 'meta.json')
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'w') as file:
+        json.dump(meta, file, indent=2)
+    os.replace(tmp, path)
+
+
+def store_version(meta):
+    ''' A key changing with the source files and with every append. '''
+    return f"{meta['source_key']}-{meta['segments']}"
+
+
+def strategy_store_dir(strategy, store_dir=STORE_DIR):
+    ''' The directory of the store imputed with a strategy, store_dir for the default strategy. '''
+    if strategy == IMPUTATION_SETTINGS['strategy']:
+        return store_dir
+    return f'{store_dir}-{strategy}'
+
+
+def last_timestamps(air_qi):
+    ''' The last recorded hour of every station, as ISO strings. '''
+    last = air_qi.index.to_series().groupby(air_qi['station'], observed=True).max()
+    return {station: timestamp.isoformat() for station, timestamp in last.items()}
+
+
+def build_store(dire=DATA_DIR, location_file=LOCATION_FILE, settings=IMPUTATION_SETTINGS, store_dir=STORE_DIR,
+                streaming=False, chunksize=None, backend='pandas'):
+    '''
+    A function to build the store from the station CSV files, then append again the rows
+    kept by the earlier appends (see replay_appended).
+
+    Args:
+        dire (str): The directory of the station CSV files.
+        location_file (str): The Excel file of the longitude and latitude of the stations.
+        settings (dict): The keyword arguments of imputation.impute.
+        store_dir (str): The directory of the store.
+        streaming (bool): Process the station files one at a time instead of loading all of them,
+            only with the strategies of STREAMING_STRATEGIES.
+        chunksize (int): In streaming mode, the number of rows of a chunk, None for one whole file.
+        backend (str): The query backend of the imputation statistics and daily partials (see backends).
+
+    Returns:
+        dict: The metadata of the store.
+    '''
+    if streaming:
+        check_strategy(settings)
+    key = air_qi_key(dire, location_file, settings)
+    # The appended segments are dropped with the old store and appended again from the kept rows
+    for path in glob.glob(os.path.join(store_dir, '*.feather')):
+        os.remove(path)
+
+    if streaming:
+        paths = station_files(dire)
+        # The medians of the outlier scores come from the whole station, not from a chunk
+        robust = RobustCollector()
+        stats, first_year = stream_imputation_stats(paths, location_file, settings, chunksize, sink=robust,
+                                                    backend=backend)
+        robust = robust.result()
+        scans = []
+        stations = sorted(station_name(path) for path in paths)
+        last = {}
+        segments = []
+        cubes = []
+        winds = []
+
+        pending = []
+
+        def write_segment():
+            segment = pd.concat(pending)
+            pending.clear()
+            write_frame(segment, f'hourly{len(segments)}', key, store_dir)
+            segments.append(len(segment))
+            cubes.append(exceedance_cube(segment))
+            winds.append(wind_partials(segment))
+            for station, timestamp in last_timestamps(segment).items():
+                last[station] = max(last.get(station, timestamp), timestamp)
+
+        def add_chunk(chunk):
+            pending.append(chunk)
+            if sum(len(rows) for rows in pending) >= SEGMENT_ROWS:
+                write_segment()
+
+        daily = stream_daily_partials(paths, stats, location_file, settings, chunksize, sink=add_chunk,
+                                      raw_sink=lambda chunk: scans.append(scan(chunk, robust=robust)),
+                                      backend=backend)
+        if pending:
+            write_segment()
+        quality = merge_scans(scans)
+        cube = merge_cubes(cubes)
+        wind = merge_wind(winds)
+    else:
+        air_qi = load_air_qi(dire, location_file)
+        stats = frame_imputation_stats(air_qi, settings, backend)
+        quality = scan(air_qi)
+        impute(air_qi, **settings)
+        cube = exceedance_cube(air_qi)
+        wind = wind_partials(air_qi)
+        first_year = first_hydrological_year(air_qi.index)
+        daily = frame_daily_partials(air_qi, backend)
+        stations = list(air_qi['station'].cat.categories)
+        last = last_timestamps(air_qi)
+        write_frame(air_qi, 'hourly0', key, store_dir)
+        segments = [len(air_qi)]
+
+    levels = rollup_partials(daily, first_year)
+    write_frame(stats, 'imputation', key, store_dir)
+    write_quality(quality, key, store_dir)
+    write_frame(cube, 'exceedance', key, store_dir)
+    write_frame(wind, 'wind', key, store_dir)
+    for name, partial in levels.items():
+        write_frame(partial, name, key, store_dir)
+
+    meta = {
+        'source_key': key,
+        'location_file': location_file,
+        'settings': settings,
+        'first_year': int(first_year),
+        'segments': len(segments),
+        'stations': stations,
+        'last': last,
+    }
+    write_meta(meta, store_dir)
+    return replay_appended(meta, store_dir)
+
+
+def open_store(dire=DATA_DIR, location_file=LOCATION_FILE, settings=IMPUTATION_SETTINGS, store_dir=STORE_DIR):
+    '''
+    A function to get the metadata of the store, building it when it is missing or the source files changed.
+
+    Args:
+        dire (str): The directory of the station CSV files.
+        location_file (str): The Excel file of the longitude and latitude of the stations.
+        settings (dict): The keyword arguments of imputation.impute.
+        store_dir (str): The directory of the store.
+
+    Returns:
+        dict: The metadata of the store.
+    '''
+    meta = read_meta(store_dir)
+    if meta is None or meta['source_key'] != air_qi_key(dire, location_file, settings):
+        meta = build_store(dire, location_file, settings, store_dir)
+    return meta
+
+
+def load_hourly(meta, store_dir=STORE_DIR):
+    '''
+    A function to read the prepared hourly rows of every segment of the store.
+
+    Args:
+        meta (dict): The metadata of the store.
+        store_dir (str): The directory of the store.
+
+    Returns:
+        pd.DataFrame: The prepared hourly data.
+    '''
+    segments = [read_frame(f'hourly{i}', meta['source_key'], store_dir) for i in range(meta['segments'])]
+    if len(segments) == 1:
+        return segments[0]
+    return pd.concat(segments)
+
+
+def load_partials(meta, store_dir=STORE_DIR):
+    ''' The partial aggregates of every rollup level of the store by name. '''
+    return {name: read_frame(name, meta['source_key'], store_dir) for name in LEVEL_KEYS}
+
+
+def load_levels(meta, store_dir=STORE_DIR):
+    '''
+    A function to read the daily, monthly by year, monthly, yearly and station tables of the store.
+
+    Args:
+        meta (dict): The metadata of the store.
+        store_dir (str): The directory of the store.
+
+    Returns:
+        dict: The aggregated DataFrames of every level by name.
+    '''
+    return finalize_levels(load_partials(meta, store_dir), dtypes={'wd': pd.CategoricalDtype(WIND_DIRECTIONS)})
+
+
+def write_quality(quality, key, store_dir=STORE_DIR):
+    ''' A function to store the tables of a data-quality scan. '''
+    for name in QUALITY_TABLES:
+        write_frame(quality[name], f'quality_{name}', key, store_dir)
+
+
+def load_quality(meta, store_dir=STORE_DIR):
+    ''' The tables of the data-quality scan of the store by name (see quality). '''
+    return {name: read_frame(f'quality_{name}', meta['source_key'], store_dir) for name in QUALITY_TABLES}
+
+
+def load_exceedance(meta, store_dir=STORE_DIR):
+    ''' The exceedance cube of the store (see exceedance). '''
+    return read_frame('exceedance', meta['source_key'], store_dir)
+
+
+def load_wind(meta, store_dir=STORE_DIR):
+    ''' The wind partials of the store (see wind). '''
+    return read_frame('wind', meta['source_key'], store_dir)
+
+
+def read_new_rows(paths, meta):
+    '''
+    A function to read new hourly rows in the format of the PRSA station CSV files.
+
+    Args:
+        paths (list): The paths of the CSV files with the new rows.
+        meta (dict): The metadata of the store.
+
+    Returns:
+        pd.DataFrame: The new rows in the compact schema, with the station locations.
+    '''
+    dtypes = csv_dtypes(meta['stations'])
+    rows = pd.concat([read_station(path, dtypes, COLUMNS) for path in paths], ignore_index=True)
+    if rows['station'].isna().any():
+        raise ValueError('new rows can only be appended to the stations of the store')
+    return add_locations(rows, meta['location_file'])
+
+
+def appended_batches(store_dir=STORE_DIR):
+    ''' The numbers of the batches of appended rows kept by the store, in the order they were appended. '''
+    paths = glob.glob(os.path.join(store_dir, APPENDED_DIR, f'rows*-{APPENDED_KEY}.feather'))
+    return sorted(int(os.path.basename(path)[len('rows'):-len(f'-{APPENDED_KEY}.feather')]) for path in paths)
+
+
+def keep_appended(rows, store_dir=STORE_DIR):
+    ''' A function to keep new rows before imputation, without their station locations, for the rebuilds. '''
+    batches = appended_batches(store_dir)
+    number = batches[-1] + 1 if batches else 0
+    raw = rows.drop(columns=list(LOCATION_DTYPES), errors='ignore')
+    raw = raw.assign(station=raw['station'].astype(str))
+    write_frame(raw, f'rows{number}', APPENDED_KEY, os.path.join(store_dir, APPENDED_DIR))
+
+
+def replay_appended(meta, store_dir=STORE_DIR):
+    '''
+    A function to append again the kept rows to a rebuilt store.
+    The rows of the stations no longer in the store and the hours now in the station files
+    are left out, the batches left empty are removed.
+
+    Args:
+        meta (dict): The metadata of the rebuilt store.
+        store_dir (str): The directory of the store.
+
+    Returns:
+        dict: The updated metadata of the store.
+    '''
+    appended_dir = os.path.join(store_dir, APPENDED_DIR)
+    for number in appended_batches(store_dir):
+        rows = read_frame(f'rows{number}', APPENDED_KEY, appended_dir)
+        rows['station'] = rows['station'].astype(csv_dtypes(meta['stations'])['station'])
+        last = rows['station'].astype(str).map(meta['last']).astype('datetime64[ns]')
+        rows = rows[rows['station'].notna().to_numpy() & (rows.index.to_numpy() > last.to_numpy())]
+        if rows.empty:
+            os.remove(cache_path(f'rows{number}', APPENDED_KEY, appended_dir))
+            continue
+        meta = append_rows(add_locations(rows.reset_index(), meta['location_file']), store_dir, keep=False)
+    return meta
+
+
+def append_rows(rows, store_dir=STORE_DIR, keep=True):
+    '''
+    A function to add new hourly rows to the store.
+    Only the (station, hour) imputation statistics, the daily, monthly and yearly buckets
+    and the exceedance and wind cells touched by the new rows are updated.
+
+    Args:
+        rows (pd.DataFrame): The new rows in the compact schema, after the last recorded hour of their station.
+        store_dir (str): The directory of the store.
+        keep (bool): Keep the rows before imputation, so the rebuilds of the store append them again.
+
+    Returns:
+        dict: The updated metadata of the store.
+    '''
+    meta = read_meta(store_dir)
+    key = meta['source_key']
+    settings = meta['settings']
+
+    last = rows['station'].astype(str).map(meta['last']).astype('datetime64[ns]')
+    if (rows.index.to_numpy() <= last.to_numpy()).any():
+        raise ValueError('new rows must be after the last recorded hour of their station')
+    if rows.reset_index().duplicated(['station', 'date_h']).any():
+        raise ValueError('new rows contain duplicate hours')
+    if keep:
+        keep_appended(rows, store_dir)
+
+    stats = read_frame('imputation', key, store_dir)
+    delta = imputation_stats(rows, settings['mean_variables'], settings['mode_variables'], settings['keys'])
+    stats = merge(stats, delta, settings['keys'])
+    quality = load_quality(meta, store_dir)
+    quality = merge_scans([quality, scan(rows, robust=quality['robust'])])
+    impute_from_stats(rows, stats, settings['mean_variables'], settings['mode_variables'], settings['keys'],
+                      settings.get('strategy', 'mean'))
+
+    levels = update_partials(load_partials(meta, store_dir), daily_partials(rows), meta['first_year'])
+    cube = merge_cubes([load_exceedance(meta, store_dir), exceedance_cube(rows)])
+    wind = update_wind(load_wind(meta, store_dir), wind_partials(rows))
+
+    write_frame(rows, f"hourly{meta['segments']}", key, store_dir)
+    write_frame(stats, 'imputation', key, store_dir)
+    write_quality(quality, key, store_dir)
+    write_frame(cube, 'exceedance', key, store_dir)
+    write_frame(wind, 'wind', key, store_dir)
+    for name, partial in levels.items():
+        write_frame(partial, name, key, store_dir)
+
+    meta['segments'] += 1
+    meta['last'].update(last_timestamps(rows))
+    write_meta(meta, store_dir)
+    return meta
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    build = subparsers.add_parser('build', help='build the store from the station files')
+    build.add_argument('--streaming', action='store_true', help='process the station files one at a time')
+    build.add_argument('--chunksize', type=int, default=None, help='in streaming mode, the rows of a chunk')
+    build.add_argument('--strategy', choices=STRATEGIES, default=IMPUTATION_SETTINGS['strategy'],
+                       help='the time-series fill strategy of the imputation')
+    build.add_argument('--backend', choices=available_backends(), default='pandas',
+                       help='the query backend of the imputation statistics and the rollups')
+    append = subparsers.add_parser('append', help='append new hourly rows to the store')
+    append.add_argument('paths', nargs='+', help='CSV files in the format of the PRSA station files')
+    append.add_argument('--strategy', choices=STRATEGIES, default=None,
+                        help='the store to append to, every built store by default')
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        if args.streaming and args.strategy not in STREAMING_STRATEGIES:
+            parser.error(f'--streaming only supports the strategies {STREAMING_STRATEGIES}, not {args.strategy}')
+        settings = dict(IMPUTATION_SETTINGS, strategy=args.strategy)
+        meta = build_store(settings=settings, store_dir=strategy_store_dir(args.strategy),
+                           streaming=args.streaming, chunksize=args.chunksize, backend=args.backend)
+        print(f"built {meta['segments']} segments, store version {store_version(meta)}")
+        return
+
+    if args.strategy is not None:
+        strategies = [args.strategy]
+    else:
+        strategies = [strategy for strategy in STRATEGIES if strategy == IMPUTATION_SETTINGS['strategy']
+                      or read_meta(strategy_store_dir(strategy)) is not None]
+    for strategy in strategies:
+        store_dir = strategy_store_dir(strategy)
+        meta = open_store(settings=dict(IMPUTATION_SETTINGS, strategy=strategy), store_dir=store_dir)
+        # The rows are read again for every store, append_rows fills them in place
+        rows = read_new_rows(args.paths, meta)
+        meta = append_rows(rows, store_dir)
+        print(f'appended {len(rows)} rows to the {strategy} store, store version {store_version(meta)}')
+
+
+if __name__ == '__main__':
+    main()
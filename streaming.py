@@ -0,0 +1,134 @@
+'''
+Out-of-core processing of the station files.
+
+The station files are read one at a time, or in chunks of rows, and only mergeable
+partial aggregates (see rollups) are kept in memory:
+
+    1. the first pass adds up the imputation statistics of every chunk,
+    2. the second pass fills every chunk from them and adds up its daily partials.
+
+The daily, monthly, yearly and station tables are then derived from the daily partials,
+so the peak memory depends on the chunk size and the number of station days, not on the
+number of hourly rows. Missing wind directions are filled like impute_from_stats, which
+breaks ties between sectors by the first one clockwise from north. The time-series fill
+strategies would only see one chunk (the neighbor strategy has no other station to borrow
+from, interpolation stops at the edges of a chunk), so only the strategies of
+STREAMING_STRATEGIES are accepted.
+'''
+import pandas as pd
+
+from backends import frame_daily_partials, frame_imputation_stats
+from imputation import impute_from_stats
+from ingest import read_station_chunks
+from pipeline import add_locations, station_files, COLUMNS, DATA_DIR, IMPUTATION_SETTINGS, LOCATION_FILE
+from rollups import combine, finalize_levels, first_hydrological_year, merge, rollup_partials, LEVEL_KEYS
+from schema import csv_dtypes, station_name, WIND_DIRECTIONS
+
+# The fill strategies giving the same values chunk by chunk as over all the rows
+STREAMING_STRATEGIES = ['mean']
+
+
+def check_strategy(settings):
+    ''' Raise a ValueError when the fill strategy of the settings needs more than one chunk. '''
+    strategy = settings.get('strategy', 'mean')
+    if strategy not in STREAMING_STRATEGIES:
+        raise ValueError(f'the {strategy} strategy needs all the rows of every station, it cannot be '
+                         f'streamed (streaming supports {STREAMING_STRATEGIES})')
+
+
+def iter_chunks(paths, location_file=LOCATION_FILE, chunksize=None):
+    '''
+    A function to read the station files one chunk at a time.
+
+    Args:
+        paths (list): The paths of the station CSV files.
+        location_file (str): The Excel file of the longitude and latitude of the stations.
+        chunksize (int): The number of rows of a chunk, None to read one whole file at a time.
+
+    Returns:
+        generator: The hourly data of every chunk with the station locations, in the compact schema.
+    '''
+    dtypes = csv_dtypes([station_name(path) for path in paths])
+    locsta = pd.read_excel(location_file)
+    for path in paths:
+        for data in read_station_chunks(path, dtypes, COLUMNS, chunksize):
+            yield add_locations(data, location_file, locsta)
+
+
+def stream_imputation_stats(paths, location_file=LOCATION_FILE, settings=IMPUTATION_SETTINGS, chunksize=None,
+                            sink=None, backend='pandas'):
+    '''
+    A function to compute the imputation statistics of the station files chunk by chunk.
+
+    Args:
+        paths (list): The paths of the station CSV files.
+        location_file (str): The Excel file of the longitude and latitude of the stations.
+        settings (dict): The keyword arguments of imputation.impute.
+        chunksize (int): The number of rows of a chunk, None to read one whole file at a time.
+        sink (callable): A function receiving every chunk before imputation, e.g. to scan it, None to drop them.
+        backend (str): The query backend of the statistics of a chunk (see backends).
+
+    Returns:
+        tuple: The imputation statistics (see imputation_stats) and the first hydrological year.
+    '''
+    stats = None
+    first = None
+    for chunk in iter_chunks(paths, location_file, chunksize):
+        delta = frame_imputation_stats(chunk, settings, backend)
+        stats = delta if stats is None else merge(stats, delta, settings['keys'])
+        first = chunk.index.min() if first is None else min(first, chunk.index.min())
+        if sink is not None:
+            sink(chunk)
+    return stats, first_hydrological_year(pd.DatetimeIndex([first]))
+
+
+def stream_daily_partials(paths, stats, location_file=LOCATION_FILE, settings=IMPUTATION_SETTINGS,
+                          chunksize=None, sink=None, raw_sink=None, backend='pandas'):
+    '''
+    A function to fill the station files chunk by chunk and compute their daily partial aggregates.
+
+    Args:
+        paths (list): The paths of the station CSV files.
+        stats (pd.DataFrame): The imputation statistics of all the files.
+        location_file (str): The Excel file of the longitude and latitude of the stations.
+        settings (dict): The keyword arguments of imputation.impute.
+        chunksize (int): The number of rows of a chunk, None to read one whole file at a time.
+        sink (callable): A function receiving every filled chunk, e.g. to store it, None to drop them.
+        raw_sink (callable): A function receiving every chunk before imputation, e.g. to scan it.
+        backend (str): The query backend of the daily partials of a chunk (see backends).
+
+    Returns:
+        pd.DataFrame: One row per station and day with the partial columns.
+    '''
+    daily = []
+    for chunk in iter_chunks(paths, location_file, chunksize):
+        if raw_sink is not None:
+            raw_sink(chunk)
+        impute_from_stats(chunk, stats, **settings)
+        if sink is not None:
+            sink(chunk)
+        daily.append(frame_daily_partials(chunk, backend))
+    # Days split between two chunks are added up
+    return combine(pd.concat(daily, ignore_index=True), LEVEL_KEYS['daily'])
+
+
+def stream_rollup(dire=DATA_DIR, location_file=LOCATION_FILE, settings=IMPUTATION_SETTINGS, chunksize=None,
+                  backend='pandas'):
+    '''
+    A function to compute the tables of every level without loading all the hourly rows.
+
+    Args:
+        dire (str): The directory of the station CSV files.
+        location_file (str): The Excel file of the longitude and latitude of the stations.
+        settings (dict): The keyword arguments of imputation.impute.
+        chunksize (int): The number of rows of a chunk, None to read one whole file at a time.
+        backend (str): The query backend of the statistics and partials of a chunk (see backends).
+
+    Returns:
+        dict: The daily, monthly by year, monthly, yearly and station DataFrames by name.
+    '''
+    check_strategy(settings)
+    paths = station_files(dire)
+    stats, first_year = stream_imputation_stats(paths, location_file, settings, chunksize, backend=backend)
+    daily = stream_daily_partials(paths, stats, location_file, settings, chunksize, backend=backend)
+    return finalize_levels(rollup_partials(daily, first_year), dtypes={'wd': pd.CategoricalDtype(WIND_DIRECTIONS)})
@@ -0,0 +1,148 @@
+'''
+Pollutant surfaces interpolated from the stations onto a grid over Beijing City.
+
+The grid cells inside the district boundaries are found once with shapely.contains_xy
+and the inverse distance weights of every inside cell to every station are computed
+once, so the surface of a time slice is one matrix-vector product and the surfaces of
+every month are one matrix product:
+
+    surface = K @ values / K.sum(axis=1),   K[cell, station] = 1 / distance ** power
+
+Stations without a value in a slice are left out of it, the weights of the others are
+normalized again. Distances are in km on a local equirectangular projection.
+'''
+import io
+
+import numpy as np
+import shapely
+from matplotlib import colormaps
+from PIL import Image, ImageDraw
+
+# The size of a grid cell in degrees (about 1 km)
+GRID_RESOLUTION = 0.01
+
+# The power of the inverse distance weights
+IDW_POWER = 2
+
+_KM_PER_DEGREE = 111.32
+
+
+class IDWGrid:
+    '''
+    An inverse distance weighted interpolation from the stations onto the cells of a grid inside a boundary.
+
+    Args:
+        boundary (gpd.GeoDataFrame): The district boundaries, the grid covers their bounds.
+        lon (np.ndarray): The longitude of every station.
+        lat (np.ndarray): The latitude of every station.
+        resolution (float): The size of a cell in degrees.
+        power (float): The power of the inverse distance weights.
+    '''
+
+    def __init__(self, boundary, lon, lat, resolution=GRID_RESOLUTION, power=IDW_POWER):
+        west, south, east, north = boundary.total_bounds
+        # Cell centers, the rows run from north to south like the rows of an image
+        self.lon = np.arange(west + resolution / 2, east, resolution)
+        self.lat = np.arange(north - resolution / 2, south, -resolution)
+        self.extent = (west, self.lon[-1] + resolution / 2, self.lat[-1] - resolution / 2, north)
+        x, y = np.meshgrid(self.lon, self.lat)
+
+        area = shapely.union_all(boundary.geometry.to_numpy())
+        shapely.prepare(area)
+        self.mask = shapely.contains_xy(area, x, y)
+
+        # Distances of the inside cells to the stations on a projection centered on the grid
+        scale = np.cos(np.radians((south + north) / 2))
+        dx = (x[self.mask][:, None] - np.asarray(lon, dtype='float64')[None, :]) * scale * _KM_PER_DEGREE
+        dy = (y[self.mask][:, None] - np.asarray(lat, dtype='float64')[None, :]) * _KM_PER_DEGREE
+        distances = np.hypot(dx, dy)
+        with np.errstate(divide='ignore'):
+            weights = distances ** -float(power)
+        # A cell on a station takes the value of the station
+        on_station = np.isinf(weights).any(axis=1)
+        weights[on_station] = np.isinf(weights[on_station]).astype('float64')
+        self.weights = weights
+        self.totals = weights.sum(axis=1)
+
+    @property
+    def shape(self):
+        ''' The number of rows (latitudes) and columns (longitudes) of the grid. '''
+        return self.mask.shape
+
+    def surfaces(self, values):
+        '''
+        A function to interpolate several time slices at once.
+
+        Args:
+            values (np.ndarray): The values of the stations, one row per time slice and one column per station.
+
+        Returns:
+            np.ndarray: The value of every inside cell, one row per time slice.
+        '''
+        values = np.atleast_2d(np.asarray(values, dtype='float64'))
+        valid = ~np.isnan(values)
+        sums = np.where(valid, values, 0) @ self.weights.T
+        if valid.all():
+            return sums / self.totals
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return sums / (valid.astype('float64') @ self.weights.T)
+
+    def raster(self, surface):
+        '''
+        A function to put the values of the inside cells back on the grid.
+
+        Args:
+            surface (np.ndarray): The value of every inside cell, e.g. a row of surfaces.
+
+        Returns:
+            np.ndarray: The grid, one row per latitude from north to south, NaN outside the boundary.
+        '''
+        grid = np.full(self.shape, np.nan)
+        grid[self.mask] = surface
+        return grid
+
+    def pixels(self, lon, lat):
+        ''' The rows and columns of the cells of points. '''
+        columns = np.floor((np.asarray(lon) - self.extent[0]) / (self.lon[1] - self.lon[0])).astype(int)
+        rows = np.floor((self.extent[3] - np.asarray(lat)) / (self.lat[0] - self.lat[1])).astype(int)
+        return rows, columns
+
+
+def animation_gif(grid, surfaces, labels, lon, lat, vmin, vmax, scale=3, duration=400, cmap='RdYlGn_r'):
+    '''
+    A function to encode the surfaces of several time slices as an animated GIF.
+    The frames are colored rasters of the grid, so no figure is drawn.
+
+    Args:
+        grid (IDWGrid): The grid of the surfaces.
+        surfaces (np.ndarray): The surfaces returned by grid.surfaces, one row per frame.
+        labels (list): The caption of every frame, e.g. the month.
+        lon (np.ndarray): The longitude of every station, marked on the frames.
+        lat (np.ndarray): The latitude of every station.
+        vmin (float): The value of the lowest color, shared by all frames.
+        vmax (float): The value of the highest color.
+        scale (int): The size of a cell in pixels.
+        duration (int): The time of a frame in milliseconds.
+        cmap (str): The matplotlib colormap.
+
+    Returns:
+        bytes: The GIF image.
+    '''
+    colors = colormaps[cmap]
+    rows, columns = grid.pixels(lon, lat)
+    frames = []
+    for surface, label in zip(surfaces, labels):
+        raster = grid.raster(surface)
+        rgba = colors(np.clip((raster - vmin) / (vmax - vmin), 0, 1), bytes=True)
+        rgba[np.isnan(raster)] = 255
+        image = Image.fromarray(rgba[..., :3]).resize((grid.shape[1] * scale, grid.shape[0] * scale),
+                                                      Image.NEAREST)
+        draw = ImageDraw.Draw(image)
+        for row, column in zip(rows, columns):
+            x, y = (column + 0.5) * scale, (row + 0.5) * scale
+            draw.ellipse((x - 3, y - 3, x + 3, y + 3), fill=(0, 0, 0))
+        draw.text((8, 8), str(label), fill=(0, 0, 0))
+        frames.append(image.convert('P', palette=Image.ADAPTIVE))
+    buffer = io.BytesIO()
+    frames[0].save(buffer, format='GIF', save_all=True, append_images=frames[1:], duration=duration, loop=0)
+    return buffer.getvalue()
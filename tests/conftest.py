@@ -0,0 +1,91 @@
+'''
+Shared fixtures: station files in the PRSA format with a few months of synthetic hours.
+'''
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from imputation import impute  # noqa: E402
+from pipeline import load_air_qi, IMPUTATION_SETTINGS  # noqa: E402
+from schema import WIND_DIRECTIONS  # noqa: E402
+
+LOCATION_FILE = os.path.join(ROOT, 'lonlat_sta.xlsx')
+
+STATIONS = ['Dongsi', 'Huairou', 'Tiantan']
+
+# Across the start of a hydrological year and the end of a calendar year
+FIRST_HOUR = '2016-10-01'
+DAYS = 120
+
+
+def station_frame(station, rng):
+    ''' The hourly rows of a station as in a PRSA_Data_<station>_<period>.csv file. '''
+    hours = pd.date_range(FIRST_HOUR, periods=DAYS * 24, freq='h')
+    n = len(hours)
+    daily = np.sin(2 * np.pi * hours.hour.to_numpy() / 24)
+    data = pd.DataFrame({
+        'No': np.arange(1, n + 1),
+        'year': hours.year,
+        'month': hours.month,
+        'day': hours.day,
+        'hour': hours.hour,
+        'PM2.5': np.round(rng.gamma(2, 40, n), 1),
+        'PM10': np.round(rng.gamma(2, 55, n), 1),
+        'SO2': np.round(rng.gamma(2, 8, n), 1),
+        'NO2': np.round(rng.gamma(4, 12, n), 1),
+        'CO': np.round(rng.gamma(3, 400, n), -1),
+        'O3': np.round(rng.gamma(2, 30, n) + 20 * daily, 1).clip(1),
+        'TEMP': np.round(5 + 6 * daily + rng.normal(0, 2, n), 1),
+        'PRES': np.round(rng.normal(1015, 8, n), 1),
+        'DEWP': np.round(rng.normal(-5, 6, n), 1),
+        'RAIN': np.where(rng.random(n) < 0.05, np.round(rng.gamma(1, 2, n), 1), 0.0),
+        'wd': rng.choice(WIND_DIRECTIONS, n),
+        'WSPM': np.round(rng.gamma(2, 1, n), 1),
+        'station': station,
+    })
+    # Scattered missing values and one gap of two days in every measurement
+    for column in ['PM2.5', 'PM10', 'SO2', 'NO2', 'CO', 'O3', 'TEMP', 'PRES', 'DEWP', 'RAIN', 'wd', 'WSPM']:
+        data.loc[rng.random(n) < 0.03, column] = np.nan
+    start = int(rng.integers(0, n - 48))
+    data.loc[start:start + 47, ['PM2.5', 'PM10', 'wd']] = np.nan
+    return data
+
+
+@pytest.fixture(scope='session')
+def station_dir(tmp_path_factory):
+    ''' The directory of the synthetic station files. '''
+    directory = tmp_path_factory.mktemp('stations')
+    rng = np.random.default_rng(2013)
+    for station in STATIONS:
+        station_frame(station, rng).to_csv(directory / f'PRSA_Data_{station}_20161001-20170128.csv', index=False)
+    return str(directory)
+
+
+@pytest.fixture(scope='session')
+def _raw(station_dir):
+    return load_air_qi(station_dir, LOCATION_FILE)
+
+
+@pytest.fixture(scope='session')
+def _prepared(_raw):
+    data = _raw.copy()
+    impute(data, **IMPUTATION_SETTINGS)
+    return data
+
+
+@pytest.fixture
+def raw(_raw):
+    ''' The hourly rows of the station files before imputation, a copy for every test. '''
+    return _raw.copy()
+
+
+@pytest.fixture
+def prepared(_prepared):
+    ''' The hourly rows after imputation, a copy for every test. '''
+    return _prepared.copy()
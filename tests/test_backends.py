@@ -0,0 +1,34 @@
+import pytest
+
+from backends import arrow_table, available_backends, compare, get_backend, imputation_stats, rollup_levels
+from conftest import LOCATION_FILE
+from pipeline import IMPUTATION_SETTINGS
+from store import build_store, load_levels, read_frame
+
+# Every backend is checked against the pandas one, duckdb only where it is installed
+BACKENDS = ['arrow', pytest.param('duckdb', marks=pytest.mark.skipif(
+    'duckdb' not in available_backends(), reason='duckdb is not installed'))]
+
+
+@pytest.mark.parametrize('name', BACKENDS)
+def test_rollup_levels_match_pandas(prepared, name):
+    table = arrow_table(prepared)
+    compare(rollup_levels(get_backend('pandas'), table), rollup_levels(get_backend(name), table),
+            rtol=1e-5, atol=1e-3)
+
+
+@pytest.mark.parametrize('name', BACKENDS)
+def test_imputation_stats_match_pandas(raw, name):
+    table = arrow_table(raw)
+    compare(imputation_stats(get_backend('pandas'), table, IMPUTATION_SETTINGS),
+            imputation_stats(get_backend(name), table, IMPUTATION_SETTINGS), rtol=1e-5, atol=1e-3)
+
+
+@pytest.mark.parametrize('name', BACKENDS)
+def test_build_store_with_backend(station_dir, tmp_path, name):
+    expected = build_store(station_dir, LOCATION_FILE, store_dir=str(tmp_path / 'pandas'))
+    actual = build_store(station_dir, LOCATION_FILE, store_dir=str(tmp_path / name), backend=name)
+    compare(load_levels(expected, str(tmp_path / 'pandas')), load_levels(actual, str(tmp_path / name)),
+            rtol=1e-5, atol=1e-3)
+    compare(read_frame('imputation', expected['source_key'], str(tmp_path / 'pandas')),
+            read_frame('imputation', actual['source_key'], str(tmp_path / name)), rtol=1e-5, atol=1e-3)
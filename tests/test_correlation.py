@@ -0,0 +1,27 @@
+import numpy as np
+import pandas as pd
+
+from correlation import pearson_columns, pearson_matrix, Correlations
+from schema import MEASUREMENTS
+
+
+def test_pearson_matrix_matches_dataframe_corr(prepared, raw):
+    for data in [prepared, raw]:
+        # The raw rows keep their missing values, the pairs leave them out like DataFrame.corr
+        values = data[MEASUREMENTS].astype('float64')
+        np.testing.assert_allclose(pearson_matrix(values.to_numpy()), values.corr().to_numpy(), rtol=1e-7,
+                                   atol=1e-9)
+
+
+def test_pearson_columns_matches_series_corr(raw):
+    x = raw[['PM2.5', 'PM10', 'O3']].astype('float64')
+    y = raw[['NO2', 'CO', 'TEMP']].astype('float64')
+    expected = [x[a].corr(y[b]) for a, b in zip(x.columns, y.columns)]
+    np.testing.assert_allclose(pearson_columns(x.to_numpy(), y.to_numpy()), expected, rtol=1e-7)
+
+
+def test_target_matches_dataframe_corr(prepared):
+    variables = ['PM2.5', 'PM10', 'SO2', 'NO2', 'CO', 'O3']
+    expected = prepared[variables + ['RAIN']].astype('float64').corr()['RAIN'][variables]
+    actual = Correlations({'hourly': prepared}).target('hourly', 'RAIN', variables)
+    pd.testing.assert_series_equal(actual, expected, check_names=False, rtol=1e-7)
@@ -0,0 +1,41 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from downsample import downsample, lttb, minmax
+
+
+@pytest.fixture
+def series():
+    rng = np.random.default_rng(7)
+    index = pd.date_range('2016-10-01', periods=5000, freq='h')
+    return pd.Series(np.cumsum(rng.normal(size=len(index))), index=index)
+
+
+@pytest.mark.parametrize('points', [3, 4, 100, 1000, 4999])
+def test_lttb_keeps_endpoints_and_count(series, points):
+    kept = lttb(series.index.asi8, series.to_numpy(), points)
+    assert len(kept) == points
+    assert kept[0] == 0 and kept[-1] == len(series) - 1
+    assert (np.diff(kept) > 0).all()
+
+
+@pytest.mark.parametrize('points', [2, 5000, 6000])
+def test_lttb_keeps_every_point_when_it_cannot_reduce(series, points):
+    np.testing.assert_array_equal(lttb(series.index.asi8, series.to_numpy(), points), np.arange(len(series)))
+
+
+@pytest.mark.parametrize('points', [4, 100, 1000])
+def test_minmax_keeps_endpoints_and_extremes(series, points):
+    kept = minmax(series.to_numpy(), points)
+    assert len(kept) <= points
+    assert kept[0] == 0 and kept[-1] == len(series) - 1
+    assert series.to_numpy().argmax() in kept and series.to_numpy().argmin() in kept
+
+
+def test_downsample_drops_missing_values(series):
+    series.iloc[::7] = np.nan
+    points = downsample(series, 200)
+    assert len(points) == 200
+    assert not points.isna().any()
+    assert points.index[0] == series.dropna().index[0] and points.index[-1] == series.dropna().index[-1]
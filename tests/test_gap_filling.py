@@ -0,0 +1,91 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import LOCATION_FILE
+from gap_filling import fill_gaps, interpolate_values, neighbor_values, seasonal_values, SEASONAL_DAYS
+from pipeline import IMPUTATION_SETTINGS
+from store import build_store
+
+VARIABLES = ['PM2.5', 'PM10', 'TEMP']
+
+
+def station_series(raw, station='Dongsi'):
+    ''' The values of VARIABLES of one station, sorted by time. '''
+    rows = raw[raw['station'] == station].sort_index()
+    return rows[VARIABLES].astype('float64')
+
+
+@pytest.mark.parametrize('max_gap', [72, 24])
+def test_interpolate_matches_pandas(raw, max_gap):
+    series = station_series(raw)
+    filled = interpolate_values(series.to_numpy(), series.index.to_numpy(), max_gap=max_gap)
+
+    inside = series.interpolate(method='time', limit_area='inside')
+    expected = inside.copy()
+    for variable in VARIABLES:
+        missing = series[variable].isna()
+        run = (~missing).cumsum()
+        lengths = missing.groupby(run).transform('sum')
+        expected.loc[missing & (lengths > max_gap), variable] = np.nan
+    np.testing.assert_allclose(filled, expected.to_numpy(), rtol=1e-9)
+    # The gaps of two days are left missing by the shorter limit only
+    assert (np.isnan(filled).sum() > inside.isna().sum().sum()) == (max_gap < 48)
+
+
+def test_seasonal_matches_brute_force(raw):
+    series = station_series(raw)
+    times = series.index
+    filled = seasonal_values(series.to_numpy(), times.to_numpy())
+
+    values = series.to_numpy()
+    expected = values.copy()
+    half = pd.Timedelta(hours=SEASONAL_DAYS * 24 // 2)
+    for i, j in zip(*np.nonzero(np.isnan(values))):
+        window = (times.hour == times[i].hour) & (abs(times - times[i]) <= half)
+        expected[i, j] = np.nanmean(values[window, j])
+    np.testing.assert_allclose(filled, expected, rtol=1e-9)
+
+
+def test_neighbor_borrows_from_the_most_correlated_station():
+    nan = np.nan
+    wide = np.array([
+        [1.0, 10.0, 20.0],
+        [nan, 11.0, 21.0],
+        [nan, 12.0, nan],
+        [nan, nan, nan],
+        [5.0, 14.0, 24.0],
+        [6.0, nan, 26.0],
+    ])
+    correlations = np.array([
+        [1.0, 0.5, 0.9],
+        [0.5, 1.0, nan],
+        [0.9, nan, 1.0],
+    ])
+    means = np.array([3.0, 12.0, 22.0])
+    rows = np.arange(len(wide))
+    # Station 2 first, station 1 where station 2 is missing, nothing where both are
+    filled = neighbor_values(wide, rows, 0, correlations, means)
+    np.testing.assert_allclose(filled, [1.0, 21.0 - 19.0, 12.0 - 9.0, nan, 5.0, 6.0])
+    # Never from a station of unknown correlation
+    filled = neighbor_values(wide, rows, 1, correlations, means)
+    np.testing.assert_allclose(filled, [10.0, 11.0, 12.0, nan, 14.0, 6.0 + 9.0])
+
+
+def test_neighbor_fill_keeps_the_observations(raw):
+    filled = fill_gaps(raw.copy(), VARIABLES, 'neighbor')
+    present = raw[VARIABLES].notna().to_numpy()
+    np.testing.assert_array_equal(filled[VARIABLES].to_numpy()[present], raw[VARIABLES].to_numpy()[present])
+    assert filled[VARIABLES].isna().sum().sum() < raw[VARIABLES].isna().sum().sum()
+
+
+@pytest.mark.parametrize('strategy', ['interpolate', 'seasonal', 'neighbor'])
+def test_streaming_build_rejects_strategy(station_dir, tmp_path, strategy):
+    store_dir = tmp_path / 'store'
+    store_dir.mkdir()
+    (store_dir / 'hourly0-old.feather').write_bytes(b'')
+    settings = dict(IMPUTATION_SETTINGS, strategy=strategy)
+    with pytest.raises(ValueError, match='cannot be streamed'):
+        build_store(station_dir, LOCATION_FILE, settings=settings, store_dir=str(store_dir), streaming=True)
+    # The store is left as it was
+    assert [path.name for path in store_dir.iterdir()] == ['hourly0-old.feather']
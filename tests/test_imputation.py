@@ -0,0 +1,53 @@
+import numpy as np
+import pandas as pd
+
+from benchmark import legacy_imputation_mean, legacy_imputation_modus, tied_rows
+from imputation import (impute, impute_from_stats, imputation_stats, imputed, observed, GROUP_KEYS, MEAN_VARIABLES,
+                        MODE_VARIABLES)
+from pipeline import IMPUTATION_SETTINGS
+
+
+def test_impute_matches_legacy_loop(raw):
+    stations = raw['station'].unique()
+    hours = raw['hour'].unique()
+    legacy = raw.copy()
+    legacy_imputation_mean(legacy, MEAN_VARIABLES, stations, hours)
+    legacy_imputation_modus(legacy, MODE_VARIABLES, stations, hours)
+    vectorized = impute(raw.copy())
+
+    np.testing.assert_allclose(vectorized[MEAN_VARIABLES].to_numpy(), legacy[MEAN_VARIABLES].to_numpy(), rtol=1e-5)
+    # statistics.mode breaks ties by the first value seen, the vectorized mode by the lowest code
+    untied = ~tied_rows(raw, GROUP_KEYS)
+    pd.testing.assert_series_equal(vectorized['wd'][untied], legacy['wd'][untied])
+    assert not vectorized[MEAN_VARIABLES + MODE_VARIABLES].isna().any().any()
+
+
+def test_impute_from_stats_matches_impute(raw):
+    stats = imputation_stats(raw, IMPUTATION_SETTINGS['mean_variables'], IMPUTATION_SETTINGS['mode_variables'],
+                             IMPUTATION_SETTINGS['keys'])
+    expected = impute(raw.copy(), **IMPUTATION_SETTINGS)
+    actual = impute_from_stats(raw.copy(), stats, **IMPUTATION_SETTINGS)
+    pd.testing.assert_frame_equal(actual, expected, rtol=1e-5)
+
+
+def test_mode_ties_break_by_lowest_sector(raw):
+    # One (station, hour) group with as many S as N hours and one missing direction
+    group = ((raw['station'] == raw['station'].cat.categories[0]) & (raw['hour'] == 0)).to_numpy()
+    rows = np.flatnonzero(group)
+    wd = raw['wd'].to_numpy().copy()
+    wd[rows] = np.where(np.arange(len(rows)) % 2 == 0, 'S', 'N')
+    wd[rows[-1]] = np.nan
+    if len(rows) % 2 == 0:
+        wd[rows[-2]] = np.nan
+    raw['wd'] = pd.Categorical(wd, dtype=raw['wd'].dtype)
+    missing = rows[-1]
+
+    stats = imputation_stats(raw, MEAN_VARIABLES, MODE_VARIABLES, GROUP_KEYS)
+    for filled in [impute(raw.copy()), impute_from_stats(raw.copy(), stats)]:
+        assert filled['wd'].iloc[missing] == 'N'
+
+
+def test_observed_blanks_the_filled_values(raw, prepared):
+    variables = MEAN_VARIABLES + MODE_VARIABLES
+    pd.testing.assert_frame_equal(observed(prepared)[variables], raw[variables], check_dtype=False)
+    assert imputed(prepared, 'PM2.5').sum() == raw['PM2.5'].isna().sum()
@@ -0,0 +1,93 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from aggregation import aggregate, AGG_SPEC
+from backends import compare
+from conftest import LOCATION_FILE
+from imputation import imputation_stats
+from pipeline import station_files, IMPUTATION_SETTINGS
+from rollups import (daily_partials, finalize_levels, first_hydrological_year, mode_dtypes, rollup,
+                     rollup_partials, update_partials, LEVEL_KEYS)
+from store import append_rows, build_store, load_hourly, load_levels, read_frame, read_new_rows
+
+# In the middle of a day, so the days, months and years at the cut are split between the parts
+CUT = '2016-12-15 12:00'
+
+
+def test_rollup_matches_separate_aggregations(prepared):
+    # The yearly level is left out, the rollups use hydrological years
+    levels = rollup(prepared)
+    keys = dict(LEVEL_KEYS, daily=['station', prepared.index.normalize().rename('date')])
+    columns = [column for column, func in AGG_SPEC.items() if func != 'mode']
+    for name in ['daily', 'monthly_ey', 'monthly', 'station']:
+        expected = aggregate(prepared, keys[name])
+        np.testing.assert_allclose(levels[name][columns].to_numpy(), expected[columns].to_numpy(), rtol=1e-5)
+        pd.testing.assert_series_equal(levels[name]['wd'], expected['wd'])
+
+
+def test_update_partials_matches_rollup(prepared):
+    old = prepared[prepared.index < CUT]
+    new = prepared[prepared.index >= CUT]
+    first_year = first_hydrological_year(prepared.index)
+    levels = rollup_partials(daily_partials(old), first_year)
+    levels = update_partials(levels, daily_partials(new), first_year)
+    compare(rollup(prepared), finalize_levels(levels, dtypes=mode_dtypes(prepared)), rtol=1e-5, atol=1e-3)
+
+
+def split_stations(station_dir, directory, cut=CUT):
+    ''' Write the station files up to the cut into directory and return the path of the hours after it. '''
+    directory.mkdir(exist_ok=True)
+    new = []
+    for path in station_files(station_dir):
+        rows = pd.read_csv(path)
+        hours = pd.to_datetime(rows[['year', 'month', 'day', 'hour']])
+        rows[hours < cut].to_csv(directory / os.path.basename(path), index=False)
+        new.append(rows[hours >= cut])
+    new_path = directory.parent / f'{directory.name}-new.csv'
+    pd.concat(new).to_csv(new_path, index=False)
+    return new_path
+
+
+def test_append_rows_matches_rollup(station_dir, tmp_path):
+    # The station files up to the cut, and the hours after it as new rows
+    old_dir = tmp_path / 'old'
+    new_path = split_stations(station_dir, old_dir)
+
+    store_dir = str(tmp_path / 'store')
+    meta = build_store(str(old_dir), LOCATION_FILE, store_dir=store_dir)
+    rows = read_new_rows([str(new_path)], meta)
+    meta = append_rows(rows, store_dir)
+
+    hourly = load_hourly(meta, store_dir)
+    assert len(hourly) == len(read_new_rows(station_files(station_dir), meta))
+    compare(rollup(hourly), load_levels(meta, store_dir), rtol=1e-5, atol=1e-3)
+
+    # The imputation statistics are the ones of every row before imputation
+    raw = pd.concat([read_new_rows(station_files(str(old_dir)), meta), read_new_rows([str(new_path)], meta)])
+    expected = imputation_stats(raw, IMPUTATION_SETTINGS['mean_variables'], IMPUTATION_SETTINGS['mode_variables'],
+                                IMPUTATION_SETTINGS['keys'])
+    compare(expected, read_frame('imputation', meta['source_key'], store_dir), rtol=1e-5, atol=1e-3)
+
+
+def test_rebuild_keeps_appended_rows(station_dir, tmp_path):
+    old_dir = tmp_path / 'old'
+    new_path = split_stations(station_dir, old_dir)
+    store_dir = str(tmp_path / 'store')
+    meta = build_store(str(old_dir), LOCATION_FILE, store_dir=store_dir)
+    append_rows(read_new_rows([str(new_path)], meta), store_dir)
+
+    # The station files grow past the cut, the hours now in them are not appended twice
+    split_stations(station_dir, old_dir, cut='2017-01-10')
+    meta = build_store(str(old_dir), LOCATION_FILE, store_dir=store_dir)
+    hourly = load_hourly(meta, store_dir)
+    assert meta['segments'] == 2
+    assert not hourly.reset_index().duplicated(['station', 'date_h']).any()
+    assert len(hourly) == len(read_new_rows(station_files(station_dir), meta))
+    compare(rollup(hourly), load_levels(meta, store_dir), rtol=1e-5, atol=1e-3)
+
+    # Once every appended hour is in the station files, nothing is appended again
+    meta = build_store(station_dir, LOCATION_FILE, store_dir=store_dir)
+    assert meta['segments'] == 1
+    assert len(load_hourly(meta, store_dir)) == len(hourly)
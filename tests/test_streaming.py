@@ -0,0 +1,45 @@
+import pandas as pd
+
+import store
+from backends import compare
+from conftest import LOCATION_FILE
+from store import build_store, load_exceedance, load_hourly, load_levels, load_quality, load_wind, read_frame
+
+CHUNKSIZE = 500
+
+
+def sorted_rows(data, keys):
+    ''' The rows sorted by keys, to compare tables built in another order. '''
+    return data.sort_values(keys, kind='stable').reset_index(drop=True)
+
+
+def test_streaming_build_matches_in_memory(station_dir, tmp_path, monkeypatch):
+    # Small segments, so the chunks are coalesced into several of them
+    monkeypatch.setattr(store, 'SEGMENT_ROWS', 2000)
+    expected_dir, actual_dir = str(tmp_path / 'memory'), str(tmp_path / 'streaming')
+    expected = build_store(station_dir, LOCATION_FILE, store_dir=expected_dir)
+    actual = build_store(station_dir, LOCATION_FILE, store_dir=actual_dir, streaming=True, chunksize=CHUNKSIZE)
+
+    hourly = load_hourly(expected, expected_dir)
+    assert 1 < actual['segments'] < len(hourly) / CHUNKSIZE
+    assert actual['first_year'] == expected['first_year']
+    assert actual['last'] == expected['last']
+
+    keys = ['station', 'date_h']
+    pd.testing.assert_frame_equal(sorted_rows(load_hourly(actual, actual_dir).reset_index(), keys),
+                                  sorted_rows(hourly.reset_index(), keys), rtol=1e-5)
+    compare(load_levels(expected, expected_dir), load_levels(actual, actual_dir), rtol=1e-5, atol=1e-3)
+    compare(read_frame('imputation', expected['source_key'], expected_dir),
+            read_frame('imputation', actual['source_key'], actual_dir), rtol=1e-5, atol=1e-3)
+
+    # The outliers of every chunk are scored against the medians of the whole station
+    expected_quality = load_quality(expected, expected_dir)
+    actual_quality = load_quality(actual, actual_dir)
+    for name, table in expected_quality.items():
+        keys = list(table.columns[:3])
+        compare(sorted_rows(table, keys), sorted_rows(actual_quality[name], keys), rtol=1e-5, atol=1e-3)
+
+    cube_keys = ['station', 'month', 'pollutant', 'band']
+    compare(sorted_rows(load_exceedance(expected, expected_dir), cube_keys),
+            sorted_rows(load_exceedance(actual, actual_dir), cube_keys))
+    compare(load_wind(expected, expected_dir), load_wind(actual, actual_dir), rtol=1e-5, atol=1e-3)
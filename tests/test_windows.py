@@ -0,0 +1,33 @@
+import pandas as pd
+import pytest
+
+from aggregation import aggregate, AGG_SPEC
+from backends import compare
+from rollups import daily_partials
+from schema import WIND_DIRECTIONS
+from windows import WindowIndex
+
+
+@pytest.fixture
+def index(prepared):
+    return WindowIndex(daily_partials(prepared), dtypes={'wd': pd.CategoricalDtype(WIND_DIRECTIONS)})
+
+
+@pytest.mark.parametrize('start, end, stations', [
+    ('2016-10-01', '2017-01-28', None),
+    ('2016-11-17', '2016-12-03', ['Huairou', 'Tiantan']),
+    ('2016-12-31', '2016-12-31', ['Dongsi']),
+])
+def test_window_matches_masked_groupby(prepared, index, start, end, stations):
+    selected = (prepared.index >= pd.Timestamp(start)) & (prepared.index < pd.Timestamp(end) + pd.Timedelta(days=1))
+    if stations is not None:
+        selected &= prepared['station'].isin(stations).to_numpy()
+    expected = aggregate(prepared[selected], ['station'], AGG_SPEC)
+    compare(expected, index.window(start, end, stations), rtol=1e-5, atol=1e-3)
+
+
+def test_window_bounds(index):
+    assert index.first_date == pd.Timestamp('2016-10-01')
+    assert index.last_date == pd.Timestamp('2017-01-28')
+    lo, hi = index.bounds('Dongsi', '2016-10-01', '2016-10-10')
+    assert hi - lo == 10
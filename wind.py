@@ -0,0 +1,207 @@
+'''
+Wind roses and wind-sector statistics from mergeable histograms.
+
+One bincount pass over the hourly rows counts the hours of every station, day, wind
+sector (the 16 WIND_DIRECTIONS) and speed band, and adds up the pollutants of every
+station, day and sector:
+
+    ============  ========  ========================================================
+    column        dtype     note
+    ============  ========  ========================================================
+    station       category
+    date          datetime  the day
+    sector        int8      index of the sector in WIND_DIRECTIONS
+    speed_<i>     int16     hours in speed band i of SPEED_LABELS
+    <p>_sum       float64   sum of pollutant p over the hours of the sector
+    <p>_count     int16     hours of the sector with a value of p
+    ============  ========  ========================================================
+
+Only the (station, day, sector) cells with hours are kept. The counts and sums are
+additive, so the partials of chunks are merged with merge_wind, those of appended rows
+with update_wind, and the wind rose or the sector means of any stations and date window
+are sums of partials, not scans of rows.
+'''
+import numpy as np
+import pandas as pd
+
+from schema import WIND_DIRECTIONS
+
+# Upper edges of the speed bands in m/s (Beaufort scale 0 to 4), the last band is open
+SPEED_EDGES = [0.3, 1.6, 3.4, 5.5, 8.0]
+SPEED_LABELS = ['< 0.3', '0.3-1.6', '1.6-3.4', '3.4-5.5', '5.5-8.0', '>= 8.0']
+SPEED_COLUMNS = [f'speed_{i}' for i in range(len(SPEED_LABELS))]
+
+WIND_POLLUTANTS = ['PM2.5', 'PM10', 'SO2', 'NO2', 'CO', 'O3']
+
+CELL_KEYS = ['station', 'date', 'sector']
+
+
+def wind_partials(data, pollutants=WIND_POLLUTANTS):
+    '''
+    A function to compute the wind histograms and the pollutant sums of every station, day and sector.
+
+    Args:
+        data (pd.DataFrame): The hourly data indexed by the hourly datetime, with the wd and WSPM columns.
+        pollutants (list): The pollutants averaged by sector.
+
+    Returns:
+        pd.DataFrame: The cells with hours, see the columns above.
+    '''
+    station_dtype = data['station'].dtype
+    n_sectors = len(WIND_DIRECTIONS)
+    n_speeds = len(SPEED_LABELS)
+    days = data.index.to_numpy(dtype='datetime64[ns]').astype('datetime64[D]')
+    first = days.min() if len(days) else np.datetime64('1970-01-01', 'D')
+    day_ids = (days - first).astype(np.int64)
+    n_days = int(day_ids.max()) + 1 if len(day_ids) else 0
+
+    sectors = data['wd'].cat.codes.to_numpy().astype(np.int64)
+    speeds = data['WSPM'].to_numpy(dtype='float64')
+    cells = (data['station'].cat.codes.to_numpy().astype(np.int64) * n_days + day_ids) * n_sectors + sectors
+    # The cells of the hours with a wind direction numbered from 0, so the bincounts only
+    # cover cells with hours and not every station, day and sector
+    with_sector = sectors >= 0
+    cell_keys, cell_ids = np.unique(cells[with_sector], return_inverse=True)
+    n_cells = len(cell_keys)
+
+    speeds = speeds[with_sector]
+    valid = ~np.isnan(speeds)
+    bands = np.searchsorted(SPEED_EDGES, speeds[valid], side='right')
+    histogram = np.bincount(cell_ids[valid] * n_speeds + bands, minlength=n_cells * n_speeds)
+    histogram = histogram.reshape(n_cells, n_speeds)
+    kept = np.flatnonzero(histogram.sum(axis=1))
+
+    station_day, sector = np.divmod(cell_keys[kept], n_sectors)
+    station, day = np.divmod(station_day, max(n_days, 1))
+    partial = pd.DataFrame({
+        'station': pd.Categorical.from_codes(station, dtype=station_dtype),
+        'date': (first + day.astype('timedelta64[D]')).astype('datetime64[ns]'),
+        'sector': sector.astype('int8'),
+    })
+    for column, counts in zip(SPEED_COLUMNS, histogram[kept].T):
+        partial[column] = counts.astype('int16')
+
+    # The pollutants of the hours with a wind direction, in the same cells
+    for pollutant in pollutants:
+        values = data[pollutant].to_numpy(dtype='float64')[with_sector]
+        present = ~np.isnan(values)
+        sums = np.bincount(cell_ids[present], weights=values[present], minlength=n_cells)
+        counts = np.bincount(cell_ids[present], minlength=n_cells)
+        partial[f'{pollutant}_sum'] = sums[kept]
+        partial[f'{pollutant}_count'] = counts[kept].astype('int16')
+    return partial
+
+
+def _counts(partial):
+    ''' The partial with the hours and value counts back to int16. '''
+    counts = [column for column in partial.columns if column in SPEED_COLUMNS or column.endswith('_count')]
+    return partial.astype({column: 'int16' for column in counts})
+
+
+def merge_wind(partials):
+    ''' A function to add up the wind partials of several chunks of hourly rows. '''
+    partials = [partial for partial in partials if partial is not None]
+    merged = pd.concat(partials, ignore_index=True)
+    merged['station'] = merged['station'].astype(partials[0]['station'].dtype)
+    return _counts(merged.groupby(CELL_KEYS, observed=True, sort=True).sum().reset_index())
+
+
+def _cell_keys(partial):
+    ''' One int64 per cell, in the order of CELL_KEYS. '''
+    days = partial['date'].to_numpy(dtype='datetime64[D]').astype(np.int64)
+    return ((partial['station'].cat.codes.to_numpy().astype(np.int64) << 32) + (days << 5)
+            + partial['sector'].to_numpy().astype(np.int64))
+
+
+def update_wind(partial, delta):
+    '''
+    A function to add the wind partials of new rows into the stored ones.
+    The cells of delta are found in the stored cells by binary search: the existing ones
+    are added to, the new ones inserted in place, so nothing is grouped again.
+
+    Args:
+        partial (pd.DataFrame): The stored partials, sorted by CELL_KEYS.
+        delta (pd.DataFrame): The partials of the new rows, with the station dtype of partial.
+
+    Returns:
+        pd.DataFrame: The merged partials, sorted by CELL_KEYS.
+    '''
+    keys = _cell_keys(partial)
+    delta = delta.iloc[np.argsort(_cell_keys(delta), kind='stable')]
+    new_keys = _cell_keys(delta)
+    positions = np.searchsorted(keys, new_keys)
+    found = keys[np.minimum(positions, len(keys) - 1)] == new_keys if len(keys) else np.zeros(len(delta), bool)
+
+    columns = {}
+    for column in partial.columns:
+        values, added = partial[column], delta[column]
+        if column == 'station':
+            values, added = values.cat.codes, added.cat.codes
+        values, added = values.to_numpy(), added.to_numpy()
+        if column not in CELL_KEYS:
+            values = values.copy()
+            values[positions[found]] += added[found]
+        columns[column] = np.insert(values, positions[~found], added[~found])
+    merged = pd.DataFrame(columns)
+    merged['station'] = pd.Categorical.from_codes(merged['station'], dtype=partial['station'].dtype)
+    return merged
+
+
+def _window(partial, stations=None, start=None, end=None):
+    ''' The sector totals of the partials of some stations between two days, both included. '''
+    selected = np.ones(len(partial), dtype=bool)
+    if stations is not None:
+        selected &= partial['station'].isin(list(stations)).to_numpy()
+    if start is not None:
+        selected &= (partial['date'] >= pd.Timestamp(start)).to_numpy()
+    if end is not None:
+        selected &= (partial['date'] <= pd.Timestamp(end)).to_numpy()
+    values = [column for column in partial.columns if column not in CELL_KEYS]
+    totals = partial.loc[selected, ['sector'] + values].astype({column: 'int64' for column in values
+                                                                if not column.endswith('_sum')})
+    totals = totals.groupby('sector').sum().reindex(range(len(WIND_DIRECTIONS)), fill_value=0)
+    totals.index = pd.CategoricalIndex(WIND_DIRECTIONS, categories=WIND_DIRECTIONS, name='wd')
+    return totals
+
+
+def wind_rose(partial, stations=None, start=None, end=None, normalize=True):
+    '''
+    A function to compute the wind rose of some stations over a date window.
+
+    Args:
+        partial (pd.DataFrame): The partials returned by wind_partials.
+        stations (list): The stations, None for every station.
+        start: The first day, None for the first one.
+        end: The last day, included, None for the last one.
+        normalize (bool): Return the share of the hours instead of the hours.
+
+    Returns:
+        pd.DataFrame: One row per sector and one column per speed band of SPEED_LABELS.
+    '''
+    totals = _window(partial, stations, start, end)[SPEED_COLUMNS]
+    totals.columns = SPEED_LABELS
+    if normalize:
+        total = totals.to_numpy().sum()
+        return totals / total if total else totals.astype('float64')
+    return totals
+
+
+def sector_means(partial, pollutants=WIND_POLLUTANTS, stations=None, start=None, end=None):
+    '''
+    A function to compute the average of pollutants when the wind blows from every sector.
+
+    Args:
+        partial (pd.DataFrame): The partials returned by wind_partials.
+        pollutants (list): The pollutants.
+        stations (list): The stations, None for every station.
+        start: The first day, None for the first one.
+        end: The last day, included, None for the last one.
+
+    Returns:
+        pd.DataFrame: One row per sector and one column per pollutant, NaN for a sector without hours.
+    '''
+    totals = _window(partial, stations, start, end)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return pd.DataFrame({
+            pollutant: totals[f'{pollutant}_sum'] / totals[f'{pollutant}_count'] for pollutant in pollutants
+        })